@@ -1,7 +1,16 @@
 import os
 import json
-from typing import Optional, Dict, Any
-from openai import OpenAI
+import time
+import asyncio
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Set, Tuple
+from ttl_cache import TTLCache, MISSING
+from single_flight import SingleFlight
+import local_extractor
+
+if TYPE_CHECKING:
+    from openai import OpenAI, AsyncOpenAI
 
 
 try:
@@ -10,87 +19,524 @@ except ImportError:
     CONFIG_API_KEY = None
 
 
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if (value and value.isdigit()) else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+SYSTEM_PROMPT = (
+    "Ты помощник по нормализации запросов о ремнях. Верни JSON с полями: "
+    "kind ('vbelt'|'synchronous'|'unknown'), length_mm (число или null), "
+    "profile (строка или null), width_mm (число или null). "
+    "Если длина в дюймах (классика A/B/C/D/E), не конвертируй (оставь число как есть), "
+    "конвертацию сделает приложение. Не добавляй лишних полей."
+)
+
+BATCH_SYSTEM_PROMPT = (
+    SYSTEM_PROMPT + " Тебе придёт JSON-массив текстов пользователей. Верни JSON-объект "
+    "{\"items\": [...]} — по одному объекту с этими полями на каждый текст, в том же порядке."
+)
+
+AI_TIMEOUT = _env_float("AI_TIMEOUT", 15.0)
+AI_MAX_CONCURRENCY = _env_int("AI_MAX_CONCURRENCY", 4)
+AI_CACHE_SIZE = _env_int("AI_CACHE_SIZE", 2048)
+AI_CACHE_TTL = _env_float("AI_CACHE_TTL", 7 * 24 * 3600)
+# Микропакеты: запросы разных пользователей, пришедшие в пределах окна
+# AI_BATCH_WINDOW (сек), уходят в LLM одним запросом, не больше AI_BATCH_MAX текстов
+AI_BATCH_ENABLED = os.getenv("AI_BATCH", "0") not in ("0", "false", "no")
+AI_BATCH_WINDOW = _env_float("AI_BATCH_WINDOW", 0.05)
+AI_BATCH_MAX = _env_int("AI_BATCH_MAX", 8)
+# openai — только LLM; local — только локальная модель (local_extractor, без сети);
+# hybrid — локальная модель, а если она не уверена — LLM
+AI_MODE = os.getenv("AI_MODE", "openai").lower()
+
+# Одинаковые тексты, которые ждут ответа ИИ одновременно, делят один вызов LLM
+_flight = SingleFlight("ai")
+
+
+class _DiskCache:
+    """Персистентный кэш результатов ИИ в локальной SQLite-базе."""
+
+    def __init__(self, path: str, ttl: Optional[float]) -> None:
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_cache ("
+            " key TEXT PRIMARY KEY, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT payload, created_at FROM ai_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return MISSING
+        if self.ttl and row[1] + self.ttl < time.time():
+            return MISSING
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, payload, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+
+_memory_cache = TTLCache(maxsize=AI_CACHE_SIZE, ttl=AI_CACHE_TTL)
+_disk_cache: Optional[_DiskCache] = None
+_disk_cache_checked = False
+_client: Optional["OpenAI"] = None
+_async_client: Optional["AsyncOpenAI"] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_init_lock = threading.Lock()
+
+_stats: Dict[str, float] = {
+    "requests": 0,
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "llm_calls": 0,
+    "llm_errors": 0,
+    "llm_timeouts": 0,
+    "llm_seconds_total": 0.0,
+    "llm_seconds_max": 0.0,
+    "batches": 0,
+    "batched_texts": 0,
+    "local_hits": 0,
+}
+
+
+def normalize_text(user_text: str) -> str:
+    """Ключ кэша: регистр и лишние пробелы не влияют на результат."""
+    return " ".join(user_text.casefold().split())
+
+
+def _get_api_key() -> Optional[str]:
+    # Сначала проверяем config.py, затем переменную окружения
+    return CONFIG_API_KEY or os.getenv("OPENAI_API_KEY")
+
+
+def _get_disk_cache() -> Optional[_DiskCache]:
+    global _disk_cache, _disk_cache_checked
+    if not _disk_cache_checked:
+        with _init_lock:
+            if not _disk_cache_checked:
+                path = os.getenv("AI_CACHE_PATH")
+                _disk_cache = _DiskCache(path, AI_CACHE_TTL) if path else None
+                _disk_cache_checked = True
+    return _disk_cache
+
+
+def _openai():
+    """Модуль openai импортируется при первом обращении к ИИ: вместе с httpx и
+    pydantic это заметная доля времени запуска бота, а ИИ нужен не всегда."""
+    import openai
+    return openai
+
+
+def _get_client(api_key: str) -> "OpenAI":
+    global _client
+    if _client is None:
+        with _init_lock:
+            if _client is None:
+                _client = _openai().OpenAI(api_key=api_key, timeout=AI_TIMEOUT, max_retries=0)
+    return _client
+
+
+def _get_async_client(api_key: str) -> "AsyncOpenAI":
+    global _async_client
+    if _async_client is None:
+        _async_client = _openai().AsyncOpenAI(api_key=api_key, timeout=AI_TIMEOUT, max_retries=0)
+    return _async_client
+
+
+def warm_up() -> None:
+    """Заранее загружает то, что понадобится пути через ИИ: модуль openai
+    (если ключ задан и нет мока) и локальную модель (AI_MODE=local/hybrid).
+    Вызывается в фоновом потоке после запуска бота, если задан AI_PREWARM=1."""
+    if AI_MODE in ("local", "hybrid"):
+        local_extractor.get_extractor()
+    if AI_MODE != "local" and _get_api_key() and not os.getenv("OPENAI_MOCK_JSON"):
+        _openai()
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+def _mock_result() -> Any:
+    """Mock-режим: если задан OPENAI_MOCK_JSON — возвращаем его без запросов к OpenAI."""
+    mock_payload = os.getenv("OPENAI_MOCK_JSON")
+    if not mock_payload:
+        return MISSING
+    try:
+        data = json.loads(mock_payload)
+        return {
+            "kind": data.get("kind", "unknown"),
+            "length_mm": data.get("length_mm"),
+            "profile": (data.get("profile") or None),
+            "width_mm": data.get("width_mm"),
+        }
+    except Exception:
+        return None
+
+
+def _cache_lookup(key: str) -> Any:
+    value = _memory_cache.get(key)
+    if value is not MISSING:
+        _stats["memory_hits"] += 1
+        return value
+    disk = _get_disk_cache()
+    if disk is not None:
+        value = disk.get(key)
+        if value is not MISSING:
+            _stats["disk_hits"] += 1
+            _memory_cache.set(key, value)
+            return value
+    _stats["misses"] += 1
+    return MISSING
+
+
+def _local_result(user_text: str) -> Any:
+    """Ответ локальной модели; MISSING — решать LLM."""
+    if AI_MODE not in ("local", "hybrid"):
+        return MISSING
+    result = local_extractor.extract(user_text)
+    if result is not None:
+        _stats["local_hits"] += 1
+        return result
+    # В режиме local неуверенный ответ — как неразобранный ответ ИИ
+    return None if AI_MODE == "local" else MISSING
+
+
+def _cache_store(key: str, value: Optional[Dict[str, Any]]) -> None:
+    # Ошибки (None) не кэшируем: они могут быть временными
+    if value is None:
+        return
+    _memory_cache.set(key, value)
+    disk = _get_disk_cache()
+    if disk is not None:
+        disk.set(key, value)
+
+
+def _record_latency(seconds: float) -> None:
+    _stats["llm_calls"] += 1
+    _stats["llm_seconds_total"] += seconds
+    if seconds > _stats["llm_seconds_max"]:
+        _stats["llm_seconds_max"] = seconds
+
+
+def _max_tokens() -> int:
+    max_tokens_env = os.getenv("OPENAI_MAX_TOKENS")
+    return int(max_tokens_env) if (max_tokens_env and max_tokens_env.isdigit()) else 128
+
+
+def _request_kwargs(user_text: str) -> Dict[str, Any]:
+    user_prompt = f"Текст пользователя: {user_text} \nОтветь только JSON."
+    return _completion_kwargs(SYSTEM_PROMPT, user_prompt, _max_tokens())
+
+
+def _batch_request_kwargs(user_texts: List[str]) -> Dict[str, Any]:
+    user_prompt = f"Тексты пользователей: {json.dumps(user_texts, ensure_ascii=False)} \nОтветь только JSON."
+    return _completion_kwargs(BATCH_SYSTEM_PROMPT, user_prompt, _max_tokens() * len(user_texts))
+
+
+def _completion_kwargs(system_prompt: str, user_prompt: str, max_tokens: int) -> Dict[str, Any]:
+    model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "temperature": 0,
+        "max_tokens": max_tokens,
+        "response_format": {"type": "json_object"},
+    }
+
+
+def _extract_json(content: str) -> Any:
+    txt = content.strip()
+    if txt.startswith("```"):
+        txt = txt.strip('`')
+    if not txt.startswith('{'):
+        start = txt.find('{')
+        end = txt.rfind('}')
+        if start != -1 and end != -1 and end > start:
+            txt = txt[start:end+1]
+    return json.loads(txt)
+
+
+def _coerce_params(data: Dict[str, Any]) -> Dict[str, Any]:
+    kind = data.get("kind")
+    length_mm = data.get("length_mm")
+    profile = data.get("profile")
+    width_mm = data.get("width_mm")
+    return {
+        "kind": kind if kind in ("vbelt", "synchronous", "unknown") else "unknown",
+        "length_mm": float(length_mm) if isinstance(length_mm, (int, float, str)) and str(length_mm).replace('.', '', 1).isdigit() else None,
+        "profile": str(profile).upper() if profile else None,
+        "width_mm": float(width_mm) if isinstance(width_mm, (int, float, str)) and str(width_mm).replace('.', '', 1).isdigit() else None,
+    }
+
+
+def _parse_response(content: str) -> Optional[Dict[str, Any]]:
+    try:
+        return _coerce_params(_extract_json(content))
+    except Exception:
+        # print(f"[AI] Ошибка при парсинге JSON ответа OpenAI: {type(e).__name__}: {e}")
+        return None
+
+
+def _parse_batch_response(content: str, expected: int) -> List[Optional[Dict[str, Any]]]:
+    try:
+        data = _extract_json(content)
+        items = data.get("items") if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            return [None] * expected
+    except Exception:
+        return [None] * expected
+    results: List[Optional[Dict[str, Any]]] = []
+    for i in range(expected):
+        item = items[i] if i < len(items) else None
+        results.append(_coerce_params(item) if isinstance(item, dict) else None)
+    return results
+
+
+async def _llm_extract_async(api_key: str, user_texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """Один вызов LLM на все тексты (для нескольких — промпт с JSON-массивом)."""
+    if len(user_texts) == 1:
+        kwargs = _request_kwargs(user_texts[0])
+    else:
+        kwargs = _batch_request_kwargs(user_texts)
+    client = _get_async_client(api_key)
+    async with _get_semaphore():
+        started = time.perf_counter()
+        try:
+            resp = await asyncio.wait_for(client.chat.completions.create(**kwargs), timeout=AI_TIMEOUT)
+            content = resp.choices[0].message.content or "{}"
+        except asyncio.TimeoutError:
+            _stats["llm_timeouts"] += 1
+            return [None] * len(user_texts)
+        except Exception:
+            # print(f"[AI] Ошибка при вызове OpenAI: {type(e).__name__}: {e}")
+            _stats["llm_errors"] += 1
+            return [None] * len(user_texts)
+        finally:
+            _record_latency(time.perf_counter() - started)
+    if len(user_texts) == 1:
+        return [_parse_response(content)]
+    return _parse_batch_response(content, len(user_texts))
+
+
+class _BatchDispatcher:
+    """Собирает запросы к LLM от разных пользователей в микропакеты.
+
+    Первый запрос открывает окно ``window`` секунд; всё, что пришло за это
+    время (но не больше ``max_items`` текстов), уходит одним запросом с
+    JSON-массивом, и каждый ожидающий получает свой элемент ответа. Системный
+    промпт при этом передаётся один раз на пакет. Работает в цикле событий
+    бота, без блокировок.
+    """
+
+    def __init__(self, window: float, max_items: int) -> None:
+        self.window = window
+        self.max_items = max(1, max_items)
+        self._pending: List[Tuple[str, "asyncio.Future"]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Ссылки на отправленные пакеты, чтобы задачи не собрал сборщик мусора
+        self._sending: Set["asyncio.Task"] = set()
+
+    async def submit(self, user_text: str) -> Optional[Dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((user_text, future))
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[Tuple[str, "asyncio.Future"]]) -> None:
+        _stats["batches"] += 1
+        _stats["batched_texts"] += len(batch)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(batch)
+        api_key = _get_api_key()
+        try:
+            if api_key:
+                results = await _llm_extract_async(api_key, [text for text, _ in batch])
+        finally:
+            for (_, future), result in zip(batch, results):
+                # Ожидающего могли отменить (таймаут обработчика) — ему ответ не нужен
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": len(self._pending), "sending": len(self._sending)}
+
+
+_dispatcher = _BatchDispatcher(AI_BATCH_WINDOW, AI_BATCH_MAX)
+
+
 def ai_extract_parameters(user_text: str) -> Optional[Dict[str, Any]]:
     """Calls OpenAI to extract normalized parameters from free-form user text.
 
     Returns dict with keys: kind ("vbelt"|"synchronous"|"unknown"), length_mm (float|None),
     profile (str|None), width_mm (float|None). Returns None on failure.
+    Blocking variant for scripts; bot handlers use ``ai_extract_parameters_async``.
     """
-    # Mock-режим: если задан OPENAI_MOCK_JSON — возвращаем его без запросов к OpenAI
-    mock_payload = os.getenv("OPENAI_MOCK_JSON")
-    if mock_payload:
-        try:
-            data = json.loads(mock_payload)
-            return {
-                "kind": data.get("kind", "unknown"),
-                "length_mm": data.get("length_mm"),
-                "profile": (data.get("profile") or None),
-                "width_mm": data.get("width_mm"),
-            }
-        except Exception:
-            return None
+    mocked = _mock_result()
+    if mocked is not MISSING:
+        return mocked
 
-    # Сначала проверяем config.py, затем переменную окружения
-    api_key = CONFIG_API_KEY or os.getenv("OPENAI_API_KEY")
+    _stats["requests"] += 1
+    key = normalize_text(user_text)
+    cached = _cache_lookup(key)
+    if cached is not MISSING:
+        return cached
+    local = _local_result(user_text)
+    if local is not MISSING:
+        return local
+
+    api_key = _get_api_key()
     if not api_key:
         # print("[AI] OpenAI API ключ не найден")
         return None
 
-    # print(f"[AI] Используется OpenAI API ключ (длина: {len(api_key) if api_key else 0})")
-    client = OpenAI(api_key=api_key)
-
-    system_prompt = (
-        "Ты помощник по нормализации запросов о ремнях. Верни JSON с полями: "
-        "kind ('vbelt'|'synchronous'|'unknown'), length_mm (число или null), "
-        "profile (строка или null), width_mm (число или null). "
-        "Если длина в дюймах (классика A/B/C/D/E), не конвертируй (оставь число как есть), "
-        "конвертацию сделает приложение. Не добавляй лишних полей."
-    )
-
-    user_prompt = f"Текст пользователя: {user_text} \nОтветь только JSON."
-
+    started = time.perf_counter()
     try:
-        model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-        max_tokens_env = os.getenv("OPENAI_MAX_TOKENS")
-        max_tokens = int(max_tokens_env) if (max_tokens_env and max_tokens_env.isdigit()) else 128
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0,
-            max_tokens=max_tokens,
-            response_format={"type": "json_object"},
-        )
+        resp = _get_client(api_key).chat.completions.create(**_request_kwargs(user_text))
         content = resp.choices[0].message.content or "{}"
-        # print(f"[AI] OpenAI ответ: {content[:200]}...") 
-    except Exception as e:
-        # print(f"[AI] Ошибка при вызове OpenAI: {type(e).__name__}: {e}")
+    except Exception:
+        _stats["llm_errors"] += 1
         return None
+    finally:
+        _record_latency(time.perf_counter() - started)
 
-    try:
-        txt = content.strip()
-        if txt.startswith("```"):
-            txt = txt.strip('`')
-        if not txt.startswith('{'):
-            start = txt.find('{')
-            end = txt.rfind('}')
-            if start != -1 and end != -1 and end > start:
-                txt = txt[start:end+1]
-        data = json.loads(txt)
-        kind = data.get("kind")
-        length_mm = data.get("length_mm")
-        profile = data.get("profile")
-        width_mm = data.get("width_mm")
-        return {
-            "kind": kind if kind in ("vbelt", "synchronous", "unknown") else "unknown",
-            "length_mm": float(length_mm) if isinstance(length_mm, (int, float, str)) and str(length_mm).replace('.', '', 1).isdigit() else None,
-            "profile": str(profile).upper() if profile else None,
-            "width_mm": float(width_mm) if isinstance(width_mm, (int, float, str)) and str(width_mm).replace('.', '', 1).isdigit() else None,
-        }
-    except Exception as e:
-        # print(f"[AI] Ошибка при парсинге JSON ответа OpenAI: {type(e).__name__}: {e}")
+    result = _parse_response(content)
+    _cache_store(key, result)
+    return result
+
+
+async def ai_extract_parameters_async(user_text: str) -> Optional[Dict[str, Any]]:
+    """Async variant of ``ai_extract_parameters``.
+
+    Uses one shared client, a per-request timeout (``AI_TIMEOUT``), at most
+    ``AI_MAX_CONCURRENCY`` simultaneous LLM calls and the result cache.
+    Concurrent calls with the same normalized text share one LLM request;
+    with ``AI_BATCH`` different texts arriving within ``AI_BATCH_WINDOW``
+    are sent together as one JSON-array request.
+    """
+    mocked = _mock_result()
+    if mocked is not MISSING:
+        return mocked
+
+    key = normalize_text(user_text)
+    return await _flight.run(key, lambda: _extract_async(user_text, key))
+
+
+async def _extract_async(user_text: str, key: str) -> Optional[Dict[str, Any]]:
+    _stats["requests"] += 1
+    if _get_disk_cache() is None:
+        cached = _cache_lookup(key)
+    else:
+        cached = await asyncio.to_thread(_cache_lookup, key)
+    if cached is not MISSING:
+        return cached
+    local = _local_result(user_text)
+    if local is not MISSING:
+        return local
+
+    api_key = _get_api_key()
+    if not api_key:
         return None
 
+    if AI_BATCH_ENABLED:
+        result = await _dispatcher.submit(user_text)
+    else:
+        result = (await _llm_extract_async(api_key, [user_text]))[0]
+
+    if _get_disk_cache() is None:
+        _cache_store(key, result)
+    else:
+        await asyncio.to_thread(_cache_store, key, result)
+    return result
+
+
+def ai_stats() -> Dict[str, Any]:
+    """Счётчики попаданий в кэш и задержек вызовов LLM."""
+    stats: Dict[str, Any] = dict(_stats)
+    hits = stats["memory_hits"] + stats["disk_hits"]
+    lookups = hits + stats["misses"]
+    stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+    calls = stats["llm_calls"]
+    stats["llm_seconds_avg"] = round(stats["llm_seconds_total"] / calls, 6) if calls else 0.0
+    stats["memory_cache"] = _memory_cache.stats()
+    batches = stats["batches"]
+    stats["batch_size_avg"] = round(stats["batched_texts"] / batches, 2) if batches else 0.0
+    stats["batch_enabled"] = AI_BATCH_ENABLED
+    stats["batch_queue"] = _dispatcher.stats()
+    stats["mode"] = AI_MODE
+    stats["local"] = local_extractor.local_stats()
+    return stats
+
+
+async def ai_extract_parameters_batch_async(user_texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """Извлекает параметры для нескольких текстов одним запросом к LLM.
+
+    Тексты, уже лежащие в кэше, в запрос не попадают. Порядок результатов
+    совпадает с порядком ``user_texts``; ``None`` — не удалось разобрать.
+    """
+    if not user_texts:
+        return []
+    mocked = _mock_result()
+    if mocked is not MISSING:
+        return [mocked for _ in user_texts]
+
+    results: List[Any] = [MISSING] * len(user_texts)
+    keys = [normalize_text(t) for t in user_texts]
+    for i, key in enumerate(keys):
+        _stats["requests"] += 1
+        results[i] = _cache_lookup(key) if _get_disk_cache() is None else await asyncio.to_thread(_cache_lookup, key)
+        if results[i] is MISSING:
+            results[i] = _local_result(user_texts[i])
+    pending = [i for i, r in enumerate(results) if r is MISSING]
+    if not pending:
+        return results
+
+    api_key = _get_api_key()
+    if not api_key:
+        return [None if r is MISSING else r for r in results]
 
+    parsed = await _llm_extract_async(api_key, [user_texts[i] for i in pending])
+    for i, value in zip(pending, parsed):
+        results[i] = value
+        if _get_disk_cache() is None:
+            _cache_store(keys[i], value)
+        else:
+            await asyncio.to_thread(_cache_store, keys[i], value)
+    return results
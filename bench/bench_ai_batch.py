@@ -0,0 +1,106 @@
+"""Бенчмарк микропакетов запросов к ИИ на локальном моке OpenAI.
+
+Поднимает bench/mock_openai.py в фоновом потоке и направляет на него
+ai_service (OPENAI_BASE_URL). --users пользователей с разными текстами из
+корпуса (bench/queries.txt) обращаются к ai_extract_parameters_async в
+случайные моменты в пределах --spread секунд — сначала по одному вызову LLM
+на текст, затем с AI_BATCH. Печатает задержку p50/p95/p99, число запросов к
+модели, условные токены промпта и долю совпавших ответов.
+
+Запуск:
+    python bench/bench_ai_batch.py --users 200 --spread 1 --latency 0.4
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Без ответа-заглушки и без файла кэша: каждый текст должен дойти до мока
+os.environ.pop("OPENAI_MOCK_JSON", None)
+os.environ.pop("AI_CACHE_PATH", None)
+os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+import mock_openai  # noqa: E402
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))]
+
+
+async def _run(ai_service, texts: List[str], spread: float, rng: random.Random) -> Dict[str, Any]:
+    async def one(text: str, delay: float):
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        result = await ai_service.ai_extract_parameters_async(text)
+        return time.perf_counter() - started, result
+
+    started = time.perf_counter()
+    done = await asyncio.gather(*(one(t, rng.uniform(0, spread)) for t in texts))
+    return {
+        "elapsed": time.perf_counter() - started,
+        "latencies": [d[0] for d in done],
+        "results": [d[1] for d in done],
+    }
+
+
+async def compare(ai_service, server: mock_openai.MockOpenAI, texts: List[str], spread: float, seed: int) -> None:
+    baseline: Optional[List[Any]] = None
+    for enabled in (False, True):
+        ai_service.AI_BATCH_ENABLED = enabled
+        ai_service._memory_cache.clear()
+        server.reset()
+        run = await _run(ai_service, texts, spread, random.Random(seed))
+        stats = server.stats()
+        lat = run["latencies"]
+        label = f"пакеты ≤{ai_service.AI_BATCH_MAX}, окно {ai_service.AI_BATCH_WINDOW * 1000:.0f} мс" if enabled else "по одному"
+        print(f"{label}:")
+        print(f"  задержка p50={_percentile(lat, 50) * 1000:8.1f} мс  p95={_percentile(lat, 95) * 1000:8.1f} мс"
+              f"  p99={_percentile(lat, 99) * 1000:8.1f} мс   всего {run['elapsed']:.2f} с")
+        print(f"  запросов к модели: {stats['requests']}, текстов: {stats['texts']},"
+              f" токенов промпта: {stats['prompt_tokens']}, ошибок: {stats['errors']}")
+        if baseline is None:
+            baseline = run["results"]
+        else:
+            same = sum(a == b for a, b in zip(baseline, run["results"]))
+            print(f"  ответы совпадают с одиночными: {same}/{len(texts)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "bench", "queries.txt"))
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=1.0, help="интервал, в котором приходят запросы, сек")
+    parser.add_argument("--latency", type=float, default=0.4, help="задержка мока на запрос, сек")
+    parser.add_argument("--per-item", type=float, default=0.02, help="добавка мока за текст пакета, сек")
+    parser.add_argument("--random-seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = mock_openai.start(latency=args.latency, per_item=args.per_item)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+    import ai_service
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+    rng = random.Random(args.random_seed)
+    # Разные тексты: одинаковые и так объединяет SingleFlight
+    texts = [corpus[i % len(corpus)] + ("" if i < len(corpus) else f" {i // len(corpus)} шт") for i in range(args.users)]
+    rng.shuffle(texts)
+    print(f"Пользователей: {len(texts)} за {args.spread} с, мок: {args.latency * 1000:.0f} мс + {args.per_item * 1000:.0f} мс/текст,"
+          f" AI_MAX_CONCURRENCY={ai_service.AI_MAX_CONCURRENCY}")
+    try:
+        asyncio.run(compare(ai_service, server, texts, args.spread, args.random_seed))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Бенчмарк нечёткого поиска (pg_trgm) на локальном PostgreSQL.
+
+Берёт случайные артикулы и названия из products, вносит в них опечатки
+(пропуск, повтор, перестановка и замена символа) и ищет через search_fuzzy.
+Печатает задержку p50/p95/p99 с триграммными индексами и без них (seq scan),
+долю запросов, в ответе на которые есть исходный артикул или бренд, и среднее
+число строк в ответе.
+
+Используйте отдельную БД — --seed очищает products (см. bench_pipeline.py):
+    python bench/bench_fuzzy.py --seed 100000
+    python bench/bench_fuzzy.py --queries 1000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from typing import List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db_connection import get_connection  # noqa: E402
+from search_service import (  # noqa: E402
+    build_fuzzy_sql,
+    search_fuzzy,
+    FUZZY_SETTINGS_SQL,
+    FUZZY_ARTICLE_THRESHOLD,
+    FUZZY_NAME_THRESHOLD,
+    FUZZY_LIMIT,
+)
+from bench_pipeline import seed_catalog, _percentile  # noqa: E402
+
+
+def _typo(text: str, rng: random.Random) -> str:
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.choice(["drop", "repeat", "swap", "replace"])
+    if kind == "drop":
+        return text[:i] + text[i + 1:]
+    if kind == "repeat":
+        return text[:i] + text[i] + text[i:]
+    if kind == "swap":
+        return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+    return text[:i] + rng.choice("0123456789ABCDEFHKMPTX") + text[i + 1:]
+
+
+def load_queries(count: int, rng: random.Random) -> List[Tuple[str, str, str]]:
+    """(запрос с опечаткой, "article" или "name", исходный артикул или слово названия)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT article, name FROM products"
+                " WHERE quantity_free > 0 AND article IS NOT NULL"
+                " ORDER BY random() LIMIT %s",
+                (count,),
+            )
+            rows = cur.fetchall()
+    queries = []
+    for row in rows:
+        # Самое длинное слово из букв — обычно бренд («Contitech», «Megadyne»)
+        words = [w for w in row["name"].split() if w.isalpha() and len(w) >= 5]
+        if words and rng.random() < 0.5:
+            word = max(words, key=len)
+            queries.append((_typo(word, rng), "name", word))
+        else:
+            queries.append((_typo(row["article"], rng), "article", row["article"]))
+    return queries
+
+
+def _is_hit(cur, rows, field: str, original: str) -> bool:
+    if not rows:
+        return False
+    if field == "name":
+        return any(original.upper() in row["name"].upper() for row in rows)
+    cur.execute("SELECT 1 FROM products WHERE id = ANY(%s) AND article = %s LIMIT 1", ([row["id"] for row in rows], original))
+    return cur.fetchone() is not None
+
+
+def _measure_sql(queries: List[Tuple[str, str, str]], *, indexed: bool) -> List[float]:
+    latencies = []
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(FUZZY_SETTINGS_SQL, (str(FUZZY_ARTICLE_THRESHOLD), str(FUZZY_NAME_THRESHOLD)))
+            if not indexed:
+                cur.execute("SET LOCAL enable_bitmapscan = off")
+                cur.execute("SET LOCAL enable_indexscan = off")
+            for text, _, _ in queries:
+                built = build_fuzzy_sql(text, limit=FUZZY_LIMIT)
+                if built is None:
+                    continue
+                started = time.perf_counter()
+                cur.execute(*built)
+                cur.fetchall()
+                latencies.append(time.perf_counter() - started)
+        conn.rollback()
+    return latencies
+
+
+def _print_latency(label: str, latencies: List[float]) -> None:
+    print(f"{label:<14} p50={_percentile(latencies, 50) * 1000:8.3f} мс"
+          f"  p95={_percentile(latencies, 95) * 1000:8.3f} мс"
+          f"  p99={_percentile(latencies, 99) * 1000:8.3f} мс")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, metavar="ROWS", help="заполнить products синтетическим каталогом")
+    parser.add_argument("--force", action="store_true", help="разрешить --seed на таблице с чужими данными")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--no-seqscan-run", action="store_true", help="не замерять поиск без индексов (долго на больших каталогах)")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_catalog(args.seed, args.random_seed, args.force)
+    rng = random.Random(args.random_seed)
+    queries = load_queries(args.queries, rng)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) AS n FROM products")
+            catalog_size = cur.fetchone()["n"]
+    print(f"Каталог: {catalog_size} строк, запросов с опечатками: {len(queries)}")
+    print(f"Пороги: артикул {FUZZY_ARTICLE_THRESHOLD}, название {FUZZY_NAME_THRESHOLD}, лимит {FUZZY_LIMIT}")
+
+    _print_latency("индексы trgm", _measure_sql(queries, indexed=True))
+    if not args.no_seqscan_run:
+        _print_latency("без индексов", _measure_sql(queries, indexed=False))
+
+    hits = 0
+    returned = 0
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for text, field, original in queries:
+                rows = search_fuzzy(text)
+                returned += len(rows)
+                hits += _is_hit(cur, rows, field, original)
+    print(f"Исходный артикул/бренд в ответе: {hits / len(queries) * 100 if queries else 0:.1f}%"
+          f"   строк в ответе в среднем: {returned / len(queries) if queries else 0:.1f}")
+
+
+if __name__ == "__main__":
+    main()
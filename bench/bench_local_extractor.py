@@ -0,0 +1,215 @@
+"""Бенчмарк локального извлекателя параметров (local_extractor.py).
+
+Обучает модель на 80% пар «запрос → параметры» и проверяет на остальных 20%:
+точность по полям и целиком, долю запросов, на которых модель уверена, и
+точность на них при разных порогах, задержку одного разбора. Для сравнения
+те же запросы проходят через ai_extract_parameters_async с мок-ответом
+OPENAI_MOCK_JSON (как в bench_pipeline.py) — это нижняя граница задержки пути
+через ИИ без сети и точность постоянного ответа.
+
+Пары берутся из кэша ИИ (--cache), JSONL (--jsonl) или генерируются по
+шаблонам с известной разметкой (--synthetic, по умолчанию, если другого нет):
+    python bench/bench_local_extractor.py --synthetic 4000
+    python bench/bench_local_extractor.py --cache ai_cache.sqlite --save local_model.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MOCK_ANSWER = {"kind": "synchronous", "profile": "8M", "length_mm": 800}
+os.environ.setdefault("OPENAI_MOCK_JSON", json.dumps(MOCK_ANSWER))
+
+from local_extractor import LocalExtractor, load_cache_pairs, load_jsonl_pairs  # noqa: E402
+
+Pair = Tuple[str, Dict[str, Any]]
+
+SYNC_PROFILES = ["8M", "14M", "5M", "3M", "S8M", "T5", "T10", "AT10", "XL", "L", "H"]
+VBELT_PROFILES = ["SPA", "SPB", "SPZ", "SPC", "XPA", "XPZ", "3V", "5V", "8V", "Z"]
+INCH_PROFILES = ["A", "B", "C", "D"]
+HOMOGLYPH_SWAP = str.maketrans({"A": "А", "B": "В", "C": "С", "H": "Н", "M": "М", "P": "Р", "T": "Т", "X": "Х"})
+
+SYNC_TEMPLATES = [
+    "зубчатый ремень {p} {l}",
+    "нужен ремень {p}{l}",
+    "ремень {p} длина {l} ширина {w}",
+    "подскажите есть ли {p} {l} шириной {w} мм",
+    "{l}-{p} зубчатый, ширина {w}",
+    "ремень зубчатый {p}, длина {l} мм",
+    "нужно 2 шт ремня {p} {l}",
+    "{p} {l} {w}мм в наличии?",
+    "ремень ГРМ {p} на {l}",
+]
+VBELT_TEMPLATES = [
+    "клиновой ремень {p} {l}",
+    "ремень {p}-{l}",
+    "нужен клиновой {p} длиной {l} мм",
+    "есть {p}{l}? нужно 4 штуки",
+    "ремень {p} {l} в наличии",
+    "клиновый {p} длина {lcm} см",
+]
+INCH_TEMPLATES = [
+    "ремень {p}{n}",
+    "клиновой ремень {p} {n}",
+    "ремень {p}-{n} дюймов",
+    "нужен {p} {n} 2 шт",
+]
+UNKNOWN_TEXTS = [
+    "здравствуйте, как оформить заказ",
+    "сколько стоит доставка в 2 города",
+    "какой у вас график работы",
+    "позовите менеджера",
+    "ремень для стиральной машины",
+    "нужен ремень для станка 3 штуки",
+    "спасибо, всё понятно",
+    "можно оплатить по счёту?",
+    "пришлите прайс на 2024 год",
+    "что есть из поликлиновых?",
+]
+
+
+def _mangle(text: str, rng: random.Random) -> str:
+    if rng.random() < 0.15:
+        text = text.translate(HOMOGLYPH_SWAP)
+    if rng.random() < 0.3:
+        text = text.upper()
+    return text
+
+
+def synthetic_pairs(count: int, rng: random.Random) -> List[Pair]:
+    """Запросы по шаблонам с известными параметрами в формате ответа ИИ."""
+    pairs: List[Pair] = []
+    while len(pairs) < count:
+        roll = rng.random()
+        if roll < 0.45:
+            p = rng.choice(SYNC_PROFILES)
+            length = rng.randrange(200, 3000, 5)
+            width = rng.choice([10, 15, 20, 25, 30, 40, 50, 55, 85])
+            template = rng.choice(SYNC_TEMPLATES)
+            text = template.format(p=_mangle(p, rng), l=length, w=width)
+            params = {"kind": "synchronous", "profile": p, "length_mm": float(length),
+                      "width_mm": float(width) if "{w}" in template else None}
+        elif roll < 0.75:
+            p = rng.choice(VBELT_PROFILES)
+            length = rng.randrange(500, 5000, 10)
+            template = rng.choice(VBELT_TEMPLATES)
+            text = template.format(p=_mangle(p, rng), l=length, lcm=length // 10)
+            params = {"kind": "vbelt", "profile": p, "length_mm": float(length), "width_mm": None}
+        elif roll < 0.9:
+            # В ответе ИИ длина классики A/B/C/D — в дюймах, как написал пользователь
+            p = rng.choice(INCH_PROFILES)
+            n = rng.randrange(20, 200)
+            text = rng.choice(INCH_TEMPLATES).format(p=_mangle(p, rng), n=n)
+            params = {"kind": "vbelt", "profile": p, "length_mm": float(n), "width_mm": None}
+        else:
+            text = rng.choice(UNKNOWN_TEXTS)
+            params = {"kind": "unknown", "profile": None, "length_mm": None, "width_mm": None}
+        pairs.append((text, params))
+    return pairs
+
+
+def _expected(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "kind": params.get("kind"),
+        "length_mm": float(params["length_mm"]) if params.get("length_mm") is not None else None,
+        "profile": str(params.get("profile") or "").upper() or None,
+        "width_mm": float(params["width_mm"]) if params.get("width_mm") is not None else None,
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))]
+
+
+def _accuracy(predicted: List[Dict[str, Any]], expected: List[Dict[str, Any]]) -> str:
+    n = len(expected) or 1
+    fields = ["kind", "profile", "length_mm", "width_mm"]
+    parts = [f"{f} {sum(p.get(f) == e[f] for p, e in zip(predicted, expected)) / n * 100:5.1f}%" for f in fields]
+    exact = sum(p == e for p, e in zip(predicted, expected)) / n * 100
+    return "  ".join(parts) + f"  целиком {exact:5.1f}%"
+
+
+def _print_latency(label: str, latencies: List[float]) -> None:
+    print(f"{label:<20} p50={_percentile(latencies, 50) * 1e6:9.1f} мкс"
+          f"  p99={_percentile(latencies, 99) * 1e6:9.1f} мкс")
+
+
+async def _mock_baseline(texts: List[str]) -> Tuple[List[Dict[str, Any]], List[float]]:
+    from ai_service import ai_extract_parameters_async
+    results, latencies = [], []
+    for text in texts:
+        started = time.perf_counter()
+        results.append(await ai_extract_parameters_async(text))
+        latencies.append(time.perf_counter() - started)
+    return results, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cache", action="append", default=[], help="SQLite-кэш ИИ (AI_CACHE_PATH)")
+    parser.add_argument("--jsonl", action="append", default=[], help="JSONL с парами text/params")
+    parser.add_argument("--synthetic", type=int, default=0, help="сгенерировать столько пар по шаблонам")
+    parser.add_argument("--epochs", type=int, default=6)
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--save", help="сохранить обученную модель (LOCAL_MODEL_PATH)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.random_seed)
+    pairs: List[Pair] = []
+    for path in args.cache:
+        pairs.extend(load_cache_pairs(path))
+    for path in args.jsonl:
+        pairs.extend(load_jsonl_pairs(path))
+    if args.synthetic or not pairs:
+        pairs.extend(synthetic_pairs(args.synthetic or 4000, rng))
+    rng.shuffle(pairs)
+    split = int(len(pairs) * 0.8)
+    train, test = pairs[:split], pairs[split:]
+    print(f"Пар: {len(pairs)} (обучение {len(train)}, проверка {len(test)})")
+
+    started = time.perf_counter()
+    extractor = LocalExtractor.train(train, epochs=args.epochs, seed=args.random_seed)
+    print(f"Обучение: {time.perf_counter() - started:.1f} с")
+    if args.save:
+        extractor.save(args.save)
+        print(f"Модель сохранена: {args.save} ({os.path.getsize(args.save) / 1024:.0f} КБ)")
+
+    texts = [text for text, _ in test]
+    expected = [_expected(params) for _, params in test]
+    predicted, confidences, latencies = [], [], []
+    for text in texts:
+        t0 = time.perf_counter()
+        result, confidence = extractor.predict(text)
+        latencies.append(time.perf_counter() - t0)
+        predicted.append(result)
+        confidences.append(confidence)
+
+    print("\nЛокальная модель, все запросы:")
+    print("  " + _accuracy(predicted, expected))
+    print("  порог  уверена   точность на уверенных")
+    for threshold in (0.5, 0.7, 0.8, 0.9, 0.95):
+        kept = [i for i, c in enumerate(confidences) if c >= threshold]
+        exact = sum(predicted[i] == expected[i] for i in kept) / len(kept) * 100 if kept else 0.0
+        print(f"  {threshold:5.2f}  {len(kept) / len(texts) * 100:6.1f}%   {exact:6.1f}%")
+
+    mock_results, mock_latencies = asyncio.run(_mock_baseline(texts))
+    print(f"\nOPENAI_MOCK_JSON (постоянный ответ {os.environ['OPENAI_MOCK_JSON']}):")
+    print("  " + _accuracy([r or {} for r in mock_results], expected))
+
+    print()
+    _print_latency("локальная модель", latencies)
+    _print_latency("OPENAI_MOCK_JSON", mock_latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Микро-бенчмарк разбора запросов.
+
+Прогоняет корпус реальных запросов (bench/queries.txt) через parse_query и
+extract_token и печатает пропускную способность. Кэш разбора сбрасывается
+перед «холодным» прогоном, чтобы измерить саму грамматику.
+
+Запуск:
+    python bench/bench_parser.py [--rounds 200] [--corpus bench/queries.txt]
+"""
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import query_parser  # noqa: E402
+from query_parser import parse_query, extract_token  # noqa: E402
+
+
+def _run(label: str, fn, corpus, rounds: int, before_round=None) -> None:
+    total = 0
+    elapsed = 0.0
+    for _ in range(rounds):
+        if before_round:
+            before_round()
+        started = time.perf_counter()
+        for q in corpus:
+            fn(q)
+        elapsed += time.perf_counter() - started
+        total += len(corpus)
+    print(f"{label:<28} {total / elapsed:>12,.0f} запросов/с   {elapsed / total * 1e6:8.2f} мкс/запрос")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "bench", "queries.txt"))
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [line.strip() for line in f if line.strip()]
+    print(f"Корпус: {len(corpus)} запросов × {args.rounds} повторов")
+
+    _run("parse_query (без кэша)", parse_query, corpus, args.rounds, query_parser._parse_normalized.cache_clear)
+    _run("parse_query (с кэшем)", parse_query, corpus, args.rounds)
+    _run("extract_token", extract_token, corpus, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
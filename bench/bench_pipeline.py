@@ -0,0 +1,267 @@
+"""Нагрузочный бенчмарк конвейера поиска: handle_text_message от начала до конца.
+
+N одновременных чатов отправляют запросы в handle_text_message с фейковыми
+Update/Context (без Telegram), поиск идёт в локальный PostgreSQL, путь через ИИ
+использует мок OPENAI_MOCK_JSON. Печатает p50/p95/p99 и пропускную способность
+и сохраняет результат в JSON, чтобы сравнивать прогоны.
+
+Используйте отдельную БД — --seed очищает products:
+    $env:PGDATABASE = "beltimpex_bench"
+    psql -U postgres -h localhost -c "CREATE DATABASE beltimpex_bench WITH ENCODING 'UTF8';"
+    psql -U postgres -h localhost -d beltimpex_bench -f db\\schema.sql
+
+Запуск:
+    python bench/bench_pipeline.py --seed 50000 --chats 50 --messages 40
+    python bench/bench_pipeline.py --chats 50 --no-index --output bench/results/db.json
+    python bench/bench_pipeline.py --chats 50 --compare bench/results/db.json
+"""
+import io
+import os
+import sys
+import csv
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+from datetime import datetime
+from typing import Dict, List, Any
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Ответ ИИ без запросов к OpenAI (см. ai_service._mock_result)
+os.environ.setdefault("OPENAI_MOCK_JSON", json.dumps({"kind": "synchronous", "profile": "8M", "length_mm": 800}))
+# Чаты бенчмарка шлют запросы без пауз — лимит на чат исказил бы замер
+os.environ.setdefault("RATE_LIMIT", "0")
+
+import catalog_index  # noqa: E402
+import search_service  # noqa: E402
+from ai_service import ai_stats  # noqa: E402
+from db_connection import get_connection, get_pool, pool_stats  # noqa: E402
+from search_cache import cache_stats, search_cache  # noqa: E402
+from handlers.auth import WAITING_SEARCH  # noqa: E402
+from handlers.text import handle_text_message  # noqa: E402
+
+
+SYNC_PROFILES = ["8M", "14M", "5M", "3M", "T5", "T10", "L", "H", "XL"]
+VBELT_PROFILES = ["A", "B", "C", "SPA", "SPB", "SPZ", "SPC", "3V", "5V", "8V", "3VX", "5VX"]
+BRANDS = ["CFNR", "Contitech", "CXP Contitech", "Megadyne", "FNR", "PIX Muscle XS3", "PIX Xset", "Megadyne Extra", "Optibelt"]
+WIDTHS = [None, None, 20, 30, 40, 55, 85]
+
+# Свободный текст: регулярные выражения не находят код → путь через ИИ (мок)
+FREE_TEXT = ["нужен зубчатый ремень восьмёрка", "ремень для станка, подскажите", "что есть из поликлиновых?"]
+
+
+def _synthetic_rows(size: int, rng: random.Random):
+    for i in range(size):
+        brand = rng.choice(BRANDS)
+        quantity = rng.choice([0, rng.randint(1, 2000)])
+        price = round(rng.uniform(10, 10000), 2)
+        if rng.random() < 0.6:
+            profile = rng.choice(SYNC_PROFILES)
+            length = rng.randrange(200, 5000, 5)
+            width = rng.choice(WIDTHS)
+            article = f"{length}{profile}" + (f"={width}" if width else "")
+            name = f"{length} {profile} {width or ''} {brand} #{i}"
+            yield [name, article, "synchronous", "Москва", quantity, price, width, length, profile, "bench"]
+        else:
+            profile = rng.choice(VBELT_PROFILES)
+            length = rng.randrange(600, 5000, 1)
+            article = f"{profile}{length}"
+            name = f"{profile} {length} {brand} #{i}"
+            yield [name, article, "vbelt", "Струнино", quantity, price, None, length, profile, "bench"]
+
+
+def seed_catalog(size: int, seed: int, force: bool) -> None:
+    """Заменяет products синтетическим каталогом из ``size`` строк."""
+    columns = "name, article, category, warehouse, quantity_free, price_per_unit, width, length, profile, data_source"
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) AS n FROM products WHERE data_source IS DISTINCT FROM 'bench'")
+            foreign = cur.fetchone()["n"]
+            if foreign and not force:
+                raise SystemExit(
+                    f"В products есть {foreign} небенчмарковых строк. Используйте отдельную БД "
+                    "или --force, чтобы всё равно очистить таблицу."
+                )
+            cur.execute("TRUNCATE TABLE products RESTART IDENTITY")
+            rng = random.Random(seed)
+            rows = _synthetic_rows(size, rng)
+            while True:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                count = 0
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+                    if count >= 10000:
+                        break
+                if not count:
+                    break
+                buffer.seek(0)
+                cur.copy_expert(f"COPY products ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cur.execute("ANALYZE products")
+    print(f"Синтетический каталог: {size} строк")
+
+
+def load_queries(corpus_path: str, ai_share: float, rng: random.Random) -> List[str]:
+    """Корпус реальных запросов + артикулы из каталога + доля свободного текста для пути через ИИ."""
+    with open(corpus_path, encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT DISTINCT article FROM products WHERE article IS NOT NULL LIMIT 2000")
+            queries.extend(row["article"] for row in cur.fetchall())
+    ai_count = int(len(queries) * ai_share / max(1e-9, 1 - ai_share)) if ai_share > 0 else 0
+    queries.extend(rng.choice(FREE_TEXT) for _ in range(ai_count))
+    return queries
+
+
+class FakeMessage:
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.replies: List[str] = []
+
+    async def reply_text(self, text: str, **kwargs) -> None:
+        self.replies.append(text)
+
+
+class FakeChat:
+    def __init__(self, chat_id: int) -> None:
+        self.id = chat_id
+        self.type = "private"
+
+
+class FakeUpdate:
+    def __init__(self, chat_id: int, text: str) -> None:
+        self.message = FakeMessage(text)
+        self.effective_chat = FakeChat(chat_id)
+        self.effective_user = FakeChat(chat_id)
+        self.callback_query = None
+
+
+class FakeContext:
+    def __init__(self) -> None:
+        # Клиент уже прошёл верификацию и выбрал «Поиск товаров»
+        self.user_data: Dict[str, Any] = {"verified": True, "state": WAITING_SEARCH}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_load(queries: List[str], chats: int, messages: int, rng: random.Random) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+
+    async def chat(chat_id: int) -> None:
+        nonlocal errors
+        context = FakeContext()
+        for _ in range(messages):
+            update = FakeUpdate(chat_id, rng.choice(queries))
+            started = time.perf_counter()
+            try:
+                await handle_text_message(update, context)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(chat(chat_id) for chat_id in range(1, chats + 1)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 3),
+            "p95": round(_percentile(latencies, 95) * 1000, 3),
+            "p99": round(_percentile(latencies, 99) * 1000, 3),
+            "max": round(max(latencies) * 1000, 3) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        },
+    }
+
+
+def _print_comparison(current: Dict[str, Any], previous_path: str) -> None:
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"Сравнение с {previous_path}:")
+    for key in ("p50", "p95", "p99"):
+        old, new = previous["result"]["latency_ms"][key], current["result"]["latency_ms"][key]
+        change = (new - old) / old * 100 if old else 0.0
+        print(f"  {key}: {old:.3f} → {new:.3f} мс ({change:+.1f}%)")
+    old, new = previous["result"]["throughput_rps"], current["result"]["throughput_rps"]
+    print(f"  запр/с: {old:.1f} → {new:.1f} ({(new - old) / old * 100 if old else 0.0:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, metavar="ROWS", help="заполнить products синтетическим каталогом")
+    parser.add_argument("--force", action="store_true", help="разрешить --seed на таблице с чужими данными")
+    parser.add_argument("--chats", type=int, default=20, help="одновременных чатов")
+    parser.add_argument("--messages", type=int, default=50, help="запросов на чат")
+    parser.add_argument("--ai-share", type=float, default=0.05, help="доля запросов свободным текстом (путь ИИ)")
+    parser.add_argument("--no-index", action="store_true", help="искать в БД, без индекса каталога в памяти")
+    parser.add_argument("--no-cache", action="store_true", help="отключить кэш результатов поиска")
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "bench", "queries.txt"))
+    parser.add_argument("--output", help="файл JSON (по умолчанию bench/results/pipeline-<время>.json)")
+    parser.add_argument("--compare", help="JSON предыдущего прогона для сравнения")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_catalog(args.seed, args.random_seed, args.force)
+    get_pool().warm()
+    if not args.no_index:
+        catalog_index.warm_up()
+    search_service.SEARCH_CACHE_ENABLED = not args.no_cache
+    search_cache.invalidate()
+
+    rng = random.Random(args.random_seed)
+    queries = load_queries(args.corpus, args.ai_share, rng)
+    print(f"Запросов в наборе: {len(queries)}, чатов: {args.chats} × {args.messages}")
+    result = asyncio.run(run_load(queries, args.chats, args.messages, rng))
+
+    latency = result["latency_ms"]
+    print(f"p50={latency['p50']:.3f} мс  p95={latency['p95']:.3f} мс  p99={latency['p99']:.3f} мс  "
+          f"{result['throughput_rps']:.1f} запр/с  ошибок: {result['errors']}")
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT count(*) AS n FROM products")
+            catalog_size = cur.fetchone()["n"]
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": {
+            "catalog_size": catalog_size,
+            "chats": args.chats,
+            "messages": args.messages,
+            "ai_share": args.ai_share,
+            "index": not args.no_index,
+            "search_cache": not args.no_cache,
+            "random_seed": args.random_seed,
+        },
+        "result": result,
+        "stats": {"pool": pool_stats(), "search_cache": cache_stats(), "ai": ai_stats()},
+    }
+    output = args.output or os.path.join(ROOT, "bench", "results", f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"Результат: {output}")
+    if args.compare:
+        _print_comparison(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
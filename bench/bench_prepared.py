@@ -0,0 +1,105 @@
+"""Бенчмарк подготовленных запросов поиска на локальном PostgreSQL.
+
+Для запросов из корпуса (bench/queries.txt) строит SQL так же, как бот, и
+сравнивает обычное выполнение с PREPARE/EXECUTE (prepared_statements.py):
+  * время планирования из EXPLAIN ANALYZE (Planning Time) на запрос;
+  * полное время поиска через search_service._search_db.
+
+Запуск (после применения db/schema.sql и загрузки каталога):
+    python bench/bench_prepared.py [--rounds 20]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import List, Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import psycopg2  # noqa: E402
+from psycopg2.extras import RealDictCursor  # noqa: E402
+
+import prepared_statements  # noqa: E402
+import search_service  # noqa: E402
+from db_connection import get_dsn, get_pool  # noqa: E402
+from search_service import build_request, build_search_sql, PAGE_SIZE, SearchRequest  # noqa: E402
+
+
+def _plan(cur, sql: str, params) -> Dict[str, float]:
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    payload = cur.fetchone()["QUERY PLAN"]
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    return {"planning": payload[0]["Planning Time"], "execution": payload[0]["Execution Time"]}
+
+
+def _summary(label: str, values: List[float]) -> None:
+    ordered = sorted(values)
+    if not ordered:
+        return
+    p95 = ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+    print(f"{label:<28} среднее {sum(ordered) / len(ordered):8.4f} мс   p95 {p95:8.4f} мс")
+
+
+def measure_planning(reqs: List[SearchRequest], rounds: int) -> None:
+    """Planning Time обычного запроса и EXECUTE подготовленного на отдельном соединении."""
+    plain: List[float] = []
+    prepared: List[float] = []
+    conn = psycopg2.connect(get_dsn(), cursor_factory=RealDictCursor)
+    try:
+        with conn.cursor() as cur:
+            ready = set()
+            for _ in range(rounds):
+                for req in reqs:
+                    sql, params = build_search_sql(req, limit=PAGE_SIZE + 1)
+                    plain.append(_plan(cur, sql, params)["planning"])
+                    stmt = prepared_statements.statement(sql)
+                    if stmt.name not in ready:
+                        cur.execute(f"PREPARE {stmt.name} AS {stmt.server_sql}")
+                        ready.add(stmt.name)
+                    args = ", ".join(["%s"] * stmt.params)
+                    prepared.append(_plan(cur, f"EXECUTE {stmt.name} ({args})", params)["planning"])
+        conn.rollback()
+    finally:
+        conn.close()
+    _summary("планирование, обычный SQL", plain)
+    _summary("планирование, EXECUTE", prepared)
+    if plain and prepared:
+        saved = sum(plain) / len(plain) - sum(prepared) / len(prepared)
+        print(f"Экономия на планировании: {saved:.4f} мс на запрос")
+
+
+def measure_search(reqs: List[SearchRequest], rounds: int) -> None:
+    """Полное время _search_db (без индекса каталога и кэша) с подготовкой и без."""
+    for enabled in (False, True):
+        prepared_statements.PREPARE_ENABLED = enabled
+        latencies: List[float] = []
+        for _ in range(rounds):
+            for req in reqs:
+                started = time.perf_counter()
+                search_service._search_db(req, 0, PAGE_SIZE)
+                latencies.append((time.perf_counter() - started) * 1000)
+        _summary("поиск, " + ("PREPARE/EXECUTE" if enabled else "обычный SQL"), latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "bench", "queries.txt"))
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        reqs = [build_request(line.strip()) for line in f if line.strip()]
+    reqs = [r for r in reqs if r.kind != "unknown"]
+    shapes = {search_service._shape_name(r) for r in reqs}
+    print(f"Запросов: {len(reqs)} × {args.rounds}, форм SQL: {len(shapes)}")
+
+    get_pool().warm()
+    measure_planning(reqs, args.rounds)
+    measure_search(reqs, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Бенчмарк кэша результатов поиска на локальном PostgreSQL.
+
+Прогоняет запросы из корпуса (bench/queries.txt) с распределением, близким
+к реальному (частые артикулы повторяются чаще), через search() без кэша и с
+кэшем, и печатает среднюю задержку, долю попаданий и оценку памяти кэша.
+Индекс каталога в памяти не загружается — измеряется путь через БД.
+
+Запуск (после применения db/schema.sql и db/seed.sql):
+    python bench/bench_search_cache.py [--requests 5000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import search_service  # noqa: E402
+from search_service import build_request, search  # noqa: E402
+from search_cache import search_cache, cache_stats  # noqa: E402
+
+
+def _run(label: str, reqs) -> None:
+    started = time.perf_counter()
+    for req in reqs:
+        search(req)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<12} {elapsed / len(reqs) * 1000:8.3f} мс/запрос   {len(reqs) / elapsed:10,.0f} запросов/с")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "bench", "queries.txt"))
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [line.strip() for line in f if line.strip()]
+    random.seed(args.seed)
+    # Закон Ципфа: k-й по популярности запрос встречается в ~1/k раз реже первого
+    weights = [1.0 / (k + 1) for k in range(len(corpus))]
+    reqs = [build_request(q) for q in random.choices(corpus, weights=weights, k=args.requests)]
+
+    search_service.SEARCH_CACHE_ENABLED = False
+    _run("без кэша", reqs)
+    search_service.SEARCH_CACHE_ENABLED = True
+    search_cache.invalidate()
+    _run("с кэшем", reqs)
+
+    stats = cache_stats()
+    print(
+        f"Попадания: {stats['hit_rate']:.1%} ({stats['hits']}/{stats['hits'] + stats['misses']}), "
+        f"записей: {stats['size']}, память: {stats['memory_bytes'] / 1024:.1f} КиБ"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Время холодного запуска бота: от старта процесса до первого ответа.
+
+Поднимает фейковый Bot API (bench/fake_telegram.py) в этом процессе, ставит в
+очередь getUpdates команду /start и запускает ``python bot.py`` в режиме
+polling против него (TELEGRAM_BASE_URL) — по разу на каждый режим
+STARTUP_WARM. Замеряет время от запуска процесса до ответа на /start, затем
+проводит чат через верификацию и меню и замеряет первый ответ на поисковый
+запрос. Печатает строку отчёта бота («Запуск: ...») с фазами и шагами прогрева
+и сравнивает время с бюджетом STARTUP_BUDGET.
+
+Боту нужны config.py (BOT_TOKEN — любой) и доступная БД; время запуска
+интерпретатора в отчёт бота не входит, а в замер этого скрипта — входит.
+
+Запуск:
+    python bench/bench_startup.py
+    python bench/bench_startup.py --modes background --runs 3 --query "SPA 2000"
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from fake_telegram import FakeTelegram, _message_update, _callback_update  # noqa: E402
+
+
+async def _reply(fake: FakeTelegram, chat_id: int, update: Dict, timeout: float) -> Optional[str]:
+    future = fake.expect_reply(chat_id)
+    fake.push(update)
+    return await asyncio.wait_for(future, timeout)
+
+
+async def _read_report(stream: asyncio.StreamReader, lines: List[str]) -> None:
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        text = line.decode("utf-8", "replace").rstrip()
+        if text.startswith("Запуск:"):
+            lines.append(text)
+
+
+async def _run_once(fake: FakeTelegram, args, mode: str) -> Dict[str, Any]:
+    chat_id = random.randint(10 ** 8, 10 ** 9)
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BASE_URL": f"http://{args.host}:{args.port}/bot",
+        "BOT_MODE": "polling",
+        "STARTUP_WARM": mode,
+        "STARTUP_BUDGET": str(args.budget),
+        "RATE_LIMIT": "0",
+        "PYTHONUNBUFFERED": "1",
+    })
+    fake.updates.clear()
+    future = fake.expect_reply(chat_id)
+    fake.push(_message_update(chat_id, "/start"))
+
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, "bot.py"),
+        cwd=ROOT, env=env, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+    )
+    reports: List[str] = []
+    reader = asyncio.create_task(_read_report(process.stdout, reports))
+    result: Dict[str, Any] = {"mode": mode}
+    try:
+        await asyncio.wait_for(future, args.timeout)
+        result["first_reply_s"] = time.perf_counter() - started
+        # Верификация и переход в режим поиска, затем первый поисковый запрос
+        for update in (
+            _message_update(chat_id, f"+7999{chat_id % 10 ** 7:07d}"),
+            _callback_update(chat_id, "verified_yes"),
+            _callback_update(chat_id, "menu_request"),
+        ):
+            await _reply(fake, chat_id, update, args.timeout)
+        search_started = time.perf_counter()
+        await _reply(fake, chat_id, _message_update(chat_id, args.query), args.timeout)
+        result["first_search_s"] = time.perf_counter() - started
+        result["search_s"] = time.perf_counter() - search_started
+    except asyncio.TimeoutError:
+        result["timeout"] = True
+    finally:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), 10)
+        except asyncio.TimeoutError:
+            process.kill()
+        await reader
+    result["report"] = reports[-1] if reports else ""
+    return result
+
+
+async def main_async(args) -> None:
+    import uvicorn  # pyright: ignore[reportMissingImports]
+
+    fake = FakeTelegram()
+    server = uvicorn.Server(uvicorn.Config(fake, host=args.host, port=args.port, lifespan="off", log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    await asyncio.sleep(0.5)
+
+    results: List[Dict[str, Any]] = []
+    for mode in args.modes:
+        for _ in range(args.runs):
+            results.append(await _run_once(fake, args, mode))
+    server.should_exit = True
+    await serve_task
+
+    print(f"Бюджет: {args.budget:g} с")
+    print(f"{'режим':<11} {'/start, с':>10} {'поиск, с':>10} {'запрос, с':>10}")
+    for r in results:
+        if r.get("timeout"):
+            print(f"{r['mode']:<11} нет ответа за {args.timeout:g} с")
+        else:
+            verdict = "в пределах" if r["first_reply_s"] <= args.budget else "ПРЕВЫШЕН"
+            print(f"{r['mode']:<11} {r['first_reply_s']:10.3f} {r['first_search_s']:10.3f} {r['search_s']:10.3f}  {verdict}")
+        if r["report"]:
+            print(f"  {r['report']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--modes", nargs="+", choices=("blocking", "background"), default=["blocking", "background"])
+    parser.add_argument("--runs", type=int, default=1, help="запусков на режим")
+    parser.add_argument("--query", default="SPA2000", help="первый поисковый запрос")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET", "3")))
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
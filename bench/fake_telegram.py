@@ -0,0 +1,250 @@
+"""Локальный фейковый Bot API Telegram для нагрузочных тестов webhook-режима.
+
+Сервер отвечает на вызовы бота (getMe, setWebhook, sendMessage, editMessageText,
+answerCallbackQuery, ...) и фиксирует ответы по chat_id; для режима polling
+отдаёт в getUpdates апдейты, поставленные через ``push`` (bench_startup.py). Драйвер создаёт N чатов,
+проводит каждый через /start и верификацию, затем шлёт поисковые запросы
+в webhook бота и измеряет время до ответа бота.
+
+1. Запустите фейковый Telegram:
+       python bench/fake_telegram.py --port 8081
+2. Запустите бота против него в режиме webhook:
+       $env:TELEGRAM_BASE_URL = "http://127.0.0.1:8081/bot"
+       $env:BOT_MODE = "webhook"; $env:WEBHOOK_URL = "http://127.0.0.1:8080"
+       $env:RATE_LIMIT = "0"   # иначе часть запросов без пауз останется без ответа
+       python bot.py
+3. Запустите нагрузку (можно сразу с шагом 1 через --drive):
+       python bench/fake_telegram.py --port 8081 --drive --chats 50 --messages 20
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_message_ids = itertools.count(1)
+_update_ids = itertools.count(1)
+_BOT_USER = {"id": 1, "is_bot": True, "first_name": "Search bot", "username": "search_bot"}
+
+
+def _user(chat_id: int) -> Dict:
+    return {"id": chat_id, "is_bot": False, "first_name": f"Load {chat_id}"}
+
+
+def _chat(chat_id: int) -> Dict:
+    return {"id": chat_id, "type": "private", "first_name": f"Load {chat_id}"}
+
+
+def _message(chat_id: int, text: Optional[str], *, from_bot: bool = False) -> Dict:
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": _chat(chat_id),
+        "from": _BOT_USER if from_bot else _user(chat_id),
+    }
+    if text is not None:
+        message["text"] = text
+    return message
+
+
+class FakeTelegram:
+    """ASGI-приложение: ``/bot<token>/<method>``."""
+
+    def __init__(self) -> None:
+        self.waiters: Dict[int, asyncio.Future] = {}
+        self.calls: Dict[str, int] = {}
+        self.updates: List[Dict] = []
+        self._has_updates = asyncio.Event()
+
+    def expect_reply(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[chat_id] = future
+        return future
+
+    def push(self, update: Dict) -> None:
+        """Апдейт для следующего getUpdates (режим polling)."""
+        self.updates.append(update)
+        self._has_updates.set()
+
+    async def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = int(params.get("offset") or 0)
+        # Подтверждённые ботом апдейты (update_id < offset) больше не отдаются
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return list(self.updates)
+
+    def _notify(self, chat_id: Optional[int], text: Optional[str]) -> None:
+        future = self.waiters.pop(chat_id, None) if chat_id is not None else None
+        if future is not None and not future.done():
+            future.set_result(text)
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        method = scope["path"].rsplit("/", 1)[-1]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = _decode(body, dict(scope.get("headers") or []))
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        else:
+            result = self._handle(method, params)
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    def _handle(self, method: str, params: Dict):
+        chat_id = params.get("chat_id")
+        chat_id = int(chat_id) if chat_id is not None else None
+        if method == "getMe":
+            return _BOT_USER
+        if method == "sendMessage":
+            self._notify(chat_id, params.get("text"))
+            return _message(chat_id, params.get("text"), from_bot=True)
+        if method == "editMessageText":
+            self._notify(chat_id, params.get("text"))
+            return _message(chat_id, params.get("text"), from_bot=True) if chat_id is not None else True
+        # setWebhook, deleteWebhook, answerCallbackQuery, setMyCommands, ...
+        return True
+
+
+def _decode(body: bytes, headers: Dict[bytes, bytes]) -> Dict:
+    if not body:
+        return {}
+    content_type = headers.get(b"content-type", b"")
+    if content_type.startswith(b"application/json"):
+        return json.loads(body)
+    from urllib.parse import parse_qsl
+
+    return dict(parse_qsl(body.decode()))
+
+
+def _message_update(chat_id: int, text: str) -> Dict:
+    return {"update_id": next(_update_ids), "message": _message(chat_id, text)}
+
+
+def _callback_update(chat_id: int, data: str) -> Dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": _message(chat_id, "menu", from_bot=True),
+        },
+    }
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _drive(fake: FakeTelegram, args) -> None:
+    import httpx  # зависимость python-telegram-bot
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = [line.strip() for line in f if line.strip()]
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    latencies: List[float] = []
+    timeouts = 0
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+
+        async def post(chat_id: int, update: Dict) -> Optional[str]:
+            future = fake.expect_reply(chat_id)
+            await client.post(args.webhook, json=update, headers=headers)
+            return await asyncio.wait_for(future, args.timeout)
+
+        async def chat_session(chat_id: int) -> None:
+            nonlocal timeouts
+            # Верификация и переход в режим поиска
+            for update in (
+                _message_update(chat_id, "/start"),
+                _message_update(chat_id, f"+7999{chat_id:07d}"),
+                _callback_update(chat_id, "verified_yes"),
+                _callback_update(chat_id, "menu_request"),
+            ):
+                try:
+                    await post(chat_id, update)
+                except asyncio.TimeoutError:
+                    timeouts += 1
+            for _ in range(args.messages):
+                started = time.perf_counter()
+                try:
+                    await post(chat_id, _message_update(chat_id, random.choice(corpus)))
+                    latencies.append(time.perf_counter() - started)
+                except asyncio.TimeoutError:
+                    timeouts += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(chat_session(100000 + i) for i in range(args.chats)))
+        elapsed = time.perf_counter() - started
+
+    print(f"Чатов: {args.chats}, запросов: {len(latencies)}, таймаутов: {timeouts}, время: {elapsed:.2f} с")
+    if latencies:
+        print(
+            f"p50={_percentile(latencies, 50) * 1000:.1f} мс  p95={_percentile(latencies, 95) * 1000:.1f} мс  "
+            f"p99={_percentile(latencies, 99) * 1000:.1f} мс  пропускная способность={len(latencies) / elapsed:.1f} запр/с"
+        )
+
+
+async def main_async(args) -> None:
+    import uvicorn  # pyright: ignore[reportMissingImports]
+
+    fake = FakeTelegram()
+    server = uvicorn.Server(uvicorn.Config(fake, host=args.host, port=args.port, lifespan="off", log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    print(f"Фейковый Telegram: http://{args.host}:{args.port}/bot")
+    if args.drive:
+        await asyncio.sleep(0.5)
+        await _drive(fake, args)
+        server.should_exit = True
+    await serve_task
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--drive", action="store_true", help="запустить нагрузку на webhook бота")
+    parser.add_argument("--webhook", default="http://127.0.0.1:8080/telegram")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET"))
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "bench", "queries.txt"))
+    args = parser.parse_args()
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Локальный мок OpenAI Chat Completions для проверки пути через ИИ.
+
+Отвечает на POST .../chat/completions так же, как ai_service ожидает от
+модели: на «Текст пользователя: ...» — JSON-объект с kind/profile/length_mm/
+width_mm, на «Тексты пользователей: [...]» — {"items": [...]} в том же
+порядке. Параметры берутся из правил query_normalizer, неразобранное —
+kind "unknown". Задержка ответа имитирует модель: --latency на запрос плюс
+--per-item на каждый текст пакета. GET /stats — счётчики запросов, текстов и
+условных токенов промпта (символы / 4).
+
+Запуск:
+    python bench/mock_openai.py --port 8089 --latency 0.4
+    $env:OPENAI_BASE_URL = "http://127.0.0.1:8089/v1"; $env:OPENAI_API_KEY = "mock"
+    $env:AI_BATCH = "1"; python bot.py
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from query_normalizer import normalize_query  # noqa: E402
+
+SINGLE_PREFIX = "Текст пользователя: "
+BATCH_PREFIX = "Тексты пользователей: "
+
+
+def _answer(text: str) -> Dict[str, Any]:
+    params = normalize_query(text)
+    if params is None:
+        return {"kind": "unknown", "length_mm": None, "profile": None, "width_mm": None}
+    return params
+
+
+def _user_texts(prompt: str) -> Optional[List[str]]:
+    """Тексты из пользовательского сообщения; None — одиночный запрос не распознан."""
+    if prompt.startswith(BATCH_PREFIX):
+        texts, _ = json.JSONDecoder().raw_decode(prompt[len(BATCH_PREFIX):])
+        return [str(t) for t in texts]
+    if prompt.startswith(SINGLE_PREFIX):
+        return [prompt[len(SINGLE_PREFIX):].split(" \nОтветь", 1)[0]]
+    return None
+
+
+class MockOpenAI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float, per_item: float) -> None:
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.per_item = per_item
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "batch_requests": 0, "texts": 0, "prompt_tokens": 0, "errors": 0}
+
+    def count(self, **deltas: int) -> None:
+        with self.lock:
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+    def reset(self) -> None:
+        with self.lock:
+            for name in self.counters:
+                self.counters[name] = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MockOpenAI
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # print(f"[mock] {format % args}")
+        pass
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            messages = request["messages"]
+            texts = _user_texts(messages[-1]["content"])
+            if texts is None:
+                raise ValueError("unexpected prompt")
+        except Exception as e:
+            self.server.count(errors=1)
+            self._send_json(400, {"error": {"message": f"{type(e).__name__}: {e}"}})
+            return
+
+        time.sleep(self.server.latency + self.server.per_item * len(texts))
+        batch = messages[-1]["content"].startswith(BATCH_PREFIX)
+        answers = [_answer(t) for t in texts]
+        content = json.dumps({"items": answers} if batch else answers[0], ensure_ascii=False)
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        completion_tokens = len(content) // 4
+        self.server.count(requests=1, batch_requests=int(batch), texts=len(texts), prompt_tokens=prompt_tokens)
+        self._send_json(200, {
+            "id": f"chatcmpl-mock-{time.monotonic_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+def start(host: str = "127.0.0.1", port: int = 0, latency: float = 0.4, per_item: float = 0.02) -> MockOpenAI:
+    """Запускает мок в фоновом потоке; port=0 — любой свободный (server.server_port)."""
+    server = MockOpenAI((host, port), latency, per_item)
+    threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.4, help="задержка ответа на запрос, сек")
+    parser.add_argument("--per-item", type=float, default=0.02, help="добавка за каждый текст пакета, сек")
+    args = parser.parse_args()
+
+    server = MockOpenAI((args.host, args.port), args.latency, args.per_item)
+    print(f"Мок OpenAI: http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
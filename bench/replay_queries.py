@@ -0,0 +1,198 @@
+"""Воспроизведение журнала запросов (query_log.py) через конвейер поиска.
+
+Читает записанный ботом журнал (QUERY_LOG_PATH: JSONL, в том числе
+ротированные части, или SQLite) и отправляет тексты в handle_text_message с
+фейковыми Update/Context (как bench_pipeline.py) в том же темпе, что в
+журнале, ускоренном в --speed раз (0 — без пауз, не больше --concurrency
+одновременно). Для каждого запроса сравнивает путь разрешения и число строк с
+записанными: расхождения — регрессии разбора или каталога. Печатает задержку
+записанную и текущую, пропускную способность и среднее время этапов.
+
+Ответы ИИ по умолчанию берутся из журнала (--ai logged), чтобы прогон был
+воспроизводимым и не ходил в OpenAI; --ai mock — ответ OPENAI_MOCK_JSON,
+--ai live — настоящий вызов (OPENAI_API_KEY / OPENAI_BASE_URL).
+
+Запуск:
+    python bench/replay_queries.py logs/queries.jsonl.2 logs/queries.jsonl.1 logs/queries.jsonl
+    python bench/replay_queries.py logs/queries.jsonl --speed 10 --diff 20
+    python bench/replay_queries.py logs/queries.sqlite --speed 0 --concurrency 200 --output bench/results/replay.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Темп задаёт журнал; лимит на чат отбросил бы запросы, которые бот тогда обработал
+os.environ.setdefault("RATE_LIMIT", "0")
+
+# Записи, которые бот не обрабатывал (лимит запросов), не воспроизводятся
+SKIPPED_PATHS = ("duplicate", "limited", "limited_silent")
+
+_slot: "ContextVar[int]" = ContextVar("replay_slot", default=-1)
+
+
+def load_entries(paths: List[str], limit: Optional[int]) -> List[Dict[str, Any]]:
+    from query_log import read_entries
+    entries = [e for path in paths for e in read_entries(path)]
+    entries.sort(key=lambda e: e["ts"])
+    return entries[:limit] if limit else entries
+
+
+def _use_logged_ai(entries: List[Dict[str, Any]]) -> None:
+    """Подменяет вызов ИИ в обработчике ответами из журнала."""
+    import handlers.text
+    from ai_service import normalize_text
+
+    answers = {normalize_text(e["text"]): e["params"] for e in entries if e.get("path") in ("ai", "no_result") and "params" in e}
+
+    async def logged_answer(user_text: str) -> Optional[Dict[str, Any]]:
+        return answers.get(normalize_text(user_text))
+
+    handlers.text.ai_extract_parameters_async = logged_answer
+
+
+async def replay(entries: List[Dict[str, Any]], speed: float, concurrency: int) -> Dict[str, Any]:
+    import query_log
+    from bench_pipeline import FakeUpdate, FakeContext
+    from handlers.text import handle_text_message
+
+    captured: List[Optional[Dict[str, Any]]] = [None] * len(entries)
+    errors = 0
+
+    def sink(entry: Dict[str, Any]) -> None:
+        slot = _slot.get()
+        if slot >= 0:
+            captured[slot] = entry
+
+    query_log.set_sink(sink)
+    contexts: Dict[Any, FakeContext] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    first_ts = entries[0]["ts"] if entries else 0.0
+
+    async def one(index: int, entry: Dict[str, Any]) -> None:
+        nonlocal errors
+        if speed > 0:
+            await asyncio.sleep(max(0.0, start + (entry["ts"] - first_ts) / speed - loop.time()))
+        context = contexts.setdefault(entry.get("chat"), FakeContext())
+        async with semaphore:
+            _slot.set(index)
+            try:
+                await handle_text_message(FakeUpdate(entry.get("chat") or 0, entry["text"]), context)
+            except Exception:
+                # print(f"[REPLAY] {entry['text']!r}: {type(e).__name__}: {e}")
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i, e) for i, e in enumerate(entries)))
+    elapsed = time.perf_counter() - started
+    query_log.set_sink(None)
+    return {"captured": captured, "errors": errors, "elapsed": elapsed}
+
+
+def _latency(values: List[float]) -> Dict[str, float]:
+    from bench_pipeline import _percentile
+    return {
+        "p50": round(_percentile(values, 50), 3),
+        "p95": round(_percentile(values, 95), 3),
+        "p99": round(_percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+    }
+
+
+def _stage_means(entries: List[Optional[Dict[str, Any]]]) -> Dict[str, float]:
+    totals: Counter = Counter()
+    for e in entries:
+        if e:
+            totals.update(e.get("stages") or {})
+    n = sum(1 for e in entries if e) or 1
+    return {stage: round(total / n, 3) for stage, total in sorted(totals.items())}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="файлы журнала (JSONL, части после ротации, SQLite)")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение относительно записанного темпа; 0 — без пауз")
+    parser.add_argument("--concurrency", type=int, default=64, help="максимум одновременных запросов")
+    parser.add_argument("--limit", type=int, help="воспроизвести только первые N записей")
+    parser.add_argument("--ai", choices=("logged", "mock", "live"), default="logged", help="откуда брать ответы ИИ")
+    parser.add_argument("--no-index", action="store_true", help="искать в БД, без индекса каталога в памяти")
+    parser.add_argument("--diff", type=int, default=10, help="сколько расхождений показать")
+    parser.add_argument("--output", help="сохранить сводку в JSON")
+    args = parser.parse_args()
+
+    if args.ai == "live":
+        # Пустое значение: bench_pipeline не подставит мок, ai_service пойдёт в OpenAI
+        os.environ["OPENAI_MOCK_JSON"] = ""
+    import catalog_index
+    from db_connection import get_pool
+
+    entries = load_entries(args.logs, args.limit)
+    skipped = sum(1 for e in entries if e.get("path") in SKIPPED_PATHS)
+    entries = [e for e in entries if e.get("path") not in SKIPPED_PATHS]
+    if not entries:
+        parser.error("в журнале нет записей для воспроизведения")
+    span_s = entries[-1]["ts"] - entries[0]["ts"]
+    print(f"Записей: {len(entries)} (пропущено из-за лимита: {skipped}), интервал в журнале {span_s:.1f} с, "
+          f"скорость ×{args.speed if args.speed > 0 else '∞'}")
+
+    get_pool().warm()
+    if not args.no_index:
+        catalog_index.warm_up()
+    if args.ai == "logged":
+        _use_logged_ai(entries)
+    result = asyncio.run(replay(entries, args.speed, args.concurrency))
+    captured = result["captured"]
+
+    logged_ms = [e["total_ms"] for e in entries if "total_ms" in e]
+    replay_ms = [c["total_ms"] for c in captured if c]
+    summary: Dict[str, Any] = {
+        "entries": len(entries),
+        "errors": result["errors"],
+        "elapsed_s": round(result["elapsed"], 3),
+        "throughput_rps": round(len(entries) / result["elapsed"], 2) if result["elapsed"] else 0.0,
+        "latency_ms": {"logged": _latency(logged_ms), "replay": _latency(replay_ms)},
+        "paths": {"logged": dict(Counter(e.get("path") for e in entries)), "replay": dict(Counter(c.get("path") for c in captured if c))},
+        "stages_ms": {"logged": _stage_means(entries), "replay": _stage_means(captured)},
+    }
+    mismatches = []
+    for entry, new in zip(entries, captured):
+        old_key = (entry.get("path"), entry.get("rows"))
+        new_key = (new.get("path"), new.get("rows")) if new else (None, None)
+        if old_key != new_key:
+            mismatches.append({"text": entry["text"], "logged": old_key, "replay": new_key})
+    summary["mismatches"] = len(mismatches)
+
+    print(f"Воспроизведено за {summary['elapsed_s']:.2f} с, {summary['throughput_rps']:.1f} запр/с, ошибок: {result['errors']}")
+    for label in ("logged", "replay"):
+        lat = summary["latency_ms"][label]
+        print(f"  {'журнал' if label == 'logged' else 'сейчас':<7} p50={lat['p50']:9.3f} мс  p95={lat['p95']:9.3f} мс  p99={lat['p99']:9.3f} мс")
+    print("Пути (журнал → сейчас):")
+    for path in sorted(set(summary["paths"]["logged"]) | set(summary["paths"]["replay"]), key=str):
+        print(f"  {str(path):<12} {summary['paths']['logged'].get(path, 0):6d} → {summary['paths']['replay'].get(path, 0):6d}")
+    print("Среднее время этапов, мс (журнал → сейчас):")
+    for stage in sorted(set(summary["stages_ms"]["logged"]) | set(summary["stages_ms"]["replay"])):
+        print(f"  {stage:<12} {summary['stages_ms']['logged'].get(stage, 0.0):9.3f} → {summary['stages_ms']['replay'].get(stage, 0.0):9.3f}")
+    print(f"Расхождений пути/числа строк: {len(mismatches)}")
+    for m in mismatches[:args.diff]:
+        print(f"  {m['text']!r}: {m['logged']} → {m['replay']}")
+
+    if args.output:
+        summary["mismatch_examples"] = mismatches[:args.diff]
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+        print(f"Сводка: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,34 @@
+import startup  # первым: отсчёт времени запуска
+import os
 import re
+import threading
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup  # pyright: ignore[reportMissingImports]
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters  # pyright: ignore[reportMissingImports]
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, ContextTypes, filters  # pyright: ignore[reportMissingImports]
 from handlers.menu import handle_menu_callback as _menu_cb_h, show_main_menu as _show_menu_h, show_main_menu_edit as _show_menu_edit_h  # pyright: ignore[reportMissingImports]
 from handlers.operator import operator as _operator_h  # pyright: ignore[reportMissingImports]
-from handlers.auth import start as _start_h, handle_phone_number as _handle_phone_h, handle_verification_callback as _verify_cb_h  # pyright: ignore[reportMissingImports]
-from handlers.text import handle_text_message as text_handler  # pyright: ignore[reportMissingImports]
+from handlers.auth import start as _start_h, handle_phone_number as _handle_phone_h, handle_verification_callback as _verify_cb_h, restore_session as _restore_session_h, remember_session as _remember_session_h  # pyright: ignore[reportMissingImports]
+from handlers.text import handle_text_message as text_handler, handle_search_page_callback as _search_page_cb_h  # pyright: ignore[reportMissingImports]
+from db_connection import get_pool, run_db, close_pool, pool_stats
+import catalog_index
+import session_store
+import search_cache
+import metrics
+import query_log
+from ai_service import ai_stats, warm_up as warm_up_ai
+from query_normalizer import normalizer_stats, normalize_query
+from search_service import split_batch
+from rate_limit import chat_limiter
+from single_flight import flight_stats
+from prepared_statements import prepared_stats
+from query_parser import load_profile_vocabulary, parse_query, extract_token
+from update_processor import PerChatUpdateProcessor
+import asyncio
+
+startup.mark("imports")
 
 
 try:
+    import config as _config
     from config import BOT_TOKEN, MANAGER_CONTACTS
 except ImportError:
     raise ImportError(
@@ -17,6 +38,25 @@ except ImportError:
 
 WAITING_PHONE, WAITING_VERIFICATION, WAITING_SEARCH = range(3)
 
+# Бот обрабатывает только сообщения и нажатия inline-кнопок
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+
+def _setting(name: str, default=None):
+    """Настройка из переменной окружения, затем из config.py."""
+    value = os.getenv(name)
+    if value is not None:
+        return value
+    return getattr(_config, name, default)
+
+
+# blocking — пул, сессии и индекс каталога загружаются до приёма апдейтов;
+# background — в фоновом потоке сразу после Application.build(): бот отвечает
+# раньше, первые запросы до загрузки индекса идут в БД
+STARTUP_WARM = str(_setting("STARTUP_WARM", "blocking")).lower()
+# По умолчанию стек ИИ загружается при первом запросе к ИИ; 1 — заранее, в фоне после запуска
+AI_PREWARM = str(_setting("AI_PREWARM", "0")).lower() not in ("0", "false", "no")
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await _start_h(update, context)
@@ -91,22 +131,154 @@ async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 
 
+_background_tasks = []
+
+
+def _warm_db() -> None:
+    """Открывает соединения пула, загружает сессии клиентов, индекс каталога и словарь профилей."""
+    try:
+        with startup.timed("db_pool"):
+            get_pool().warm()
+        with startup.timed("sessions"):
+            session_store.warm_up()
+        with startup.timed("catalog"):
+            catalog_index.warm_up()
+        with startup.timed("profiles"):
+            load_profile_vocabulary()
+    except Exception:
+        # БД недоступна при старте — пул подключится при первом поиске,
+        # а индекс загрузится фоновым обновлением
+        pass
+
+
+def _warm_lazy() -> None:
+    """То, что иначе досталось бы первому запросу: кэши разбора и (AI_PREWARM) стек ИИ."""
+    with startup.timed("parsers"):
+        for text in ("SPA2000", "8M 800 мм", "ремень SPA 2000", "8008M, B85"):
+            parse_query(text)
+            normalize_query(text)
+            extract_token(text)
+            split_batch(text)
+    if not AI_PREWARM:
+        return
+    with startup.timed("ai"):
+        try:
+            warm_up_ai()
+        except Exception as e:
+            # Стек ИИ загрузится при первом обращении; ошибка — в логе, отчёте о запуске и метрике bot_startup_warm_failed_ai
+            print(f"[AI] Не удалось загрузить стек ИИ заранее: {type(e).__name__}: {e}")
+            startup.failed("ai", e)
+
+
+def _warm_in_background() -> None:
+    if STARTUP_WARM == "background":
+        _warm_db()
+    _warm_lazy()
+
+
+async def _mark_first_reply(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    startup.first_reply()
+
+
+async def post_init(application: Application) -> None:
+    """Прогревает ресурсы (см. STARTUP_WARM) и запускает фоновые задачи до первого запроса."""
+    startup.mark("initialize")
+    if STARTUP_WARM != "background":
+        await run_db(_warm_db)
+    _background_tasks.append(asyncio.create_task(catalog_index.refresh_loop()))
+    _background_tasks.append(asyncio.create_task(session_store.flush_loop()))
+    # LISTEN products_changed: сброс кэша поиска при изменении товаров
+    search_cache.start_listener()
+    # Журнал поисковых запросов для воспроизведения нагрузки (bench/replay_queries.py)
+    query_log.start(_setting("QUERY_LOG_PATH"))
+
+    metrics_port = _setting("METRICS_PORT")
+    if metrics_port:
+        metrics.register_collector("bot_db_pool", pool_stats)
+        metrics.register_collector("bot_search_cache", search_cache.cache_stats)
+        metrics.register_collector("bot_ai", ai_stats)
+        metrics.register_collector("bot_normalizer", normalizer_stats)
+        metrics.register_collector("bot_rate_limit", chat_limiter.stats)
+        metrics.register_collector("bot_single_flight", flight_stats)
+        metrics.register_collector("bot_prepared", prepared_stats)
+        metrics.register_collector("bot_query_log", query_log.query_log_stats)
+        metrics.register_collector("bot_startup", startup.startup_stats)
+        metrics.register_collector("bot_sessions", session_store.sessions.stats)
+        metrics.register_collector("bot_catalog", lambda: {"rows": len(catalog_index.catalog), "ready": catalog_index.catalog.ready})
+        metrics.start_server(int(metrics_port), _setting("METRICS_HOST", "127.0.0.1"))
+    startup.ready()
+
+
+async def post_shutdown(application: Application) -> None:
+    for task in _background_tasks:
+        task.cancel()
+    search_cache.stop_listener()
+    metrics.stop_server()
+    query_log.stop()
+    try:
+        # Несохранённые изменения сессий
+        await run_db(session_store.sessions.flush)
+    except Exception:
+        pass
+    close_pool()
+
+
 def main() -> None:
     """Запускает бота."""
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(PerChatUpdateProcessor(int(_setting("CONCURRENT_UPDATES", 64))))
+    )
+    base_url = _setting("TELEGRAM_BASE_URL")
+    if base_url:
+        # Например, локальный фейковый Telegram для нагрузочных тестов (bench/fake_telegram.py)
+        builder = builder.base_url(base_url)
+    application = builder.build()
     
+    # Сессии клиентов: восстановление до обработчиков и сохранение после них
+    application.add_handler(TypeHandler(Update, _restore_session_h), group=-1)
+    application.add_handler(TypeHandler(Update, _remember_session_h), group=1)
+
     application.add_handler(CommandHandler("start", _start_h))
     application.add_handler(CommandHandler("operator", operator))
     
     application.add_handler(CallbackQueryHandler(handle_verification_callback, pattern="^verified_"))
     
     application.add_handler(CallbackQueryHandler(_menu_cb_h, pattern="^menu_"))
+    application.add_handler(CallbackQueryHandler(_search_page_cb_h, pattern="^search_page:"))
     application.add_handler(CallbackQueryHandler(_menu_cb_h, pattern="^search_"))
     
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_handler))
+    application.add_handler(TypeHandler(Update, _mark_first_reply), group=2)
+    startup.mark("build")
+
+    # Прогрев в фоне, пока библиотека инициализирует бота (getMe) и начинает опрос
+    threading.Thread(target=_warm_in_background, name="warm-up", daemon=True).start()
     
+    mode = str(_setting("BOT_MODE", "polling")).lower()
+    if mode == "webhook":
+        from webhook_server import run_webhook
+
+        webhook_url = _setting("WEBHOOK_URL")
+        if not webhook_url:
+            raise RuntimeError("Для BOT_MODE=webhook задайте WEBHOOK_URL (публичный https-адрес бота).")
+        print("Бот запущен (webhook)...")
+        asyncio.run(run_webhook(
+            application,
+            url=webhook_url,
+            listen=_setting("WEBHOOK_LISTEN", "127.0.0.1"),
+            port=int(_setting("WEBHOOK_PORT", 8080)),
+            path=_setting("WEBHOOK_PATH", "/telegram"),
+            secret_token=_setting("WEBHOOK_SECRET"),
+            allowed_updates=ALLOWED_UPDATES,
+        ))
+        return
+
     print("Бот запущен...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == "__main__":
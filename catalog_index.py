@@ -0,0 +1,350 @@
+import os
+import re
+import asyncio
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from typing import Optional, List, Dict, Tuple, Set, Any, Callable
+from db_connection import get_connection, run_db
+from query_parser import load_profile_vocabulary
+from query_normalizer import HOMOGLYPHS
+
+
+CATALOG_INDEX_ENABLED = os.getenv("CATALOG_INDEX", "1") not in ("0", "false", "no")
+REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "30"))
+FULL_RELOAD_INTERVAL = float(os.getenv("CATALOG_FULL_RELOAD_INTERVAL", "3600"))
+# Перекрытие окна опроса: строки из долгих транзакций получают updated_at раньше коммита
+REFRESH_OVERLAP = timedelta(seconds=float(os.getenv("CATALOG_REFRESH_OVERLAP", "60")))
+
+# Ранг для товаров без правила в brand_ranks (см. db/migrations/002_brand_ranks.sql)
+DEFAULT_BRAND_RANK = 1000
+
+
+Key = Tuple[str, str]
+
+
+class _Entry:
+    __slots__ = ("length", "brand_rank", "row")
+
+    def __init__(self, row: Dict[str, Any]) -> None:
+        length = row.get("length")
+        rank = row.get("brand_rank")
+        self.length = float(length) if length is not None else None
+        self.brand_rank = rank if rank is not None else DEFAULT_BRAND_RANK
+        self.row = row
+
+
+class _Bucket:
+    """Товары одного (склад, профиль), отсортированные по длине."""
+
+    __slots__ = ("lengths", "entries", "no_length")
+
+    def __init__(self, entries: List[_Entry]) -> None:
+        with_length = sorted((e for e in entries if e.length is not None), key=lambda e: e.length)
+        self.lengths = [e.length for e in with_length]
+        self.entries = with_length
+        self.no_length = [e for e in entries if e.length is None]
+
+    def range(self, lo: float, hi: float, *, inclusive: bool) -> List[_Entry]:
+        if inclusive:
+            return self.entries[bisect_left(self.lengths, lo):bisect_right(self.lengths, hi)]
+        return self.entries[bisect_right(self.lengths, lo):bisect_left(self.lengths, hi)]
+
+    def all(self) -> List[_Entry]:
+        return self.entries + self.no_length
+
+
+def _key(warehouse: Optional[str], profile: Optional[str]) -> Key:
+    return ((warehouse or "").strip(), (profile or "").strip().upper())
+
+
+_CODE_JUNK = re.compile(r"[\s\-–—]+")
+
+
+def normalize_code(code: str) -> str:
+    """Код товара для сравнения: как normalize_code() в db/migrations/006_product_codes.sql."""
+    return _CODE_JUNK.sub("", code.translate(HOMOGLYPHS).upper())
+
+
+def _row_codes(row: Dict[str, Any]) -> Set[str]:
+    """Нормализованные артикул и аналоги товара."""
+    codes = set()
+    for code in [row.get("article")] + list(row.get("analogues") or []):
+        if code:
+            code = normalize_code(code)
+            if code:
+                codes.add(code)
+    return codes
+
+
+def _price_key(row: Dict[str, Any]) -> Tuple:
+    price = row.get("price_per_unit")
+    return (price is None, price if price is not None else 0, row.get("name") or "", row.get("id") or 0)
+
+
+class CatalogIndex:
+    """In-memory копия таблицы products для поиска без запроса к БД.
+
+    Товары сгруппированы по (склад, профиль) и отсортированы по длине,
+    поэтому окна допусков по длине находятся бинарным поиском.
+    Обновляется инкрементально по ``updated_at`` (см. ``refresh``).
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        self._lock = threading.Lock()
+        self._rows: Dict[int, Dict[str, Any]] = {}
+        self._key_ids: Dict[Key, Set[int]] = {}
+        self._buckets: Dict[Key, _Bucket] = {}
+        # Нормализованный артикул/аналог -> id товаров (кортежи заменяются целиком)
+        self._codes: Dict[str, Tuple[int, ...]] = {}
+        self._last_updated_at = None
+        self._listeners: List[Callable[[Optional[Set[Key]]], None]] = []
+
+    def subscribe(self, listener: Callable[[Optional[Set[Key]]], None]) -> None:
+        """``listener(keys)`` вызывается после обновления индекса с изменившимися
+        (склад, профиль); ``None`` — индекс загружен целиком."""
+        self._listeners.append(listener)
+
+    def _notify(self, keys: Optional[Set[Key]]) -> None:
+        for listener in self._listeners:
+            listener(keys)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def load(self) -> None:
+        """Полная загрузка каталога."""
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT * FROM products")
+                rows = cur.fetchall()
+        with self._lock:
+            self._rows = {}
+            self._key_ids = {}
+            self._last_updated_at = None
+            codes: Dict[str, Tuple[int, ...]] = {}
+            self._apply(rows, codes)
+            self._buckets = {k: _Bucket([_Entry(self._rows[i]) for i in ids]) for k, ids in self._key_ids.items()}
+            self._codes = codes
+            self.ready = True
+        self._notify(None)
+
+    def refresh(self) -> int:
+        """Подтягивает строки, изменённые с прошлой загрузки, и убирает удалённые;
+        возвращает число изменённых строк.
+
+        Изменения ищутся по индексу idx_products_updated_at
+        (db/migrations/008_products_updated_at.sql), удаления — сравнением
+        множества id в БД и в индексе.
+        """
+        if not self.ready:
+            self.load()
+            return len(self._rows)
+        since = self._last_updated_at
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                if since is None:
+                    cur.execute("SELECT * FROM products")
+                else:
+                    cur.execute("SELECT * FROM products WHERE updated_at >= %s", (since - REFRESH_OVERLAP,))
+                rows = cur.fetchall()
+                cur.execute("SELECT id FROM products")
+                existing = {r["id"] for r in cur.fetchall()}
+        with self._lock:
+            dirty = self._apply(rows, self._codes)
+            # Удалённые строки (в т.ч. импорт в режиме replace: удалил K строк, вставил K)
+            dirty |= self._remove([i for i in self._rows if i not in existing], self._codes)
+            buckets = dict(self._buckets)
+            for k in dirty:
+                ids = self._key_ids.get(k)
+                if ids:
+                    buckets[k] = _Bucket([_Entry(self._rows[i]) for i in ids])
+                else:
+                    buckets.pop(k, None)
+            self._buckets = buckets
+        if dirty:
+            self._notify(dirty)
+        return len(rows)
+
+    def _remove(self, row_ids: List[int], codes: Dict[str, Tuple[int, ...]]) -> Set[Key]:
+        dirty: Set[Key] = set()
+        for row_id in row_ids:
+            old = self._rows.pop(row_id)
+            key = _key(old.get("warehouse"), old.get("profile"))
+            ids = self._key_ids.get(key)
+            if ids is not None:
+                ids.discard(row_id)
+                if not ids:
+                    del self._key_ids[key]
+            for code in _row_codes(old):
+                rest = tuple(i for i in codes.get(code, ()) if i != row_id)
+                if rest:
+                    codes[code] = rest
+                else:
+                    codes.pop(code, None)
+            dirty.add(key)
+        return dirty
+
+    def _apply(self, rows: List[Dict[str, Any]], codes: Dict[str, Tuple[int, ...]]) -> Set[Key]:
+        dirty: Set[Key] = set()
+        for row in rows:
+            row = dict(row)
+            row_id = row["id"]
+            old = self._rows.get(row_id)
+            if old == row:
+                # Окно опроса с перекрытием каждый раз возвращает последние изменённые
+                # строки заново — неизменившиеся не перестраивают корзины и не сбрасывают кэш
+                continue
+            new_key = _key(row.get("warehouse"), row.get("profile"))
+            new_codes = _row_codes(row)
+            old_codes: Set[str] = set()
+            if old is not None:
+                old_key = _key(old.get("warehouse"), old.get("profile"))
+                if old_key != new_key:
+                    self._key_ids[old_key].discard(row_id)
+                    dirty.add(old_key)
+                old_codes = _row_codes(old)
+            for code in old_codes - new_codes:
+                ids = tuple(i for i in codes.get(code, ()) if i != row_id)
+                if ids:
+                    codes[code] = ids
+                else:
+                    codes.pop(code, None)
+            for code in new_codes - old_codes:
+                codes[code] = codes.get(code, ()) + (row_id,)
+            self._rows[row_id] = row
+            self._key_ids.setdefault(new_key, set()).add(row_id)
+            dirty.add(new_key)
+            updated_at = row.get("updated_at")
+            if updated_at is not None and (self._last_updated_at is None or updated_at > self._last_updated_at):
+                self._last_updated_at = updated_at
+        return dirty
+
+    def lookup(
+        self,
+        *,
+        kind: str,
+        profile: Optional[str],
+        eff_length: Optional[float],
+        width_mm: Optional[float],
+        warehouse: str,
+    ) -> List[Dict[str, Any]]:
+        """Тот же отбор и порядок, что у SQL-запроса в ``search_service``."""
+        buckets = self._buckets
+        if profile:
+            bucket = buckets.get(_key(warehouse, profile))
+            candidates = [bucket] if bucket else []
+        else:
+            wh = warehouse.strip()
+            candidates = [b for k, b in buckets.items() if k[0] == wh]
+
+        entries: List[_Entry] = []
+        for bucket in candidates:
+            if eff_length is None:
+                entries.extend(bucket.all())
+            elif kind == "vbelt":
+                delta = eff_length * 0.015
+                entries.extend(bucket.range(eff_length - delta, eff_length + delta, inclusive=True))
+            else:
+                entries.extend(bucket.range(eff_length - 0.5, eff_length + 0.5, inclusive=False))
+
+        entries = [
+            e for e in entries
+            if (e.row.get("quantity_free") or 0) > 0
+            and (width_mm is None or (e.row.get("width") is not None and e.row.get("width") == width_mm))
+        ]
+
+        if kind == "vbelt" and eff_length is not None:
+            entries.sort(key=lambda e: (abs(e.length - eff_length), e.brand_rank) + _price_key(e.row))
+        else:
+            entries.sort(key=lambda e: (e.brand_rank,) + _price_key(e.row))
+        return [e.row for e in entries]
+
+    def lookup_codes(self, codes: List[str], *, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Товары в наличии, у которых артикул или аналог совпадает с одним из
+        нормализованных ``codes``; порядок — как у ``search_service._codes_db``."""
+        rows = self._rows
+        found: Dict[int, Dict[str, Any]] = {}
+        for code in codes:
+            for row_id in self._codes.get(code, ()):
+                row = rows.get(row_id)
+                if row is not None and (row.get("quantity_free") or 0) > 0:
+                    found[row_id] = row
+        wanted = set(codes)
+
+        def order(row: Dict[str, Any]) -> Tuple:
+            own = bool(row.get("article")) and normalize_code(row["article"]) in wanted
+            rank = row.get("brand_rank")
+            return (not own, rank if rank is not None else DEFAULT_BRAND_RANK) + _price_key(row)
+
+        return sorted(found.values(), key=order)[:limit]
+
+    def nearest(
+        self,
+        *,
+        profile: Optional[str],
+        eff_length: Optional[float],
+        width_mm: Optional[float],
+        warehouse: str,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """``limit`` товаров в наличии того же профиля, ближайших по длине
+        (при равной длине — по ширине), как ``search_service._nearest_db``."""
+        if not profile or eff_length is None or limit <= 0:
+            return []
+        bucket = self._buckets.get(_key(warehouse, profile))
+        if bucket is None:
+            return []
+
+        # Расходимся от точки вставки в обе стороны, пока не наберём limit строк с каждой
+        pos = bisect_left(bucket.lengths, eff_length)
+        picked: List[_Entry] = []
+        for indexes in (range(pos, len(bucket.entries)), range(pos - 1, -1, -1)):
+            found = 0
+            for i in indexes:
+                entry = bucket.entries[i]
+                if (entry.row.get("quantity_free") or 0) > 0:
+                    picked.append(entry)
+                    found += 1
+                    if found >= limit:
+                        break
+
+        def width_distance(entry: _Entry) -> Tuple:
+            width = entry.row.get("width")
+            if width_mm is None or width is None:
+                return (width_mm is not None, 0.0)
+            return (False, abs(float(width) - width_mm))
+
+        picked.sort(key=lambda e: (abs(e.length - eff_length),) + width_distance(e) + (e.brand_rank,) + _price_key(e.row))
+        return [e.row for e in picked[:limit]]
+
+
+catalog = CatalogIndex()
+
+
+def warm_up() -> None:
+    """Загружает каталог при старте бота (если индекс включён)."""
+    if CATALOG_INDEX_ENABLED:
+        catalog.load()
+
+
+async def refresh_loop() -> None:
+    """Фоновое обновление индекса: инкрементально и периодически целиком."""
+    if not CATALOG_INDEX_ENABLED:
+        return
+    since_full = 0.0
+    while True:
+        await asyncio.sleep(REFRESH_INTERVAL)
+        since_full += REFRESH_INTERVAL
+        try:
+            if since_full >= FULL_RELOAD_INTERVAL:
+                since_full = 0.0
+                await run_db(catalog.load)
+                # Новые профили в каталоге → словарь парсера запросов
+                await run_db(load_profile_vocabulary)
+            else:
+                await run_db(catalog.refresh)
+        except Exception:
+            # БД временно недоступна — поиск продолжит работать по текущему индексу
+            pass
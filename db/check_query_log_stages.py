@@ -0,0 +1,73 @@
+"""Проверка, что запись журнала запросов (query_log) содержит время этапов SQL.
+
+Поиск выполняется в пуле потоков БД (db_connection.run_db); этапы sql_execute
+и sql_fetch попадают в запись сообщения, только если поток видит контекст
+обработчика. Скрипт выполняет типовые запросы в query_log.trace с индексом
+каталога выключенным (поиск идёт в PostgreSQL) и проверяет этапы каждой
+записи. Код возврата 1, если хотя бы в одной записи их нет.
+
+Запуск (после применения db/schema.sql):
+    python db/check_query_log_stages.py
+"""
+import os
+import sys
+import asyncio
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Индекс каталога отвечает без БД — здесь нужен путь через run_db
+os.environ["CATALOG_INDEX"] = "0"
+
+import query_log  # noqa: E402
+from query_log import note  # noqa: E402
+from db_connection import close_pool  # noqa: E402
+from search_service import build_request, analogue_codes, search_async, search_analogues_async  # noqa: E402
+
+
+EXPECTED_STAGES = {"sql_execute", "sql_fetch"}
+
+CASES = [
+    "8008M",
+    "SPA2000",
+    "B85",
+]
+
+
+async def _run_cases() -> List[Dict[str, Any]]:
+    entries: List[Dict[str, Any]] = []
+    query_log.set_sink(entries.append)
+    try:
+        for i, text in enumerate(CASES):
+            with query_log.trace(i, text):
+                page = await search_async(build_request(text))
+                note(path="direct", found=len(page.rows))
+            with query_log.trace(i, text):
+                page = await search_analogues_async(analogue_codes(text))
+                note(path="analogue", found=len(page.rows))
+    finally:
+        query_log.set_sink(None)
+    return entries
+
+
+def main() -> int:
+    try:
+        entries = asyncio.run(_run_cases())
+    finally:
+        close_pool()
+    failed = 0
+    for entry in entries:
+        missing = EXPECTED_STAGES - set(entry["stages"])
+        stages = ", ".join(f"{stage}={ms:g}" for stage, ms in sorted(entry["stages"].items()))
+        status = "OK  " if not missing else "FAIL"
+        print(f"{status} {entry['path']:<9} {entry['text']:<10} {stages}")
+        if missing:
+            failed += 1
+            print(f"     нет этапов: {', '.join(sorted(missing))}")
+    if len(entries) != 2 * len(CASES):
+        print(f"FAIL записей в журнале: {len(entries)} из {2 * len(CASES)}")
+        failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
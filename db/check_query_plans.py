@@ -0,0 +1,87 @@
+"""Проверка планов поисковых запросов на локальном PostgreSQL.
+
+Для каждого типового запроса строит SQL так же, как бот, выполняет EXPLAIN
+с отключённым последовательным сканированием и проверяет, что план использует
+один из поисковых индексов (idx_products_search, idx_products_search_rank),
+а поиск по артикулу и аналогам — GIN-индекс idx_products_codes.
+Код возврата 1, если хотя бы один запрос их не использует.
+
+Запуск (после применения db/schema.sql):
+    python db/check_query_plans.py
+"""
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_connection import get_connection  # noqa: E402
+from search_service import build_request, build_search_sql, analogue_codes, build_codes_sql, PAGE_SIZE  # noqa: E402
+
+
+EXPECTED_INDEXES = {"idx_products_search", "idx_products_search_rank"}
+
+CASES = [
+    "8008M",
+    "177814M=55",
+    "240L",
+    "SPA2000",
+    "B85",
+    "3VX1000",
+    "8V2000",
+]
+
+CODE_CASES = [
+    "8008M",
+    "SPA 2000",
+    "нужен B85",
+]
+
+
+def _index_names(plan):
+    found = []
+    if "Index Name" in plan:
+        found.append(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        found.extend(_index_names(child))
+    return found
+
+
+def explain(cur, query: str, *, codes: bool = False):
+    if codes:
+        sql, params = build_codes_sql(analogue_codes(query), limit=PAGE_SIZE + 1)
+    else:
+        sql, params = build_search_sql(build_request(query), limit=PAGE_SIZE + 1)
+    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    row = cur.fetchone()
+    payload = row["QUERY PLAN"]
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    return payload[0]["Plan"]
+
+
+def main() -> int:
+    failed = 0
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # На тестовых данных таблица крошечная и seq scan всегда дешевле;
+            # отключаем его, чтобы проверить, что индекс в принципе применим.
+            cur.execute("SET LOCAL enable_seqscan = off")
+            for query in CASES:
+                plan = explain(cur, query)
+                indexes = _index_names(plan)
+                ok = bool(EXPECTED_INDEXES.intersection(indexes))
+                failed += 0 if ok else 1
+                print(f"{'OK  ' if ok else 'FAIL'} {query:<12} {plan['Node Type']:<20} {', '.join(indexes) or '-'}")
+            for query in CODE_CASES:
+                plan = explain(cur, query, codes=True)
+                indexes = _index_names(plan)
+                ok = "idx_products_codes" in indexes
+                failed += 0 if ok else 1
+                print(f"{'OK  ' if ok else 'FAIL'} {query:<12} {plan['Node Type']:<20} {', '.join(indexes) or '-'}")
+        conn.rollback()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
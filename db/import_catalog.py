@@ -0,0 +1,389 @@
+"""Потоковый импорт выгрузки остатков склада (CSV/XLSX) в products.
+
+Файл читается порциями по --chunk строк и загружается через COPY во временную
+таблицу; память не зависит от размера файла. Профиль, длина (мм), ширина, тип
+ремня и склад, если их нет в выгрузке, выводятся из артикула по тем же правилам,
+что и parse_query. Затем одной транзакцией данные сливаются с products:
+изменившиеся строки обновляются, новые добавляются, а в режиме replace строки
+того же источника (data_source), которых нет в выгрузке, удаляются. Таблица не
+блокируется целиком: поиск во время импорта видит прежние данные до коммита.
+
+Строка выгрузки сопоставляется с товаром по (article, warehouse, name).
+
+Режим delta — синхронизация остатков по ленте изменений (article, warehouse,
+name, остаток, цена): пачки по --chunk строк применяются отдельными транзакциями
+через INSERT ... ON CONFLICT по ключу uq_products_article_warehouse_name
+(db/migrations/005_products_unique_key.sql). Обновляются только строки, где
+остаток или цена действительно изменились, поэтому updated_at и кэши
+остальных товаров не трогаются.
+
+Запуск:
+    python db/import_catalog.py stock_moscow.csv --warehouse Москва
+    python db/import_catalog.py stock_strunino.xlsx --sheet Остатки --mode merge
+    python db/import_catalog.py stock.csv --dry-run
+    python db/import_catalog.py stock_changes.csv --mode delta --chunk 500
+"""
+import io
+import os
+import re
+import sys
+import csv
+import time
+import argparse
+from typing import Optional, Dict, List, Iterator, Any, Set
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_connection import get_connection  # noqa: E402
+from query_parser import parse_query  # noqa: E402
+
+
+COLUMNS = [
+    "name", "article", "category", "warehouse", "quantity_free", "quantity_mm",
+    "price_per_unit", "price_per_mm", "width", "length", "profile", "analogues", "data_source",
+]
+
+# Заголовки выгрузок 1С/Excel → колонки products
+HEADER_ALIASES = {
+    "name": ("name", "наименование", "номенклатура", "товар"),
+    "article": ("article", "артикул", "код"),
+    "category": ("category", "категория", "тип"),
+    "warehouse": ("warehouse", "склад"),
+    "quantity_free": ("quantity_free", "свободный остаток", "остаток", "количество", "кол-во"),
+    "quantity_mm": ("quantity_mm", "остаток мм", "количество мм"),
+    "price_per_unit": ("price_per_unit", "цена", "цена за шт", "цена за единицу"),
+    "price_per_mm": ("price_per_mm", "цена за мм"),
+    "width": ("width", "ширина"),
+    "length": ("length", "длина"),
+    "profile": ("profile", "профиль"),
+    "analogues": ("analogues", "аналоги"),
+    "data_source": ("data_source", "источник"),
+}
+
+# Колонки, которые обновляет режим delta (если они есть в ленте)
+STOCK_COLUMNS = ("quantity_free", "quantity_mm", "price_per_unit", "price_per_mm")
+
+INTEGER_COLUMNS = {"quantity_free", "quantity_mm"}
+NUMERIC_COLUMNS = {"price_per_unit", "price_per_mm", "width", "length"}
+
+STAGING_DDL = """
+CREATE TEMP TABLE products_import_raw (
+    line_no BIGINT,
+    name VARCHAR(500),
+    article VARCHAR(100),
+    category VARCHAR(100),
+    warehouse VARCHAR(50),
+    quantity_free INTEGER,
+    quantity_mm INTEGER,
+    price_per_unit DECIMAL(10,2),
+    price_per_mm DECIMAL(10,2),
+    width DECIMAL(8,2),
+    length DECIMAL(8,2),
+    profile VARCHAR(100),
+    analogues TEXT[],
+    data_source VARCHAR(50)
+) ON COMMIT DROP
+"""
+
+_MATCH = "p.warehouse = s.warehouse AND p.name = s.name AND p.article IS NOT DISTINCT FROM s.article"
+_DATA = [c for c in COLUMNS if c not in ("name", "article", "warehouse")]
+
+
+def _header_key(value: Any) -> str:
+    return re.sub(r"\s+", " ", str(value or "").strip().lower().replace("ё", "е"))
+
+
+def _column_map(header: List[Any]) -> Dict[str, int]:
+    positions = {_header_key(h): i for i, h in enumerate(header)}
+    mapping = {}
+    for column, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias in positions:
+                mapping[column] = positions[alias]
+                break
+    if "name" not in mapping:
+        raise SystemExit(f"В заголовке нет колонки с наименованием товара: {header}")
+    return mapping
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace("\xa0", "").replace(" ", "").replace(",", ".")
+    try:
+        return float(text) if text else None
+    except ValueError:
+        return None
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+def _pg_array(items: List[str]) -> str:
+    quoted = ('"' + item.replace("\\", "\\\\").replace('"', '\\"') + '"' for item in items)
+    return "{" + ",".join(quoted) + "}"
+
+
+def read_csv(path: str, *, encoding: str, delimiter: Optional[str]) -> Iterator[List[Any]]:
+    with open(path, encoding=encoding, newline="") as f:
+        if delimiter is None:
+            sample = f.read(64 * 1024)
+            f.seek(0)
+            try:
+                delimiter = csv.Sniffer().sniff(sample, delimiters=";,\t").delimiter
+            except csv.Error:
+                delimiter = ";"
+        yield from csv.reader(f, delimiter=delimiter)
+
+
+def read_xlsx(path: str, *, sheet: Optional[str]) -> Iterator[List[Any]]:
+    try:
+        from openpyxl import load_workbook  # pyright: ignore[reportMissingImports]
+    except ImportError:
+        raise SystemExit("Для импорта XLSX установите openpyxl: pip install openpyxl")
+    # read_only: строки читаются потоком, файл целиком в память не загружается
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        for row in worksheet.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+class Converter:
+    """Строка выгрузки → значения колонок products (недостающее — из артикула)."""
+
+    def __init__(self, mapping: Dict[str, int], *, warehouse: Optional[str], data_source: Optional[str]) -> None:
+        self.mapping = mapping
+        self.warehouse = warehouse
+        self.data_source = data_source
+        self.skipped = 0
+        self.data_sources: Set[str] = set()
+
+    def convert(self, raw: List[Any]) -> Optional[Dict[str, Any]]:
+        values: Dict[str, Any] = {}
+        for column, index in self.mapping.items():
+            value = raw[index] if index < len(raw) else None
+            if column in INTEGER_COLUMNS:
+                number = _number(value)
+                values[column] = int(number) if number is not None else None
+            elif column in NUMERIC_COLUMNS:
+                values[column] = _number(value)
+            else:
+                values[column] = _text(value)
+        if not values.get("name"):
+            self.skipped += 1
+            return None
+
+        article = values.get("article")
+        parsed = parse_query(article) if article else None
+        if parsed is not None and parsed.kind != "unknown":
+            if not values.get("category"):
+                values["category"] = parsed.kind
+            if not values.get("profile"):
+                values["profile"] = parsed.profile
+            if values.get("length") is None:
+                values["length"] = parsed.eff_length
+            if values.get("width") is None:
+                values["width"] = parsed.width_mm
+        warehouse = self.warehouse or values.get("warehouse") or (parsed.warehouse if parsed is not None else None)
+        if not warehouse:
+            self.skipped += 1
+            return None
+        values["warehouse"] = warehouse
+        values["data_source"] = self.data_source or values.get("data_source") or f"Склад ремни {warehouse}"
+        self.data_sources.add(values["data_source"])
+
+        analogues = values.get("analogues")
+        if analogues:
+            values["analogues"] = _pg_array([a.strip() for a in re.split(r"[,;]", analogues) if a.strip()])
+        elif article:
+            values["analogues"] = _pg_array([article])
+        return values
+
+
+def copy_chunks(cur, rows: Iterator[List[Any]], converter: Converter, chunk: int) -> int:
+    """Загружает строки во временную таблицу порциями; возвращает число загруженных."""
+    loaded = 0
+    line_no = 1
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pending = 0
+    copy_sql = f"COPY products_import_raw (line_no, {', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+    def flush() -> None:
+        buffer.seek(0)
+        cur.copy_expert(copy_sql, buffer)
+        buffer.seek(0)
+        buffer.truncate()
+
+    for raw in rows:
+        line_no += 1
+        values = converter.convert(raw)
+        if values is None:
+            continue
+        # None → пустое поле без кавычек, в формате csv это NULL
+        writer.writerow([line_no] + [values.get(c) for c in COLUMNS])
+        pending += 1
+        if pending >= chunk:
+            flush()
+            loaded += pending
+            pending = 0
+    if pending:
+        flush()
+        loaded += pending
+    return loaded
+
+
+def merge(cur, *, replace_sources: Optional[List[str]]) -> Dict[str, int]:
+    """Сливает временную таблицу с products; в строках меняются только отличающиеся значения."""
+    # Повтор товара в выгрузке: берём последнюю строку файла
+    cur.execute(
+        "CREATE TEMP TABLE products_import ON COMMIT DROP AS "
+        "SELECT DISTINCT ON (warehouse, article, name) * FROM products_import_raw "
+        "ORDER BY warehouse, article, name, line_no DESC"
+    )
+    cur.execute("CREATE INDEX ON products_import (warehouse, name)")
+    cur.execute("ANALYZE products_import")
+
+    counts = {}
+    cur.execute(
+        f"UPDATE products p SET {', '.join(f'{c} = s.{c}' for c in _DATA)} "
+        f"FROM products_import s WHERE {_MATCH} "
+        f"AND ({', '.join(f'p.{c}' for c in _DATA)}) IS DISTINCT FROM ({', '.join(f's.{c}' for c in _DATA)})"
+    )
+    counts["updated"] = cur.rowcount
+    cur.execute(
+        f"INSERT INTO products ({', '.join(COLUMNS)}) "
+        f"SELECT {', '.join(f's.{c}' for c in COLUMNS)} FROM products_import s "
+        f"WHERE NOT EXISTS (SELECT 1 FROM products p WHERE {_MATCH})"
+    )
+    counts["inserted"] = cur.rowcount
+    if replace_sources:
+        cur.execute(
+            "DELETE FROM products p WHERE p.data_source = ANY(%s) "
+            f"AND NOT EXISTS (SELECT 1 FROM products_import s WHERE {_MATCH})",
+            (replace_sources,),
+        )
+        counts["deleted"] = cur.rowcount
+    else:
+        counts["deleted"] = 0
+    return counts
+
+
+def _batches(rows: Iterator[List[Any]], converter: Converter, chunk: int) -> Iterator[List[Dict[str, Any]]]:
+    batch: Dict[tuple, Dict[str, Any]] = {}
+    for raw in rows:
+        values = converter.convert(raw)
+        if values is None:
+            continue
+        # Один товар дважды в пачке: ON CONFLICT не обновляет строку дважды, берём последнее
+        batch[(values.get("article"), values["warehouse"], values["name"])] = values
+        if len(batch) >= chunk:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+
+def sync_delta(conn, rows: Iterator[List[Any]], converter: Converter, chunk: int, *, dry_run: bool) -> Dict[str, int]:
+    """Применяет ленту изменений остатков пачками upsert; каждая пачка — своя транзакция."""
+    from psycopg2.extras import execute_values
+
+    updatable = [c for c in STOCK_COLUMNS if c in converter.mapping]
+    if not updatable:
+        raise SystemExit(f"В ленте нет колонок остатков или цен: {', '.join(STOCK_COLUMNS)}")
+    sql = (
+        f"INSERT INTO products ({', '.join(COLUMNS)}) VALUES %s "
+        "ON CONFLICT ON CONSTRAINT uq_products_article_warehouse_name DO UPDATE SET "
+        + ", ".join(f"{c} = EXCLUDED.{c}" for c in updatable)
+        + f" WHERE ({', '.join(f'products.{c}' for c in updatable)}) "
+        f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in updatable)})"
+    )
+    template = "(" + ", ".join("%s::text[]" if c == "analogues" else "%s" for c in COLUMNS) + ")"
+    totals = {"batches": 0, "rows": 0, "changed": 0}
+    for number, batch in enumerate(_batches(rows, converter, chunk), 1):
+        started = time.perf_counter()
+        with conn.cursor() as cur:
+            execute_values(cur, sql, [[v.get(c) for c in COLUMNS] for v in batch], template=template, page_size=len(batch))
+            # Неизменившиеся строки отсекает WHERE и в rowcount не попадают
+            changed = cur.rowcount
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        elapsed = time.perf_counter() - started
+        totals["batches"] += 1
+        totals["rows"] += len(batch)
+        totals["changed"] += changed
+        print(f"Пачка {number}: {len(batch)} строк, изменено {changed}, {elapsed * 1000:.1f} мс")
+    return totals
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV или XLSX файл выгрузки")
+    parser.add_argument("--warehouse", help="склад для всех строк (иначе колонка «Склад» или правило по артикулу)")
+    parser.add_argument("--data-source", help="значение data_source (по умолчанию «Склад ремни <склад>»)")
+    parser.add_argument("--mode", choices=("replace", "merge", "delta"), default="replace",
+                        help="replace — выгрузка полная, отсутствующие в ней товары источника удаляются; "
+                             "delta — лента изменений остатков и цен")
+    parser.add_argument("--chunk", type=int, default=5000, help="строк в одной порции COPY")
+    parser.add_argument("--sheet", help="лист XLSX (по умолчанию активный)")
+    parser.add_argument("--encoding", default="utf-8-sig", help="кодировка CSV (выгрузки 1С часто cp1251)")
+    parser.add_argument("--delimiter", help="разделитель CSV (по умолчанию определяется автоматически)")
+    parser.add_argument("--dry-run", action="store_true", help="всё посчитать и откатить транзакцию")
+    args = parser.parse_args()
+
+    if args.path.lower().endswith((".xlsx", ".xlsm")):
+        rows = read_xlsx(args.path, sheet=args.sheet)
+    else:
+        rows = read_csv(args.path, encoding=args.encoding, delimiter=args.delimiter)
+    header = next(rows, None)
+    if header is None:
+        print("Файл пуст")
+        return 1
+    converter = Converter(_column_map(header), warehouse=args.warehouse, data_source=args.data_source)
+
+    started = time.perf_counter()
+    if args.mode == "delta":
+        with get_connection() as conn:
+            totals = sync_delta(conn, rows, converter, max(1, args.chunk), dry_run=args.dry_run)
+        elapsed = time.perf_counter() - started
+        print(f"Пачек: {totals['batches']}, строк: {totals['rows']}, изменено: {totals['changed']}, "
+              f"пропущено: {converter.skipped}, {totals['rows'] / max(elapsed, 1e-9):,.0f} строк/с"
+              f"{' (dry-run, изменения откачены)' if args.dry_run else ''}")
+        return 0
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(STAGING_DDL)
+            loaded = copy_chunks(cur, rows, converter, max(1, args.chunk))
+            copied = time.perf_counter()
+            print(f"Загружено во временную таблицу: {loaded} строк, пропущено: {converter.skipped}, "
+                  f"{loaded / max(copied - started, 1e-9):,.0f} строк/с")
+            replace_sources = sorted(converter.data_sources) if args.mode == "replace" else None
+            if replace_sources is not None and not loaded:
+                print("Выгрузка пуста — режим replace удалил бы все товары источника, импорт отменён")
+                conn.rollback()
+                return 1
+            counts = merge(cur, replace_sources=replace_sources)
+        if args.dry_run:
+            conn.rollback()
+    finished = time.perf_counter()
+    print(f"Добавлено: {counts['inserted']}, обновлено: {counts['updated']}, удалено: {counts['deleted']}"
+          f"{' (dry-run, изменения откачены)' if args.dry_run else ''}")
+    print(f"Слияние: {finished - copied:.2f} с, всего: {finished - started:.2f} с, "
+          f"{loaded / max(finished - started, 1e-9):,.0f} строк/с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+-- Нормализованные колонки и частичный индекс для поиска товаров в наличии.
+-- Поиск фильтрует по TRIM(warehouse) и UPPER(TRIM(profile)); храним эти значения
+-- в генерируемых колонках, чтобы условия были sargable и использовали индекс.
+
+ALTER TABLE products
+    ADD COLUMN IF NOT EXISTS warehouse_norm VARCHAR(50) GENERATED ALWAYS AS (TRIM(warehouse)) STORED,
+    ADD COLUMN IF NOT EXISTS profile_norm VARCHAR(100) GENERATED ALWAYS AS (UPPER(TRIM(profile))) STORED;
+
+-- Поиск всегда ищет только товары в наличии: частичный индекс по (склад, профиль, длина),
+-- ширина в INCLUDE, чтобы фильтр по ней проверялся без чтения строки из кучи.
+CREATE INDEX IF NOT EXISTS idx_products_search
+    ON products (warehouse_norm, profile_norm, length)
+    INCLUDE (width)
+    WHERE quantity_free > 0;
+
+ANALYZE products;
@@ -0,0 +1,78 @@
+-- Приоритет брендов в выдаче как данные, а не CASE в ORDER BY.
+-- Правило: UPPER(name) LIKE pattern (и NOT LIKE exclude_pattern) для товаров категории kind.
+-- Из подходящих правил берётся наименьший rank; товары без правила идут последними.
+-- Чтобы добавить бренд, достаточно вставить строку в brand_ranks.
+
+CREATE TABLE IF NOT EXISTS brand_ranks (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL, -- значение products.category: 'vbelt' или 'synchronous'
+    pattern VARCHAR(200) NOT NULL,
+    exclude_pattern VARCHAR(200),
+    rank INTEGER NOT NULL,
+    UNIQUE (kind, pattern)
+);
+
+INSERT INTO brand_ranks (kind, pattern, exclude_pattern, rank)
+VALUES
+  ('vbelt', '% FNR%', NULL, 1),
+  ('vbelt', '% PIX MUSCLE XS3%', NULL, 2),
+  ('vbelt', '% PIX XSET%', NULL, 3),
+  ('vbelt', '% MEGADYNE EXTRA%', NULL, 4),
+  ('synchronous', '% CFNR%', NULL, 1),
+  ('synchronous', '% CONTITECH%', '%CXP%', 2),
+  ('synchronous', '%CXP CONTITECH%', NULL, 3),
+  ('synchronous', '% MEGADYNE%', NULL, 4)
+ON CONFLICT (kind, pattern) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION product_brand_rank(p_name TEXT, p_kind TEXT)
+RETURNS INTEGER AS $$
+  SELECT COALESCE(MIN(rank), 1000)
+  FROM brand_ranks
+  WHERE kind = p_kind
+    AND UPPER(p_name) LIKE pattern
+    AND (exclude_pattern IS NULL OR UPPER(p_name) NOT LIKE exclude_pattern)
+$$ LANGUAGE sql STABLE;
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS brand_rank INTEGER NOT NULL DEFAULT 1000;
+
+CREATE OR REPLACE FUNCTION set_brand_rank()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.brand_rank = product_brand_rank(NEW.name, NEW.category);
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_brand_rank ON products;
+CREATE TRIGGER trg_products_brand_rank
+BEFORE INSERT OR UPDATE OF name, category ON products
+FOR EACH ROW
+EXECUTE FUNCTION set_brand_rank();
+
+-- Изменение правил пересчитывает ранги только у затронутых товаров
+CREATE OR REPLACE FUNCTION refresh_brand_ranks()
+RETURNS TRIGGER AS $$
+BEGIN
+  UPDATE products
+  SET brand_rank = product_brand_rank(name, category)
+  WHERE brand_rank IS DISTINCT FROM product_brand_rank(name, category);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_brand_ranks_refresh ON brand_ranks;
+CREATE TRIGGER trg_brand_ranks_refresh
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON brand_ranks
+FOR EACH STATEMENT
+EXECUTE FUNCTION refresh_brand_ranks();
+
+UPDATE products
+SET brand_rank = product_brand_rank(name, category)
+WHERE brand_rank IS DISTINCT FROM product_brand_rank(name, category);
+
+-- Выдача без длины сортируется по (brand_rank, price_per_unit) внутри склада и профиля
+CREATE INDEX IF NOT EXISTS idx_products_search_rank
+    ON products (warehouse_norm, profile_norm, brand_rank, price_per_unit)
+    WHERE quantity_free > 0;
+
+ANALYZE products;
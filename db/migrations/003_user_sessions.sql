@@ -0,0 +1,11 @@
+-- Состояние диалога с клиентом между перезапусками бота.
+-- Факт верификации хранится в users (telegram_id, phone_number, is_verified),
+-- здесь — текущий шаг диалога и номер, ожидающий подтверждения.
+-- Пишется пачками из session_store.py (write-behind).
+
+CREATE TABLE IF NOT EXISTS user_sessions (
+    telegram_id BIGINT PRIMARY KEY,
+    state SMALLINT, -- WAITING_PHONE=0, WAITING_VERIFICATION=1, WAITING_SEARCH=2 (handlers/auth.py)
+    phone_number VARCHAR(20),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
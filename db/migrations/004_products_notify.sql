@@ -0,0 +1,41 @@
+-- Уведомления об изменении товаров для кэша результатов поиска (search_cache.py).
+-- Полезная нагрузка — затронутые (склад, профиль) в нормализованном виде:
+-- {"warehouse": "Москва", "profile": "8M"}. При UPDATE со сменой склада/профиля
+-- уведомляются обе пары. Одинаковые уведомления внутри транзакции PostgreSQL
+-- доставляет один раз, поэтому массовый импорт даёт по одному сообщению на пару.
+
+CREATE OR REPLACE FUNCTION notify_products_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM pg_notify('products_changed',
+      json_build_object('warehouse', OLD.warehouse_norm, 'profile', OLD.profile_norm)::text);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM pg_notify('products_changed',
+      json_build_object('warehouse', NEW.warehouse_norm, 'profile', NEW.profile_norm)::text);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_notify ON products;
+CREATE TRIGGER trg_products_notify
+AFTER INSERT OR UPDATE OR DELETE ON products
+FOR EACH ROW
+EXECUTE FUNCTION notify_products_changed();
+
+-- TRUNCATE: пустая нагрузка — сбросить кэш целиком
+CREATE OR REPLACE FUNCTION notify_products_truncated()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('products_changed', '');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_notify_truncate ON products;
+CREATE TRIGGER trg_products_notify_truncate
+AFTER TRUNCATE ON products
+FOR EACH STATEMENT
+EXECUTE FUNCTION notify_products_truncated();
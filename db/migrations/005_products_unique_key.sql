@@ -0,0 +1,69 @@
+-- Ключ товара для синхронизации остатков: (article, warehouse, name).
+-- Артикул может быть пустым, поэтому NULLS NOT DISTINCT (PostgreSQL 15+):
+-- две строки без артикула с одинаковыми складом и названием — один товар.
+--
+-- Если дубликаты ключа уже есть, остаётся один экземпляр (последний по id).
+-- Удаляемые строки сначала копируются в products_duplicates_backup (с временем
+-- удаления), а их ключи выводятся через RAISE NOTICE — проверьте их и при
+-- необходимости верните нужные строки из резервной таблицы.
+
+-- Строка целиком хранится в jsonb: таблица не зависит от последующих миграций products
+CREATE TABLE IF NOT EXISTS products_duplicates_backup (
+    id INTEGER NOT NULL,
+    article TEXT,
+    warehouse TEXT,
+    name TEXT,
+    data JSONB NOT NULL,
+    removed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+DO $$
+DECLARE
+  dup RECORD;
+  removed INTEGER;
+BEGIN
+  FOR dup IN
+    SELECT article, warehouse, name, count(*) AS n
+    FROM products
+    GROUP BY article, warehouse, name
+    HAVING count(*) > 1
+  LOOP
+    RAISE NOTICE 'Дубликат ключа (article=%, warehouse=%, name=%): % строк, остаётся последняя по id',
+      dup.article, dup.warehouse, dup.name, dup.n;
+  END LOOP;
+
+  INSERT INTO products_duplicates_backup (id, article, warehouse, name, data)
+  SELECT p.id, p.article, p.warehouse, p.name, to_jsonb(p)
+  FROM products p
+  WHERE EXISTS (
+    SELECT 1 FROM products newer
+    WHERE newer.id > p.id
+      AND newer.article IS NOT DISTINCT FROM p.article
+      AND newer.warehouse IS NOT DISTINCT FROM p.warehouse
+      AND newer.name = p.name
+  );
+
+  DELETE FROM products p
+  USING products newer
+  WHERE newer.id > p.id
+    AND newer.article IS NOT DISTINCT FROM p.article
+    AND newer.warehouse IS NOT DISTINCT FROM p.warehouse
+    AND newer.name = p.name;
+  GET DIAGNOSTICS removed = ROW_COUNT;
+  IF removed > 0 THEN
+    RAISE NOTICE 'Удалено дубликатов: %, копии — в products_duplicates_backup', removed;
+  END IF;
+END;
+$$;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_constraint WHERE conname = 'uq_products_article_warehouse_name'
+  ) THEN
+    ALTER TABLE products
+      ADD CONSTRAINT uq_products_article_warehouse_name
+      UNIQUE NULLS NOT DISTINCT (article, warehouse, name);
+  END IF;
+END;
+$$;
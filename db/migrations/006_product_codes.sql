@@ -0,0 +1,27 @@
+-- Поиск по артикулу и аналогам (в т.ч. кодам других производителей).
+-- Коды нормализуются одинаково в БД и в боте (catalog_index.normalize_code):
+-- верхний регистр, кириллические буквы-двойники → латиница, без пробелов и дефисов.
+-- Артикул и аналоги собраны в одну генерируемую колонку с GIN-индексом, поэтому
+-- любой известный код находится одним запросом codes_norm && ARRAY[...].
+
+CREATE OR REPLACE FUNCTION normalize_code(p_code TEXT)
+RETURNS TEXT AS $$
+  SELECT regexp_replace(translate(upper(p_code), 'АВСЕНКМОРТХУ', 'ABCEHKMOPTXY'), '[[:space:]–—-]+', '', 'g')
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION product_codes(p_article TEXT, p_analogues TEXT[])
+RETURNS TEXT[] AS $$
+  SELECT COALESCE(array_agg(DISTINCT normalize_code(c)), '{}')
+  FROM unnest(array_append(p_analogues, p_article)) AS c
+  WHERE c IS NOT NULL AND normalize_code(c) <> ''
+$$ LANGUAGE sql IMMUTABLE;
+
+ALTER TABLE products
+    ADD COLUMN IF NOT EXISTS codes_norm TEXT[] GENERATED ALWAYS AS (product_codes(article, analogues)) STORED;
+
+-- Поиск по коду, как и основной поиск, показывает только товары в наличии
+CREATE INDEX IF NOT EXISTS idx_products_codes
+    ON products USING GIN (codes_norm)
+    WHERE quantity_free > 0;
+
+ANALYZE products;
@@ -0,0 +1,15 @@
+-- Нечёткий поиск по названию и артикулу для запросов с опечатками
+-- («SPA20000», «800M8», «CONTITEH»). Нужен pg_trgm (входит в стандартный contrib).
+-- Индексы частичные, как idx_products_search: ищутся только товары в наличии.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm
+    ON products USING GIN (name gin_trgm_ops)
+    WHERE quantity_free > 0;
+
+CREATE INDEX IF NOT EXISTS idx_products_article_trgm
+    ON products USING GIN (article gin_trgm_ops)
+    WHERE quantity_free > 0;
+
+ANALYZE products;
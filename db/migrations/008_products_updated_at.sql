@@ -0,0 +1,7 @@
+-- Инкрементальное обновление индекса каталога (catalog_index.py) каждые
+-- CATALOG_REFRESH_INTERVAL секунд выбирает строки с updated_at >= <последнее
+-- изменение> - перекрытие. Без индекса это полный просмотр таблицы.
+
+CREATE INDEX IF NOT EXISTS idx_products_updated_at ON products (updated_at);
+
+ANALYZE products;
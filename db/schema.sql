@@ -3,8 +3,7 @@
 -- Optional: create database manually before running this file
 -- CREATE DATABASE beltimpex WITH ENCODING 'UTF8';
 
--- Enable useful extensions (optional)
--- CREATE EXTENSION IF NOT EXISTS pg_trgm;
+-- Extensions: pg_trgm создаётся в migrations/007_trigram_search.sql
 
 -- Products table
 CREATE TABLE IF NOT EXISTS products (
@@ -66,3 +65,12 @@ CREATE INDEX IF NOT EXISTS idx_products_profile ON products(profile);
 CREATE INDEX IF NOT EXISTS idx_products_length ON products(length);
 CREATE INDEX IF NOT EXISTS idx_products_width ON products(width);
 
+-- Migrations (psql: пути относительно этого файла)
+\ir migrations/001_search_indexes.sql
+\ir migrations/002_brand_ranks.sql
+\ir migrations/003_user_sessions.sql
+\ir migrations/004_products_notify.sql
+\ir migrations/005_products_unique_key.sql
+\ir migrations/006_product_codes.sql
+\ir migrations/007_trigram_search.sql
+\ir migrations/008_products_updated_at.sql
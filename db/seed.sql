@@ -1,8 +1,7 @@
 -- Seed sample data based on provided examples
 
--- Clean
+-- Clean (только товары: users — рабочие данные верификации, их не очищаем)
 TRUNCATE TABLE products RESTART IDENTITY CASCADE;
-TRUNCATE TABLE users RESTART IDENTITY CASCADE;
 
 -- Moscow (синхронные)
 INSERT INTO products (name, article, category, warehouse, quantity_free, quantity_mm, price_per_unit, price_per_mm, width, length, profile, analogues, data_source)
@@ -1,9 +1,31 @@
 import os
+import time
+import asyncio
+import threading
+import contextvars
+import functools
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable, Deque, Iterator
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
 
-def get_connection():
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if (value and value.isdigit()) else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    try:
+        return float(value) if value else default
+    except ValueError:
+        return default
+
+
+def get_dsn() -> str:
     dsn = os.getenv("DATABASE_URL") or os.getenv("POSTGRES_DSN")
     if not dsn:
         # Фолбэк на локальные переменные окружения
@@ -13,6 +35,304 @@ def get_connection():
         user = os.getenv("PGUSER", "postgres")
         password = os.getenv("PGPASSWORD", "postgres")
         dsn = f"dbname={dbname} user={user} password={password} host={host} port={port}"
-    return psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    return dsn
+
+
+class PoolTimeout(Exception):
+    """Не удалось получить соединение из пула за отведённое время."""
+
+
+class _Slot:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn) -> None:
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool.
+
+    Keeps between ``min_size`` and ``max_size`` connections, checks connections
+    that were idle longer than ``check_after`` seconds with ``SELECT 1``, closes
+    connections older than ``max_lifetime`` and idle connections above
+    ``min_size`` unused for ``max_idle`` seconds.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        *,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 10.0,
+        max_idle: float = 300.0,
+        max_lifetime: float = 3600.0,
+        check_after: float = 30.0,
+    ) -> None:
+        self.dsn = dsn
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+
+        self._cond = threading.Condition()
+        self._idle: Deque[_Slot] = deque()
+        self._in_use: Dict[int, _Slot] = {}
+        self._size = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._health_failures = 0
+
+    def _connect(self) -> _Slot:
+        conn = psycopg2.connect(self.dsn, cursor_factory=RealDictCursor)
+        self._created += 1
+        return _Slot(conn)
+
+    def _is_expired(self, slot: _Slot, now: float) -> bool:
+        if slot.conn.closed:
+            return True
+        if self.max_lifetime and now - slot.created_at > self.max_lifetime:
+            return True
+        return False
+
+    def _close_slot(self, slot: _Slot) -> None:
+        try:
+            slot.conn.close()
+        except Exception:
+            pass
+        self._recycled += 1
+
+    def _is_healthy(self, slot: _Slot, now: float) -> bool:
+        if now - slot.last_used < self.check_after:
+            return True
+        try:
+            with slot.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            slot.conn.rollback()
+            return True
+        except Exception:
+            self._health_failures += 1
+            return False
+
+    def warm(self) -> None:
+        """Открывает соединения до ``min_size``."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                slot = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(slot)
+                self._cond.notify()
+
+    def acquire(self) -> _Slot:
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = 0.0
+        while True:
+            slot: Optional[_Slot] = None
+            create = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Пул соединений закрыт")
+                    now = time.monotonic()
+                    while self._idle:
+                        candidate = self._idle.pop()
+                        if self._is_expired(candidate, now):
+                            self._size -= 1
+                            self._close_slot(candidate)
+                            continue
+                        slot = candidate
+                        break
+                    if slot is not None:
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"Нет свободных соединений за {self.timeout} с")
+                    if not waited:
+                        waited = True
+                        wait_started = now
+                        self._waits += 1
+                    self._cond.wait(remaining)
+                if waited:
+                    self._wait_seconds += time.monotonic() - wait_started
+                    waited = False
+
+            if create:
+                try:
+                    slot = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif slot is not None and not self._is_healthy(slot, time.monotonic()):
+                with self._cond:
+                    self._size -= 1
+                    self._close_slot(slot)
+                continue
+
+            with self._cond:
+                self._in_use[id(slot.conn)] = slot
+                self._checkouts += 1
+            return slot
+
+    def release(self, slot: _Slot, *, discard: bool = False) -> None:
+        now = time.monotonic()
+        with self._cond:
+            self._in_use.pop(id(slot.conn), None)
+            if discard or self._closed or self._is_expired(slot, now):
+                self._size -= 1
+                self._close_slot(slot)
+            else:
+                slot.last_used = now
+                self._idle.append(slot)
+            self._recycle_idle(now)
+            self._cond.notify()
+
+    def _recycle_idle(self, now: float) -> None:
+        # Старые соединения лежат в начале очереди (выдаём с конца — LIFO)
+        while self._idle and self._size > self.min_size:
+            oldest = self._idle[0]
+            if now - oldest.last_used <= self.max_idle:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._close_slot(oldest)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        slot = self.acquire()
+        discard = False
+        try:
+            yield slot.conn
+            slot.conn.commit()
+        except BaseException:
+            try:
+                slot.conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.release(slot, discard=discard or bool(slot.conn.closed))
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._close_slot(self._idle.pop())
+            self._size = len(self._in_use)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            slots = list(self._idle) + list(self._in_use.values())
+            ages = [now - s.created_at for s in slots]
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_seconds": round(self._wait_seconds, 6),
+                "timeouts": self._timeouts,
+                "connections_created": self._created,
+                "connections_closed": self._recycled,
+                "health_check_failures": self._health_failures,
+                "connection_age_max": round(max(ages), 3) if ages else 0.0,
+                "connection_age_avg": round(sum(ages) / len(ages), 3) if ages else 0.0,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_init_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _init_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    get_dsn(),
+                    min_size=_env_int("PG_POOL_MIN", 1),
+                    max_size=_env_int("PG_POOL_MAX", 10),
+                    timeout=_env_float("PG_POOL_TIMEOUT", 10.0),
+                    max_idle=_env_float("PG_POOL_MAX_IDLE", 300.0),
+                    max_lifetime=_env_float("PG_POOL_MAX_LIFETIME", 3600.0),
+                    check_after=_env_float("PG_POOL_CHECK_AFTER", 30.0),
+                )
+    return _pool
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        max_workers = get_pool().max_size
+        with _init_lock:
+            if _executor is None:
+                # Потоков не больше, чем соединений: задачи не ждут пул внутри потока
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+    return _executor
+
+
+def get_connection():
+    """Соединение из пула: ``with get_connection() as conn: ...``.
+
+    При выходе транзакция фиксируется (или откатывается при исключении),
+    а соединение возвращается в пул.
+    """
+    return get_pool().connection()
+
+
+async def run_db(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Выполняет блокирующую функцию работы с БД в ограниченном пуле потоков.
+
+    Функция видит контекст вызывающего (contextvars): этапы span() внутри неё
+    (sql_execute, sql_fetch) попадают в запись query_log текущего сообщения."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+def pool_stats() -> Dict[str, Any]:
+    return get_pool().stats() if _pool is not None else {}
 
 
+def close_pool() -> None:
+    global _pool, _executor
+    with _init_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _pool is not None:
+            _pool.close()
+            _pool = None
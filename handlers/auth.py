@@ -1,6 +1,7 @@
 import re
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup  # pyright: ignore
 from telegram.ext import ContextTypes
+from session_store import sessions
 
 
 # Состояния
@@ -64,9 +65,17 @@ async def handle_verification_callback(update: Update, context: ContextTypes.DEF
     query = update.callback_query
     await query.answer()
 
+    user_id = query.from_user.id
+    session = sessions.get(user_id)
+    # Номер мог быть введён до перезапуска бота — берём его из сессии
+    phone = context.user_data.get('phone') or (session.phone if session else None)
+
     if query.data == "verified_yes":
         context.user_data['verified'] = True
         context.user_data['state'] = None
+        if phone:
+            context.user_data['phone'] = phone
+        sessions.update(user_id, phone=phone, verified=True, state=None)
         await query.edit_message_text(
             "✅ Верификация успешно завершена!\n\n"
             "🎉 Добро пожаловать! Вы получили доступ к поиску товаров.\n\n"
@@ -88,5 +97,34 @@ async def handle_verification_callback(update: Update, context: ContextTypes.DEF
             "После регистрации вы сможете использовать все возможности бота."
         )
         context.user_data.clear()
+        sessions.update(user_id, phone=None, verified=False, state=None)
+
+
+async def restore_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Перед обработчиками (group=-1): восстанавливает user_data из хранилища сессий
+    после перезапуска бота, чтобы клиент не проходил верификацию заново."""
+    user = update.effective_user
+    if user is None or 'verified' in context.user_data:
+        return
+    session = sessions.get(user.id)
+    if session is None:
+        return
+    context.user_data['verified'] = session.verified
+    context.user_data['state'] = session.state
+    if session.phone:
+        context.user_data['phone'] = session.phone
+
+
+async def remember_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """После обработчиков (group=1): сохраняет изменения верификации и шага диалога."""
+    user = update.effective_user
+    if user is None:
+        return
+    sessions.update(
+        user.id,
+        phone=context.user_data.get('phone'),
+        verified=bool(context.user_data.get('verified', False)),
+        state=context.user_data.get('state'),
+    )
 
 
@@ -66,6 +66,8 @@ async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             "  Примеры: 8008M=30, 177814M=55, 240L=30\n\n"
             "• <b>Клиновые ремни</b> (штучные): сначала профиль, затем длина (дюйм./расч.).\n"
             "  Примеры: B85, B2000, SPB2000, A79, A800, 8V2000\n\n"
+            "• <b>Несколько артикулов</b>: через запятую или с новой строки.\n"
+            "  Пример: 8008M, SPA2000, B85, 177814M=55\n\n"
         )
         back = await get_back_to_menu_button()
         await query.edit_message_text(rules_message, reply_markup=back, parse_mode=ParseMode.HTML)
@@ -1,10 +1,34 @@
+from typing import Dict, Optional, List
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup  # pyright: ignore
 from telegram.ext import ContextTypes
 from handlers.auth import WAITING_PHONE, WAITING_VERIFICATION, WAITING_SEARCH, handle_phone_number
 from handlers.menu import show_main_menu
-from search_service import parse_query, search_products, format_search_results, search_products_structured
-from ai_service import ai_extract_parameters
-import re
+from search_service import (
+    parse_query,
+    extract_token,
+    build_request,
+    build_structured_request,
+    search_async,
+    search_nearest_async,
+    analogue_codes,
+    search_analogues_async,
+    search_fuzzy_async,
+    format_search_page,
+    format_search_results,
+    SearchRequest,
+    SearchPage,
+    split_batch,
+    is_batch,
+    search_batch_async,
+    format_batch_results,
+    BATCH_MAX_ITEMS,
+)
+from ai_service import ai_extract_parameters_async, ai_extract_parameters_batch_async
+from query_normalizer import normalize_query
+from metrics import span, inc
+import query_log
+from query_log import note
+from rate_limit import chat_limiter, RATE_LIMIT_ENABLED, ADMIT, DUPLICATE, LIMITED
 
 try:
     from config import MANAGER_CONTACTS as MANAGER_CONTACTS_TEXT
@@ -12,7 +36,165 @@ except ImportError:
     MANAGER_CONTACTS_TEXT = "Контакты менеджера не настроены."
 
 
+# Сколько последних поисков пользователя можно листать кнопками под их сообщениями
+SEARCH_HISTORY = 20
+
+STALE_SEARCH_TEXT = "Результаты поиска устарели. Введите запрос заново."
+
+
+def _remember_search(context: ContextTypes.DEFAULT_TYPE, search: Dict) -> int:
+    """Сохраняет параметры поиска для листания и возвращает его номер (попадает в callback_data)."""
+    search_id = context.user_data.get('search_seq', 0) + 1
+    context.user_data['search_seq'] = search_id
+    searches = context.user_data.setdefault('searches', {})
+    searches[search_id] = search
+    for old_id in [sid for sid in searches if sid <= search_id - SEARCH_HISTORY]:
+        del searches[old_id]
+    return search_id
+
+
+def _search_controls(page: Optional[SearchPage] = None, search_id: Optional[int] = None) -> InlineKeyboardMarkup:
+    keyboard = []
+    if page is not None and search_id is not None:
+        nav = []
+        if page.offset > 0:
+            prev_offset = max(0, page.offset - page.limit)
+            nav.append(InlineKeyboardButton("⬅️ Пред.", callback_data=f"search_page:{search_id}:{prev_offset}"))
+        if page.has_more:
+            next_offset = page.offset + page.limit
+            nav.append(InlineKeyboardButton("➡️ Далее", callback_data=f"search_page:{search_id}:{next_offset}"))
+        if nav:
+            keyboard.append(nav)
+    keyboard.append([
+        InlineKeyboardButton("📋 Меню", callback_data="menu_back"),
+        InlineKeyboardButton("🔎 Продолжить поиск", callback_data="search_continue"),
+    ])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def _reply(update: Update, text: str, **kwargs) -> None:
+    with span("reply"):
+        await update.message.reply_text(text, **kwargs)
+
+
+async def _reply_page(update: Update, context: ContextTypes.DEFAULT_TYPE, req: SearchRequest, page: SearchPage) -> None:
+    await _reply_search_page(update, context, req.as_dict(), page)
+
+
+async def _reply_search_page(update: Update, context: ContextTypes.DEFAULT_TYPE, search: Dict, page: SearchPage) -> None:
+    # Параметры поиска нужны для кнопок листания результатов
+    search_id = _remember_search(context, search)
+    with span("format"):
+        text = format_search_page(page)
+    await _reply(update, text, reply_markup=_search_controls(page, search_id))
+
+
+async def _reply_nearest(update: Update, req: SearchRequest, *, path: str) -> bool:
+    """Точный поиск пуст — предлагаем ближайшие по длине товары того же профиля."""
+    with span("nearest"):
+        rows = await search_nearest_async(req)
+    if not rows:
+        return False
+    inc("bot_search_nearest_total", path=path)
+    note(nearest=len(rows))
+    with span("format"):
+        text = "Точного совпадения нет. Ближайшие размеры в наличии:\n" + format_search_results(rows)
+    await _reply(update, text, reply_markup=_search_controls())
+    return True
+
+
+def _page_rows(page: SearchPage) -> int:
+    return page.total if page.total is not None else len(page.rows)
+
+
+async def _reply_analogues(update: Update, context: ContextTypes.DEFAULT_TYPE, codes: List[str]) -> int:
+    """Артикул или код аналога (в т.ч. другого производителя) — товары из каталога по кодам.
+    Возвращает число найденных товаров; 0 — ответ не отправлен."""
+    if not codes:
+        return 0
+    with span("analogue"):
+        page = await search_analogues_async(codes)
+    if not page.rows:
+        return 0
+    await _reply_search_page(update, context, {"codes": codes}, page)
+    return _page_rows(page)
+
+
+async def _search_and_reply(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    req: SearchRequest,
+    *,
+    path: str,
+    codes: Optional[List[str]] = None,
+) -> None:
+    """``codes`` — коды из запроса для поиска по артикулу/аналогам, если по профилю
+    и длине ничего нет (грамматика принимает и чужие коды: «6PK1200» → PK1200)."""
+    with span("search"):
+        page = await search_async(req)
+    if query_log.enabled():
+        note(request=req.as_dict(), rows=_page_rows(page))
+    if not page.rows:
+        inc("bot_search_empty_total", path=path)
+        found = await _reply_analogues(update, context, codes or [])
+        if found:
+            inc("bot_search_analogue_total", path=path)
+            note(analogue=found)
+            return
+        if await _reply_nearest(update, req, path=path):
+            return
+    await _reply_page(update, context, req, page)
+
+
+def _count_path(path: str) -> None:
+    inc("bot_search_path_total", path=path)
+    note(path=path)
+
+
+def _ai_result_usable(ai) -> bool:
+    return bool(ai and ai.get("kind") and (ai.get("profile") or ai.get("length_mm")))
+
+
+async def _reply_batch(update: Update, tokens: List[str], leftovers: List[str]) -> None:
+    """Ответ на список артикулов: локально разобранные и нераспознанные фрагменты
+    (одним запросом к ИИ) ищутся за один проход, ответ сгруппирован по артикулам."""
+    tokens = tokens[:BATCH_MAX_ITEMS]
+    leftovers = leftovers[:BATCH_MAX_ITEMS - len(tokens)]
+
+    labels: List[str] = list(tokens)
+    reqs: List[Optional[SearchRequest]] = [build_request(t) for t in tokens]
+    ai_results = []
+    if leftovers:
+        with span("ai"):
+            ai_results = await ai_extract_parameters_batch_async(leftovers)
+    for text, ai in zip(leftovers, ai_results):
+        labels.append(text)
+        if _ai_result_usable(ai):
+            reqs.append(build_structured_request(
+                kind=ai.get("kind") or "unknown",
+                length_mm=ai.get("length_mm"),
+                profile=(ai.get("profile") or None),
+                width_mm=ai.get("width_mm"),
+                original_text=text,
+            ))
+        else:
+            reqs.append(None)
+
+    with span("search"):
+        found = iter(await search_batch_async([r for r in reqs if r is not None]))
+    results = [next(found) if r is not None else None for r in reqs]
+    with span("format"):
+        text = format_batch_results(labels, results)
+    await _reply(update, text, reply_markup=_search_controls())
+
+
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    with query_log.trace(update.effective_chat.id, update.message.text):
+        with span("total"):
+            await _handle_text_message(update, context)
+
+
+async def _handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     state = context.user_data.get('state')
     verified = context.user_data.get('verified', False)
     # print(f"[DEBUG] handle_text_message вызван: verified={verified}, state={state}, WAITING_SEARCH={WAITING_SEARCH}")
@@ -21,86 +203,20 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         if state == WAITING_SEARCH:
             query_text = update.message.text.strip()
             # print(f"[DEBUG] Получен запрос: {query_text}")
-            parsed = parse_query(query_text)
-            # print(f"[DEBUG] Парсер вернул: kind={parsed.kind}, length={parsed.length_mm}, profile={parsed.profile}, width={parsed.width_mm}")
-            if parsed.kind == "unknown":
-                # print(f"[DEBUG] Запрос распознан как unknown, проверяю fallback regex")
-                # Попытка вычленить валидный токен из свободного текста
-                # Ищем более полные паттерны: 8008M, SPA2000, SPA 2000, B85, 177814M=55
-                # Убираем пробелы для поиска токена
-                text_no_spaces = query_text.upper().replace(" ", "")
-                m = re.search(r"(\d+[A-Z0-9]+(?:=\d+)?|[A-Z]+\d+(?:=\d+)?)", text_no_spaces)
-                if m:
-                    cleaned = m.group(1)
-                    # print(f"[DEBUG] Regex нашел токен: {cleaned}")
-                    reparsed = parse_query(cleaned)
-                    # print(f"[DEBUG] Перепарсинг токена вернул: kind={reparsed.kind}, length={reparsed.length_mm}, profile={reparsed.profile}")
-                    # Проверяем, что токен действительно валидный и содержит профиль (не цифру) или специфичный формат
-                    # Профиль должен быть буквами (8M, 14M, SPA, B и т.д.), а не цифрой
-                    has_valid_profile = reparsed.profile and not reparsed.profile.isdigit() and len(reparsed.profile) > 0
-                    if reparsed.kind != "unknown" and (has_valid_profile or "=" in cleaned):
-                        # print(f"[DEBUG] Токен валидный и содержит профиль/ширину, выполняю поиск напрямую без ИИ")
-                        rows = search_products(cleaned)
-                        controls = InlineKeyboardMarkup([
-                            [
-                                InlineKeyboardButton("📋 Меню", callback_data="menu_back"),
-                                InlineKeyboardButton("🔎 Продолжить поиск", callback_data="search_continue"),
-                            ]
-                        ])
-                        await update.message.reply_text(format_search_results(rows), reply_markup=controls)
-                        return
-                    # else: токен найден, но неполный (нет профиля), вызываю ИИ
-                # else: regex не нашел валидный токен, вызываю ИИ
-                # print(f"[AI] Вызываю ИИ для запроса: {query_text}")
-                ai = ai_extract_parameters(query_text)
-                # print(f"[AI] Результат ИИ: {ai}")
-                if ai and ai.get("kind") and (ai.get("profile") or ai.get("length_mm")):
-                    # Логирование 
-                    # print(f"[AI] Извлечено: kind={ai.get('kind')}, length={ai.get('length_mm')}, profile={ai.get('profile')}, width={ai.get('width_mm')}")
-                    rows = search_products_structured(
-                        kind=ai.get("kind") or "unknown",
-                        length_mm=ai.get("length_mm"),
-                        profile=(ai.get("profile") or None),
-                        width_mm=ai.get("width_mm"),
-                        original_text=query_text,
-                    )
-                    # print(f"[AI] Найдено результатов: {len(rows)}")
-                    if not rows:
-                        # Если товар не найден после поиска с ИИ, выдаем контакты менеджера
-                        controls = InlineKeyboardMarkup([
-                            [
-                                InlineKeyboardButton("📋 Меню", callback_data="menu_back"),
-                                InlineKeyboardButton("🔎 Продолжить поиск", callback_data="search_continue"),
-                            ]
-                        ])
-                        await update.message.reply_text(MANAGER_CONTACTS_TEXT, reply_markup=controls)
-                        return
-                    controls = InlineKeyboardMarkup([
-                        [
-                            InlineKeyboardButton("📋 Меню", callback_data="menu_back"),
-                            InlineKeyboardButton("🔎 Продолжить поиск", callback_data="search_continue"),
-                        ]
-                    ])
-                    await update.message.reply_text(format_search_results(rows), reply_markup=controls)
+            if RATE_LIMIT_ENABLED:
+                verdict = chat_limiter.admit(update.effective_chat.id, query_text)
+                if verdict != ADMIT:
+                    # Переотправка того же текста или слишком частые запросы — БД и ИИ не трогаем
+                    inc("bot_rate_limited_total", reason="duplicate" if verdict == DUPLICATE else "limit")
+                    note(path=verdict)
+                    if verdict == LIMITED:
+                        await _reply(update, "Слишком много запросов подряд. Подождите несколько секунд и повторите.")
+                    elif verdict == DUPLICATE:
+                        await _reply(update, "Этот запрос только что обработан — результаты выше.")
                     return
-                else:
-                    # print(f"[AI] ИИ не вернул валидные параметры или вернул None")
-                    await update.message.reply_text(
-                        "Неверный формат запроса. Примеры: 8008M, 177814M=55, SPA2000, B85\n"
-                        "Попробуйте изменить запрос в соответствии с правилами или напишите 'оператор', и мы вам поможем"
-                    )
-                    return
-            else:
-                # print(f"[DEBUG] Парсер распознал запрос как валидный (kind={parsed.kind}), выполняю поиск напрямую")
-                rows = search_products(query_text)
-                # print(f"[DEBUG] Найдено результатов: {len(rows)}")
-            controls = InlineKeyboardMarkup([
-                [
-                    InlineKeyboardButton("📋 Меню", callback_data="menu_back"),
-                    InlineKeyboardButton("🔎 Продолжить поиск", callback_data="search_continue"),
-                ]
-            ])
-            await update.message.reply_text(format_search_results(rows), reply_markup=controls)
+            await _handle_search(update, context, query_text)
+            if RATE_LIMIT_ENABLED:
+                chat_limiter.replied(update.effective_chat.id, query_text)
             return
         await show_main_menu(update, context)
         return
@@ -112,3 +228,132 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.message.reply_text("Для начала работы используйте команду /start")
 
 
+async def _handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE, query_text: str) -> None:
+    with span("parse"):
+        parsed = parse_query(query_text)
+    if query_log.enabled():
+        note(parsed={"kind": parsed.kind, "profile": parsed.profile, "length_mm": parsed.length_mm, "width_mm": parsed.width_mm})
+    # print(f"[DEBUG] Парсер вернул: kind={parsed.kind}, length={parsed.length_mm}, profile={parsed.profile}, width={parsed.width_mm}")
+    if parsed.kind == "unknown":
+        tokens, leftovers = split_batch(query_text)
+        # Артикул или код аналога (в т.ч. другого производителя) — сразу товары из каталога.
+        # Только если в запросе не больше одного кода: список идёт в пакетный поиск
+        found = await _reply_analogues(update, context, analogue_codes(query_text) if len(tokens) <= 1 else [])
+        if found:
+            _count_path("analogue")
+            note(rows=found)
+            return
+        # Список артикулов («8008M, SPA2000, B85») — пакетный поиск
+        if is_batch(query_text, tokens, leftovers):
+            _count_path("batch")
+            note(items=len(tokens) + len(leftovers))
+            await _reply_batch(update, tokens, leftovers)
+            return
+        # Типовые формулировки («ремень SPA 2000», «8M 800 мм», «B-85») — правилами, без ИИ.
+        # Идёт до extract_token: тот склеил бы «8M 800» в код 8M800
+        with span("normalize"):
+            norm = normalize_query(query_text)
+        if _ai_result_usable(norm):
+            _count_path("rules")
+            note(params=norm)
+            req = build_structured_request(
+                kind=norm["kind"],
+                length_mm=norm["length_mm"],
+                profile=norm["profile"],
+                width_mm=norm["width_mm"],
+                original_text=query_text,
+            )
+            await _search_and_reply(update, context, req, path="rules")
+            return
+        # print(f"[DEBUG] Запрос распознан как unknown, проверяю fallback regex")
+        # Попытка вычленить валидный токен из свободного текста
+        # Ищем более полные паттерны: 8008M, SPA2000, SPA 2000, B85, 177814M=55
+        with span("regex"):
+            cleaned = extract_token(query_text)
+        if cleaned:
+            # print(f"[DEBUG] Токен валидный и содержит профиль/ширину, выполняю поиск напрямую без ИИ")
+            _count_path("regex")
+            req = build_request(cleaned)
+            await _search_and_reply(update, context, req, path="regex")
+            return
+        # Опечатки в артикуле или названии («SPA20000», «CONTITEH») — похожие товары без ИИ
+        with span("fuzzy"):
+            rows = await search_fuzzy_async(query_text)
+        if rows:
+            _count_path("fuzzy")
+            note(rows=len(rows))
+            with span("format"):
+                text = "Возможно, вы имели в виду:\n" + format_search_results(rows)
+            await _reply(update, text, reply_markup=_search_controls())
+            return
+        # else: валидный токен не найден, вызываю ИИ
+        # print(f"[AI] Вызываю ИИ для запроса: {query_text}")
+        with span("ai"):
+            ai = await ai_extract_parameters_async(query_text)
+        # print(f"[AI] Результат ИИ: {ai}")
+        note(params=ai)
+        if _ai_result_usable(ai):
+            # Логирование
+            # print(f"[AI] Извлечено: kind={ai.get('kind')}, length={ai.get('length_mm')}, profile={ai.get('profile')}, width={ai.get('width_mm')}")
+            _count_path("ai")
+            req = build_structured_request(
+                kind=ai.get("kind") or "unknown",
+                length_mm=ai.get("length_mm"),
+                profile=(ai.get("profile") or None),
+                width_mm=ai.get("width_mm"),
+                original_text=query_text,
+            )
+            with span("search"):
+                page = await search_async(req)
+            if query_log.enabled():
+                note(request=req.as_dict(), rows=_page_rows(page))
+            # print(f"[AI] Найдено результатов: {page.total}")
+            if not page.rows:
+                # Если товар не найден и ближайших размеров нет, выдаем контакты менеджера
+                inc("bot_search_empty_total", path="ai")
+                if await _reply_nearest(update, req, path="ai"):
+                    return
+                await _reply(update, MANAGER_CONTACTS_TEXT, reply_markup=_search_controls())
+                return
+            await _reply_page(update, context, req, page)
+            return
+        else:
+            # print(f"[AI] ИИ не вернул валидные параметры или вернул None")
+            _count_path("no_result")
+            await _reply(
+                update,
+                "Неверный формат запроса. Примеры: 8008M, 177814M=55, SPA2000, B85\n"
+                "Попробуйте изменить запрос в соответствии с правилами или напишите 'оператор', и мы вам поможем"
+            )
+            return
+    # print(f"[DEBUG] Парсер распознал запрос как валидный (kind={parsed.kind}), выполняю поиск напрямую")
+    _count_path("direct")
+    await _search_and_reply(update, context, build_request(query_text), path="direct", codes=analogue_codes(query_text))
+
+
+async def handle_search_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Кнопки «Пред.»/«Далее» под результатами поиска (callback_data ``search_page:<номер поиска>:<offset>``).
+
+    Номер поиска привязывает кнопки к своему сообщению: листание старого ответа
+    не подменяет его результатами более нового запроса."""
+    query = update.callback_query
+    search = None
+    offset = 0
+    try:
+        _, search_id, offset_text = query.data.split(":", 2)
+        search = context.user_data.get('searches', {}).get(int(search_id))
+        offset = max(0, int(offset_text))
+    except ValueError:
+        pass
+    if not context.user_data.get('verified', False) or not search:
+        # Сообщение не трогаем: его результаты остаются на экране
+        await query.answer(STALE_SEARCH_TEXT)
+        return
+    await query.answer()
+
+    if "codes" in search:
+        # Листание результатов поиска по артикулу/аналогам
+        page = await search_analogues_async(search["codes"], offset=offset)
+    else:
+        page = await search_async(SearchRequest.from_dict(search), offset=offset)
+    await query.edit_message_text(format_search_page(page), reply_markup=_search_controls(page, int(search_id)))
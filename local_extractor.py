@@ -0,0 +1,391 @@
+"""Локальный извлекатель параметров ремня: kind, profile, length_mm, width_mm.
+
+Замена вызова LLM для типовых свободных запросов. Три линейные модели
+(многоклассовая логистическая регрессия) на символьных n-граммах:
+  * kind по всему тексту;
+  * profile по всему тексту (класс "" — профиль не указан);
+  * роль каждого числа в тексте (длина, длина в см, ширина, прочее) по его
+    окружению — упрощённый теггер.
+Обучается на записанных парах «запрос → параметры» (кэш ИИ в SQLite, JSONL)
+и сохраняется в JSON. Ответ в формате ``ai_extract_parameters``; если
+уверенность ниже порога, ``extract`` возвращает None и запрос уходит в LLM.
+
+Обучение:
+    python local_extractor.py --cache ai_cache.sqlite --jsonl pairs.jsonl --out local_model.json
+"""
+import os
+import re
+import json
+import math
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from query_normalizer import HOMOGLYPHS
+
+
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "local_model.json")
+# Минимальная уверенность (наименьшая из kind, profile и ролей чисел)
+LOCAL_THRESHOLD = float(os.getenv("LOCAL_AI_THRESHOLD", "0.8"))
+
+KINDS = ("vbelt", "synchronous", "unknown")
+ROLES = ("length", "length_cm", "width", "other")
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+_WORD = re.compile(r"[0-9A-ZА-Я]+")
+# Длинные числа (длина, ширина) в признаках текста заменяем на #: профиль
+# определяют буквы и короткие числа («8M», «3V», «T5»), а не конкретный размер
+_LONG_DIGITS = re.compile(r"\d{3,}")
+# Профиль, слитный с длиной («T51790», «AT102005»): буквы и первые цифры
+_GLUED = re.compile(r"([A-Z]+)(\d{4,})")
+
+
+def _prepare(text: str) -> str:
+    return text.upper().replace("Ё", "Е").translate(HOMOGLYPHS)
+
+
+def _text_features(text: str) -> List[str]:
+    feats = []
+    for m in _GLUED.finditer(text):
+        letters, digits = m.groups()
+        feats.extend(f"lead{k}={letters}{digits[:k]}" for k in (1, 2))
+    for word in _WORD.findall(_LONG_DIGITS.sub("#", text)):
+        feats.append("w=" + word)
+        padded = f"<{word}>"
+        for n in (2, 3, 4):
+            feats.extend("g=" + padded[i:i + n] for i in range(len(padded) - n + 1))
+    return feats
+
+
+def _candidates(text: str) -> List[Tuple[int, float, List[str]]]:
+    """Числа текста как кандидаты на длину/ширину: (номер числа, значение, признаки).
+
+    У числа, слитного с буквами слева и длиной от 4 цифр, кандидатами будут и
+    хвосты без первой или первых двух цифр: в «T51790» длина — 1790.
+    """
+    numbers = list(_NUMBER.finditer(text))
+    candidates = []
+    for i, m in enumerate(numbers):
+        value = float(m.group(0).replace(",", "."))
+        feats = _number_features(text, m, i, len(numbers))
+        candidates.append((i, value, feats + ["split=0"]))
+        digits = m.group(0)
+        if digits.isdigit() and len(digits) >= 4 and text[m.start() - 1:m.start()].isalpha():
+            for k in (1, 2):
+                candidates.append((i, float(digits[k:]), feats + [f"split={k}", f"head={digits[:k]}", f"tail_digits={len(digits) - k}"]))
+    return candidates
+
+
+def _number_features(text: str, m: "re.Match", index: int, total: int) -> List[str]:
+    before = text[:m.start()]
+    after = text[m.end():]
+    prev_words = _WORD.findall(_LONG_DIGITS.sub("#", before))[-2:]
+    next_words = _WORD.findall(_LONG_DIGITS.sub("#", after))[:1]
+    digits = m.group(0).split(".")[0].split(",")[0]
+    value = float(m.group(0).replace(",", "."))
+    feats = [
+        f"digits={len(digits)}",
+        f"mag={int(math.log10(value)) if value >= 1 else -1}",
+        f"idx={min(index, 3)}",
+        f"last={index == total - 1}",
+        f"dec={'.' in m.group(0) or ',' in m.group(0)}",
+        "glued_prev=" + (before[-1:] if before[-1:].isalpha() else "_"),
+        "glued_next=" + (after[:1] if after[:1].isalpha() else "_"),
+        "prev_sym=" + (before.rstrip()[-1:] or "^"),
+        "next_sym=" + (after.lstrip()[:1] or "$"),
+    ]
+    feats.extend(f"prev{i}={w}" for i, w in enumerate(reversed(prev_words)))
+    feats.extend(f"next=" + w for w in next_words)
+    if prev_words:
+        feats.append("prev0_3=" + prev_words[-1][:3])
+    if next_words:
+        feats.append("next_3=" + next_words[0][:3])
+    return feats
+
+
+class _Softmax:
+    """Многоклассовая логистическая регрессия на разреженных бинарных признаках."""
+
+    def __init__(self, classes: Sequence[str]) -> None:
+        self.classes = list(classes)
+        self.bias = [0.0] * len(self.classes)
+        self.weights: Dict[str, List[float]] = {}
+
+    def proba(self, feats: Iterable[str]) -> List[float]:
+        scores = list(self.bias)
+        for f in feats:
+            w = self.weights.get(f)
+            if w is not None:
+                scores = [s + x for s, x in zip(scores, w)]
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def predict(self, feats: Iterable[str]) -> Tuple[str, float]:
+        probs = self.proba(feats)
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return self.classes[best], probs[best]
+
+    def fit(self, samples: List[Tuple[List[str], str]], epochs: int, rate: float, rng: random.Random) -> None:
+        index = {c: i for i, c in enumerate(self.classes)}
+        size = len(self.classes)
+        order = list(range(len(samples)))
+        for epoch in range(epochs):
+            rng.shuffle(order)
+            lr = rate / (1 + epoch)
+            for i in order:
+                feats, label = samples[i]
+                probs = self.proba(feats)
+                probs[index[label]] -= 1.0
+                grad = [lr * g for g in probs]
+                self.bias = [b - g for b, g in zip(self.bias, grad)]
+                for f in set(feats):
+                    w = self.weights.get(f)
+                    if w is None:
+                        w = self.weights[f] = [0.0] * size
+                    for k in range(size):
+                        w[k] -= grad[k]
+
+    def to_dict(self, precision: int = 4) -> Dict[str, Any]:
+        # Почти нулевые веса не сохраняем — модель в разы меньше, точность та же
+        weights = {}
+        for f, w in self.weights.items():
+            rounded = [round(x, precision) for x in w]
+            if any(rounded):
+                weights[f] = rounded
+        return {"classes": self.classes, "bias": [round(b, precision) for b in self.bias], "weights": weights}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_Softmax":
+        model = cls(data["classes"])
+        model.bias = list(data["bias"])
+        model.weights = {f: list(w) for f, w in data["weights"].items()}
+        return model
+
+
+def _same(a: Any, b: float) -> bool:
+    try:
+        return a is not None and abs(float(a) - b) < 1e-6
+    except (TypeError, ValueError):
+        return False
+
+
+def _role(value: float, params: Dict[str, Any]) -> str:
+    length = params.get("length_mm")
+    if _same(length, value):
+        return "length"
+    if _same(length, value * 10):
+        return "length_cm"
+    if _same(params.get("width_mm"), value):
+        return "width"
+    return "other"
+
+
+class LocalExtractor:
+    def __init__(self, kind: _Softmax, profile: _Softmax, role: _Softmax, trained_on: int = 0) -> None:
+        self.kind = kind
+        self.profile = profile
+        self.role = role
+        self.trained_on = trained_on
+
+    @classmethod
+    def train(cls, pairs: List[Tuple[str, Dict[str, Any]]], *, epochs: int = 6, rate: float = 0.5, seed: int = 1) -> "LocalExtractor":
+        """Обучает модели на парах (текст запроса, параметры в формате ИИ)."""
+        rng = random.Random(seed)
+        kind_samples: List[Tuple[List[str], str]] = []
+        profile_samples: List[Tuple[List[str], str]] = []
+        role_samples: List[Tuple[List[str], str]] = []
+        profiles = set()
+        for text, params in pairs:
+            text = _prepare(text)
+            feats = _text_features(text)
+            kind = params.get("kind") if params.get("kind") in KINDS else "unknown"
+            profile = str(params.get("profile") or "").upper()
+            profiles.add(profile)
+            kind_samples.append((feats, kind))
+            profile_samples.append((feats, profile))
+            for _, value, number_feats in _candidates(text):
+                role_samples.append((number_feats, _role(value, params)))
+
+        kind_model = _Softmax(KINDS)
+        kind_model.fit(kind_samples, epochs, rate, rng)
+        profile_model = _Softmax(sorted(profiles | {""}))
+        profile_model.fit(profile_samples, epochs, rate, rng)
+        role_model = _Softmax(ROLES)
+        role_model.fit(role_samples, epochs, rate, rng)
+        return cls(kind_model, profile_model, role_model, trained_on=len(pairs))
+
+    def predict(self, user_text: str) -> Tuple[Dict[str, Any], float]:
+        """Параметры и уверенность — наименьшая вероятность среди решений модели."""
+        text = _prepare(user_text)
+        feats = _text_features(text)
+        kind, kind_p = self.kind.predict(feats)
+        profile, profile_p = self.profile.predict(feats)
+        confidence = min(kind_p, profile_p)
+
+        tagged = []
+        for i, value, number_feats in _candidates(text):
+            tagged.append((i, value, dict(zip(self.role.classes, self.role.proba(number_feats)))))
+
+        length_mm: Optional[float] = None
+        width_mm: Optional[float] = None
+        used = -1
+        if tagged:
+            def length_p(t) -> float:
+                return max(t[2]["length"], t[2]["length_cm"])
+
+            best = max(tagged, key=length_p)
+            p = length_p(best)
+            if p >= 0.5:
+                probs = best[2]
+                length_mm = best[1] * 10 if probs["length_cm"] > probs["length"] else best[1]
+                used = best[0]
+            confidence = min(confidence, max(p, 1 - p))
+            # Ширина — другое число, не то, из которого взята длина
+            rest = [t for t in tagged if t[0] != used]
+            if rest:
+                best = max(rest, key=lambda t: t[2]["width"])
+                p = best[2]["width"]
+                if p >= 0.5:
+                    width_mm = best[1]
+                confidence = min(confidence, max(p, 1 - p))
+
+        result = {
+            "kind": kind,
+            "length_mm": length_mm,
+            "profile": profile or None,
+            "width_mm": width_mm,
+        }
+        return result, confidence
+
+    def save(self, path: str) -> None:
+        payload = {
+            "version": 1,
+            "trained_on": self.trained_on,
+            "kind": self.kind.to_dict(),
+            "profile": self.profile.to_dict(),
+            "role": self.role.to_dict(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> "LocalExtractor":
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        return cls(
+            _Softmax.from_dict(payload["kind"]),
+            _Softmax.from_dict(payload["profile"]),
+            _Softmax.from_dict(payload["role"]),
+            trained_on=payload.get("trained_on", 0),
+        )
+
+
+def load_cache_pairs(path: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Пары из SQLite-кэша ИИ (AI_CACHE_PATH): ключ — нормализованный текст запроса."""
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT key, payload FROM ai_cache").fetchall()
+    finally:
+        conn.close()
+    pairs = []
+    for key, payload in rows:
+        params = json.loads(payload)
+        if isinstance(params, dict):
+            pairs.append((key, params))
+    return pairs
+
+
+def load_jsonl_pairs(path: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Пары из JSONL: {"text": ..., "params": {...}} или поля kind/profile/... рядом с text."""
+    pairs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            params = record.get("params", record)
+            if record.get("text") and isinstance(params, dict) and params.get("kind"):
+                pairs.append((record["text"], params))
+    return pairs
+
+
+_extractor: Optional[LocalExtractor] = None
+_extractor_checked = False
+_lock = threading.Lock()
+_stats: Dict[str, float] = {"calls": 0, "confident": 0, "unsure": 0, "seconds_total": 0.0}
+
+
+def get_extractor() -> Optional[LocalExtractor]:
+    """Модель из LOCAL_MODEL_PATH (загружается один раз); None — файла нет."""
+    global _extractor, _extractor_checked
+    if not _extractor_checked:
+        with _lock:
+            if not _extractor_checked:
+                if os.path.exists(LOCAL_MODEL_PATH):
+                    _extractor = LocalExtractor.load(LOCAL_MODEL_PATH)
+                # else: print(f"[LOCAL] Модель {LOCAL_MODEL_PATH} не найдена")
+                _extractor_checked = True
+    return _extractor
+
+
+def extract(user_text: str, threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Параметры в формате ИИ или None, если модели нет или она не уверена."""
+    extractor = get_extractor()
+    if extractor is None:
+        return None
+    started = time.perf_counter()
+    result, confidence = extractor.predict(user_text)
+    confident = confidence >= (LOCAL_THRESHOLD if threshold is None else threshold)
+    with _lock:
+        _stats["calls"] += 1
+        _stats["confident" if confident else "unsure"] += 1
+        _stats["seconds_total"] += time.perf_counter() - started
+    return result if confident else None
+
+
+def local_stats() -> Dict[str, Any]:
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+    calls = stats["calls"]
+    stats["confident_rate"] = round(stats["confident"] / calls, 4) if calls else 0.0
+    stats["seconds_avg"] = round(stats["seconds_total"] / calls, 6) if calls else 0.0
+    stats["loaded"] = _extractor is not None
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cache", action="append", default=[], help="SQLite-кэш ИИ (AI_CACHE_PATH)")
+    parser.add_argument("--jsonl", action="append", default=[], help="JSONL с парами text/params")
+    parser.add_argument("--out", default=LOCAL_MODEL_PATH)
+    parser.add_argument("--epochs", type=int, default=6)
+    args = parser.parse_args()
+
+    pairs: List[Tuple[str, Dict[str, Any]]] = []
+    for path in args.cache:
+        pairs.extend(load_cache_pairs(path))
+    for path in args.jsonl:
+        pairs.extend(load_jsonl_pairs(path))
+    if not pairs:
+        parser.error("нет пар для обучения: укажите --cache и/или --jsonl")
+
+    started = time.perf_counter()
+    extractor = LocalExtractor.train(pairs, epochs=args.epochs)
+    extractor.save(args.out)
+    correct = sum(extractor.predict(text)[0] == {
+        "kind": params.get("kind"),
+        "length_mm": params.get("length_mm"),
+        "profile": str(params.get("profile") or "").upper() or None,
+        "width_mm": params.get("width_mm"),
+    } for text, params in pairs)
+    print(f"Пар: {len(pairs)}, обучение {time.perf_counter() - started:.1f} с, "
+          f"точность на обучающих: {correct / len(pairs) * 100:.1f}% → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, Callable, List, Tuple
+
+
+# Границы гистограммы этапов, сек
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = False
+_lock = threading.Lock()
+# stage -> [счётчики по бакетам..., +Inf, сумма]
+_histograms: Dict[str, List[float]] = {}
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+_collectors: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+_server: Optional[ThreadingHTTPServer] = None
+# Время этапов текущего запроса (для журнала запросов, query_log): stage -> сек.
+# Живёт в контексте задачи обработчика; этапы в пуле потоков БД сюда не попадают
+_request_stages: "ContextVar[Optional[Dict[str, float]]]" = ContextVar("request_stages", default=None)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def observe(stage: str, seconds: float) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        data = _histograms.get(stage)
+        if data is None:
+            data = _histograms[stage] = [0.0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                data[i] += 1
+                break
+        else:
+            data[len(BUCKETS)] += 1
+        data[-1] += seconds
+
+
+def inc(name: str, value: float = 1.0, **labels: str) -> None:
+    if not _enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+
+    def __enter__(self) -> "_Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        seconds = time.perf_counter() - self.started
+        observe(self.stage, seconds)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[self.stage] = stages.get(self.stage, 0.0) + seconds
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage: str):
+    """``with span("sql_execute"): ...`` — время этапа в гистограмму bot_stage_seconds.
+
+    Пока метрики выключены и время этапов запроса не собирается
+    (``collect_stages``), возвращает общий пустой контекст без замеров.
+    """
+    if _enabled or _request_stages.get() is not None:
+        return _Span(stage)
+    return _NOOP
+
+
+@contextmanager
+def collect_stages():
+    """``with collect_stages() as stages:`` — время этапов (span) внутри блока
+    суммируется в словарь stage -> сек, даже если метрики выключены."""
+    stages: Dict[str, float] = {}
+    token = _request_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _request_stages.reset(token)
+
+
+def register_collector(prefix: str, collect: Callable[[], Dict[str, Any]]) -> None:
+    """Числовые значения ``collect()`` (вложенные словари — через «_») отдаются как gauge ``<prefix>_<ключ>``."""
+    _collectors.append((prefix, collect))
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _flatten(prefix: str, data: Dict[str, Any]):
+    for key, value in data.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+def render() -> str:
+    """Метрики в текстовом формате Prometheus."""
+    lines = [
+        "# HELP bot_stage_seconds Время этапов обработки запроса",
+        "# TYPE bot_stage_seconds histogram",
+    ]
+    with _lock:
+        histograms = {stage: list(data) for stage, data in _histograms.items()}
+        counters = dict(_counters)
+    for stage, data in sorted(histograms.items()):
+        cumulative = 0.0
+        for bound, count in zip(BUCKETS, data):
+            cumulative += count
+            lines.append(f'bot_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative:g}')
+        cumulative += data[len(BUCKETS)]
+        lines.append(f'bot_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {cumulative:g}')
+        lines.append(f'bot_stage_seconds_sum{{stage="{stage}"}} {data[-1]:.6f}')
+        lines.append(f'bot_stage_seconds_count{{stage="{stage}"}} {cumulative:g}')
+
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {value:g}")
+
+    for prefix, collect in _collectors:
+        try:
+            values = list(_flatten(prefix, collect()))
+        except Exception:
+            continue
+        for name, value in values:
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_server(port: int, host: str = "127.0.0.1") -> None:
+    """Включает сбор метрик и отдаёт их на http://host:port/metrics."""
+    global _enabled, _server
+    if _server is not None:
+        return
+    _server = ThreadingHTTPServer((host, port), _Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    _enabled = True
+
+
+def stop_server() -> None:
+    global _enabled, _server
+    _enabled = False
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,92 @@
+import os
+import re
+import threading
+import weakref
+from typing import Any, Dict, Optional, Sequence, Set
+
+
+PREPARE_ENABLED = os.getenv("PG_PREPARE", "1") not in ("0", "false", "no")
+
+_PLACEHOLDER = re.compile(r"%%|%s")
+
+
+class Statement:
+    """Запрос фиксированной формы: текст для psycopg2 (%s) и для PREPARE ($1, $2, ...)."""
+
+    __slots__ = ("name", "sql", "server_sql", "params")
+
+    def __init__(self, name: str, sql: str) -> None:
+        self.name = name
+        self.sql = sql
+        counter = iter(range(1, 1000))
+        self.server_sql = _PLACEHOLDER.sub(lambda m: "%" if m.group(0) == "%%" else f"${next(counter)}", sql)
+        self.params = next(counter) - 1
+
+
+_lock = threading.Lock()
+# Текст запроса (как его строит search_service) -> подготовленный запрос
+_statements: Dict[str, Statement] = {}
+# Какие запросы уже подготовлены на соединении (PREPARE живёт до закрытия сессии)
+_prepared: "weakref.WeakKeyDictionary[Any, Set[str]]" = weakref.WeakKeyDictionary()
+# Отметка соединения, на котором запрос упал: перед следующим использованием — DEALLOCATE ALL
+_NEEDS_RESET: Set[str] = set()
+_stats = {"executes": 0, "prepares": 0, "unregistered": 0, "errors": 0}
+
+
+def register(name: str, sql: str) -> None:
+    """Добавляет форму запроса в реестр. Повторная регистрация того же текста игнорируется."""
+    with _lock:
+        if sql not in _statements:
+            _statements[sql] = Statement(name, sql)
+
+
+def statement(sql: str) -> Optional[Statement]:
+    return _statements.get(sql)
+
+
+def execute(cur, sql: str, params: Sequence[Any]) -> None:
+    """``cur.execute(sql, params)`` через PREPARE/EXECUTE на соединении курсора.
+
+    Запрос готовится на соединении один раз при первом использовании; разбор
+    и (после нескольких выполнений — обобщённый план) планирование PostgreSQL
+    больше не повторяет. Незарегистрированный текст выполняется как есть.
+    """
+    stmt = _statements.get(sql) if PREPARE_ENABLED else None
+    if stmt is None:
+        if PREPARE_ENABLED:
+            _stats["unregistered"] += 1
+        cur.execute(sql, params)
+        return
+
+    conn = cur.connection
+    with _lock:
+        names = _prepared.get(conn)
+        reset = names is _NEEDS_RESET
+        if names is None or reset:
+            names = _prepared[conn] = set()
+    try:
+        if reset:
+            cur.execute("DEALLOCATE ALL")
+        if stmt.name not in names:
+            cur.execute(f"PREPARE {stmt.name} AS {stmt.server_sql}")
+            names.add(stmt.name)
+            _stats["prepares"] += 1
+        args = f" ({', '.join(['%s'] * stmt.params)})" if stmt.params else ""
+        cur.execute(f"EXECUTE {stmt.name}{args}", params)
+        _stats["executes"] += 1
+    except Exception:
+        # Состояние подготовленных запросов на сессии неизвестно (DISCARD ALL,
+        # ошибка посреди PREPARE) — при следующем использовании начнём с чистого листа
+        _stats["errors"] += 1
+        with _lock:
+            _prepared[conn] = _NEEDS_RESET
+        raise
+
+
+def prepared_stats() -> Dict[str, Any]:
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+        stats["statements"] = len(_statements)
+        stats["connections"] = len(_prepared)
+    stats["enabled"] = PREPARE_ENABLED
+    return stats
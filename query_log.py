@@ -0,0 +1,256 @@
+"""Журнал поисковых запросов: что прислали и как бот это разрешил.
+
+Одна запись на сообщение в режиме поиска: время, чат, исходный текст,
+результат parse_query, путь разрешения (direct, rules, regex, fuzzy, ai, ...),
+число найденных строк, параметры, по которым искали, и время этапов в мс.
+Запись не блокирует обработчик: она кладётся в ограниченную очередь, а
+фоновый поток пишет пачками раз в QUERY_LOG_FLUSH_INTERVAL секунд в JSONL с
+ротацией по размеру или в SQLite (путь с расширением .sqlite/.db). При
+переполнении очереди записи отбрасываются и считаются в ``dropped``.
+
+Записанный журнал прогоняется заново через bench/replay_queries.py.
+"""
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from metrics import collect_stages
+
+
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH")
+QUERY_LOG_MAX_BYTES = int(os.getenv("QUERY_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+QUERY_LOG_BACKUPS = int(os.getenv("QUERY_LOG_BACKUPS", "5"))
+QUERY_LOG_FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", "1"))
+QUERY_LOG_QUEUE = int(os.getenv("QUERY_LOG_QUEUE", "10000"))
+
+_SQLITE_SUFFIXES = (".sqlite", ".sqlite3", ".db")
+
+
+class _JsonlWriter:
+    """JSONL с ротацией как у RotatingFileHandler: path, path.1, ..., path.N."""
+
+    def __init__(self, path: str, max_bytes: int, backups: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, entries: List[Dict[str, Any]]) -> None:
+        data = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n" for e in entries)
+        if self.max_bytes and self._file.tell() and self._file.tell() + len(data.encode("utf-8")) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _SqliteWriter:
+    def __init__(self, path: str) -> None:
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_log ("
+            " ts REAL NOT NULL, chat INTEGER, path TEXT, rows INTEGER, total_ms REAL, entry TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_query_log_ts ON query_log (ts)")
+        self._conn.commit()
+
+    def write(self, entries: List[Dict[str, Any]]) -> None:
+        self._conn.executemany(
+            "INSERT INTO query_log (ts, chat, path, rows, total_ms, entry) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (e["ts"], e.get("chat"), e.get("path"), e.get("rows"), e.get("total_ms"),
+                 json.dumps(e, ensure_ascii=False, separators=(",", ":")))
+                for e in entries
+            ],
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class QueryLog:
+    """Очередь записей и фоновый поток, который сбрасывает их пачками."""
+
+    def __init__(self, path: str, *, max_bytes: int, backups: int, flush_interval: float, max_queue: int) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(max_queue)
+        if path.lower().endswith(_SQLITE_SUFFIXES):
+            self._writer: Any = _SqliteWriter(path)
+        else:
+            self._writer = _JsonlWriter(path, max_bytes, backups)
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._thread.start()
+
+    def submit(self, entry: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch: List[Dict[str, Any]] = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            if batch:
+                try:
+                    self._writer.write(batch)
+                    self.written += len(batch)
+                except Exception:
+                    # print(f"[QUERY_LOG] Ошибка записи: {type(e).__name__}: {e}")
+                    self.errors += len(batch)
+        self._writer.close()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Дописывает очередь и закрывает файл."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped, "errors": self.errors}
+
+
+class QueryTrace:
+    """Запись об одном сообщении, которую обработчик дополняет по ходу разбора."""
+
+    __slots__ = ("chat", "text", "started", "fields")
+
+    def __init__(self, chat: Any, text: str) -> None:
+        self.chat = chat
+        self.text = text
+        self.started = time.time()
+        self.fields: Dict[str, Any] = {}
+
+
+_log: Optional[QueryLog] = None
+_sink: Optional[Callable[[Dict[str, Any]], None]] = None
+_current: "ContextVar[Optional[QueryTrace]]" = ContextVar("query_trace", default=None)
+_lock = threading.Lock()
+
+
+def start(path: Optional[str] = QUERY_LOG_PATH) -> None:
+    """Включает запись в файл; без пути (QUERY_LOG_PATH не задан) журнал выключен."""
+    global _log, _sink
+    if not path:
+        return
+    with _lock:
+        if _log is None:
+            _log = QueryLog(
+                path,
+                max_bytes=QUERY_LOG_MAX_BYTES,
+                backups=QUERY_LOG_BACKUPS,
+                flush_interval=QUERY_LOG_FLUSH_INTERVAL,
+                max_queue=QUERY_LOG_QUEUE,
+            )
+            _sink = _log.submit
+
+
+def set_sink(sink: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+    """Записи — в функцию вместо файла (replay сравнивает их с исходным журналом)."""
+    global _sink
+    _sink = sink
+
+
+def stop() -> None:
+    global _log, _sink
+    with _lock:
+        log, _log = _log, None
+        if _sink is not None and log is not None and _sink == log.submit:
+            _sink = None
+    if log is not None:
+        log.close()
+
+
+def enabled() -> bool:
+    return _sink is not None
+
+
+@contextmanager
+def trace(chat: Any, text: str) -> Iterator[Optional[QueryTrace]]:
+    """Собирает запись о сообщении; в журнал попадает только запись, у которой
+    обработчик отметил путь (``note(path=...)``)."""
+    sink = _sink
+    if sink is None:
+        yield None
+        return
+    item = QueryTrace(chat, text)
+    token = _current.set(item)
+    try:
+        with collect_stages() as stages:
+            yield item
+    finally:
+        _current.reset(token)
+        if "path" in item.fields:
+            total = stages.pop("total", None)
+            entry: Dict[str, Any] = {"ts": round(item.started, 3), "chat": item.chat, "text": item.text}
+            entry.update(item.fields)
+            entry["total_ms"] = round((total if total is not None else time.time() - item.started) * 1000, 3)
+            entry["stages"] = {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()}
+            sink(entry)
+
+
+def note(**fields: Any) -> None:
+    """Дополняет запись текущего сообщения (если журнал включён)."""
+    item = _current.get()
+    if item is not None:
+        item.fields.update(fields)
+
+
+def query_log_stats() -> Dict[str, Any]:
+    log = _log
+    stats: Dict[str, Any] = log.stats() if log is not None else {}
+    stats["enabled"] = enabled()
+    return stats
+
+
+def read_entries(path: str) -> Iterator[Dict[str, Any]]:
+    """Записи журнала (JSONL или SQLite) в порядке времени."""
+    if path.lower().endswith(_SQLITE_SUFFIXES):
+        conn = sqlite3.connect(path)
+        try:
+            for (entry,) in conn.execute("SELECT entry FROM query_log ORDER BY ts"):
+                yield json.loads(entry)
+        finally:
+            conn.close()
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
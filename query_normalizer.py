@@ -0,0 +1,183 @@
+import re
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+from query_parser import parse_query, profile_vocabulary, INCH_PROFILES
+
+
+# Профили клиновых ремней, которые пишут отдельным словом («ремень SPA 2000»)
+VBELT_PROFILES = {
+    "Z", "A", "B", "C", "D", "E",
+    "SPZ", "SPA", "SPB", "SPC", "XPZ", "XPA", "XPB", "XPC",
+    "ZX", "AX", "BX", "CX",
+}
+
+# Кириллические буквы, совпадающие по написанию с латинскими
+HOMOGLYPHS = str.maketrans({
+    "А": "A", "В": "B", "С": "C", "Е": "E", "Н": "H", "К": "K", "М": "M",
+    "О": "O", "Р": "P", "Т": "T", "Х": "X", "У": "Y",
+    "а": "a", "в": "b", "с": "c", "е": "e", "н": "h", "к": "k", "м": "m",
+    "о": "o", "р": "p", "т": "t", "х": "x", "у": "y",
+})
+_HOMOGLYPH_CHARS = set("АВСЕНКМОРТХУавсенкмортху")
+
+_WORD = re.compile(r"[0-9A-Za-zА-Яа-яЁё]+")
+_NUMBER_AHEAD = re.compile(r"\s*[-–—]?\s*\d")
+_DASH_IN_CODE = re.compile(r"(?<=[A-Z0-9])\s*[-–—]\s*(?=[A-Z0-9])")
+_NUMBER = r"(\d+(?:[.,]\d+)?)"
+_WIDTH_KEYWORD = re.compile(r"(?:\bШИРИН[А-Я]*|\bШ\b|\bW\b)\s*[:=]?\s*" + _NUMBER + r"(?:\s*(?:ММ|MM)\b)?")
+_WIDTH_EQUALS = re.compile(r"=\s*" + _NUMBER)
+_UNITS = r"(?:\s*(?P<unit>ММ|MM|СМ|CM|ДЮЙМ[А-Я]*|INCH[A-Z]*|\"|″|”))?"
+_LENGTH_KEYWORD = re.compile(r"(?:\bДЛИН[А-Я]*|\bL\b)\s*[:=]?\s*" + _NUMBER + _UNITS)
+_UNIT_MM = re.compile(_NUMBER + r"\s*(?:ММ|MM)\b")
+_UNIT_CM = re.compile(_NUMBER + r"\s*(?:СМ|CM)\b")
+_UNIT_INCH = re.compile(_NUMBER + r"\s*(?:ДЮЙМ[А-Я]*|INCH[A-Z]*|\"|″|”)")
+_TOKEN = re.compile(r"[A-Z0-9]+")
+
+RULES = (
+    "homoglyph", "dash", "width_keyword", "width_equals", "length_keyword",
+    "unit_mm", "unit_cm", "unit_inch", "code_token", "profile_number",
+)
+
+_lock = threading.Lock()
+_stats: Dict[str, int] = {"calls": 0, "resolved": 0, **{rule: 0 for rule in RULES}}
+
+
+def _number(text: str) -> float:
+    return float(text.replace(",", "."))
+
+
+def _fix_homoglyphs(text: str, hits: List[str]) -> str:
+    """Кириллица → латиница только в кодах: слово с цифрой или латиницей
+    («8М», «SРА2000») или одиночная буква перед числом («В 85»).
+    Обычные русские слова («в наличии») не трогаем."""
+    changed = False
+
+    def fix(m: "re.Match") -> str:
+        nonlocal changed
+        word = m.group(0)
+        if not any(ch in _HOMOGLYPH_CHARS for ch in word):
+            return word
+        if any(not (ch.isascii() or ch in _HOMOGLYPH_CHARS) for ch in word):
+            return word
+        code_like = any(ch.isdigit() or (ch.isascii() and ch.isalpha()) for ch in word)
+        letter_before_number = len(word) == 1 and _NUMBER_AHEAD.match(text, m.end())
+        if not (code_like or letter_before_number):
+            return word
+        changed = True
+        return word.translate(HOMOGLYPHS)
+
+    text = _WORD.sub(fix, text)
+    if changed:
+        hits.append("homoglyph")
+    return text
+
+
+def _take(pattern: "re.Pattern", text: str, rule: str, hits: List[str]) -> Tuple[Optional[float], str]:
+    m = pattern.search(text)
+    if m is None:
+        return None, text
+    hits.append(rule)
+    return _number(m.group(1)), text[:m.start()] + " " + text[m.end():]
+
+
+def _normalize(text: str, hits: List[str]) -> Optional[Dict[str, Any]]:
+    text = _fix_homoglyphs(text, hits).upper().replace("Ё", "Е")
+    fixed = _DASH_IN_CODE.sub("", text)
+    if fixed != text:
+        hits.append("dash")
+        text = fixed
+
+    width, text = _take(_WIDTH_KEYWORD, text, "width_keyword", hits)
+    if width is None:
+        width, text = _take(_WIDTH_EQUALS, text, "width_equals", hits)
+
+    length_mm: Optional[float] = None
+    length_inch: Optional[float] = None
+    m = _LENGTH_KEYWORD.search(text)
+    if m is not None:
+        hits.append("length_keyword")
+        text = text[:m.start()] + " " + text[m.end():]
+        unit = m.group("unit") or "MM"
+        if unit in ("СМ", "CM"):
+            length_mm = _number(m.group(1)) * 10
+        elif unit in ("ММ", "MM"):
+            length_mm = _number(m.group(1))
+        else:
+            length_inch = _number(m.group(1))
+    mm, text = _take(_UNIT_MM, text, "unit_mm", hits)
+    cm, text = _take(_UNIT_CM, text, "unit_cm", hits)
+    inch, text = _take(_UNIT_INCH, text, "unit_inch", hits)
+    if length_mm is None and length_inch is None:
+        if mm is not None:
+            length_mm = mm
+        elif cm is not None:
+            length_mm = cm * 10
+        elif inch is not None:
+            length_inch = inch
+
+    tokens = _TOKEN.findall(text)
+    numbers = [float(t) for t in tokens if t.isdigit()]
+    except_prefixes, sync_profiles = profile_vocabulary()
+    known = sync_profiles | except_prefixes | VBELT_PROFILES
+
+    # Код целиком («8М» → 8M, «B-85» → B85): разбираем обычными правилами.
+    # Если рядом есть отдельное число («3V 1000»), токен — это профиль, а не код
+    if length_mm is None and length_inch is None and not numbers:
+        for token in tokens:
+            if not (any(ch.isdigit() for ch in token) and any(ch.isalpha() for ch in token)):
+                continue
+            parsed = parse_query(token + (f"={width:g}" if width is not None else ""))
+            if parsed.kind != "unknown" and parsed.profile in known and parsed.length_mm is not None:
+                hits.append("code_token")
+                return {"kind": parsed.kind, "profile": parsed.profile, "length_mm": parsed.length_mm, "width_mm": parsed.width_mm}
+
+    profiles = [t for t in tokens if t in known]
+    if len(set(profiles)) != 1:
+        return None
+    profile = profiles[0]
+    if length_mm is None and length_inch is None:
+        if len(numbers) != 1:
+            return None
+        bare = numbers[0]
+    else:
+        bare = None
+    kind = "synchronous" if profile in sync_profiles else "vbelt"
+
+    # В AI-формате длина клиновых A/B/C/D/E — в дюймах (см. effective_length)
+    inch_profile = kind == "vbelt" and profile in INCH_PROFILES
+    if length_mm is not None:
+        length = length_mm / 25.4 if inch_profile else length_mm
+    elif length_inch is not None:
+        length = length_inch if inch_profile else length_inch * 25.4
+    else:
+        length = bare
+    hits.append("profile_number")
+    return {"kind": kind, "profile": profile, "length_mm": round(length, 2), "width_mm": width}
+
+
+def normalize_query(text: str) -> Optional[Dict[str, Any]]:
+    """Разбирает свободный текст правилами без ИИ.
+
+    Возвращает параметры в том же формате, что ``ai_extract_parameters``
+    (kind, profile, length_mm, width_mm), или ``None``, если текст неоднозначен
+    и его нужно отдать ИИ.
+    """
+    hits: List[str] = []
+    result = _normalize(text, hits)
+    with _lock:
+        _stats["calls"] += 1
+        if result is not None:
+            _stats["resolved"] += 1
+        for rule in hits:
+            _stats[rule] += 1
+    return result
+
+
+def normalizer_stats() -> Dict[str, Any]:
+    """Срабатывания каждого правила и доля запросов, разобранных без ИИ."""
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+    calls = stats["calls"]
+    stats["resolved_rate"] = round(stats["resolved"] / calls, 4) if calls else 0.0
+    stats["rule_hit_rate"] = {rule: round(stats[rule] / calls, 4) if calls else 0.0 for rule in RULES}
+    return stats
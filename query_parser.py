@@ -0,0 +1,224 @@
+import re
+import threading
+from functools import lru_cache
+from typing import Optional, Iterable, Tuple
+
+
+EXCEPT_PREFIXES_STRUNINO = ("3V", "5V", "8V", "3VX", "5VX")
+KNOWN_SYNC_PROFILES = [
+    "14M", "T10", "T5", "8M", "L", "H"
+]
+INCH_PROFILES = {"A", "B", "C", "D", "E"}
+
+WAREHOUSE_MOSCOW = "Москва"
+WAREHOUSE_STRUNINO = "Струнино"
+
+
+class ParsedQuery:
+    """Результат разбора запроса. Объекты кэшируются — не изменяйте их."""
+
+    __slots__ = ("kind", "length_mm", "profile", "width_mm", "warehouse", "eff_length")
+
+    def __init__(
+        self,
+        *,
+        kind: str,
+        length_mm: Optional[float],
+        profile: Optional[str],
+        width_mm: Optional[float],
+        warehouse: Optional[str] = None,
+        eff_length: Optional[float] = None,
+    ):
+        self.kind = kind
+        self.length_mm = length_mm
+        self.profile = profile
+        self.width_mm = width_mm
+        self.warehouse = warehouse
+        self.eff_length = eff_length
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"ParsedQuery({fields})"
+
+
+def effective_length(kind: str, profile: Optional[str], length_mm: Optional[float]) -> Optional[float]:
+    # Конвертация для клиновых ремней, где длина задаётся в дюймах (классические профили)
+    # Конвертируем дюймы только для классических профилей A/B/C/D/E.
+    # Для 3V/5V/8V/3VX/5VX длина в БД и запросах используем в мм без конвертации.
+    if kind == "vbelt" and (profile or "").upper() in INCH_PROFILES and length_mm is not None:
+        return length_mm * 25.4
+    return length_mm
+
+
+def _alternation(words: Iterable[str]) -> str:
+    # Длинные варианты первыми, чтобы 3VX не перехватывался 3V
+    return "|".join(re.escape(w) for w in sorted(set(words), key=lambda w: (-len(w), w)))
+
+
+class _Grammar:
+    """Скомпилированная грамматика запроса для заданного словаря профилей.
+
+    Одно регулярное выражение разбирает все форматы:
+    исключения (3V1000), синхронные с известным профилем (8008M),
+    синхронные с произвольным профилем (123XY), клиновые (SPA2000), ширину (=55).
+    """
+
+    def __init__(self, except_prefixes: Iterable[str], sync_profiles: Iterable[str]) -> None:
+        self.except_prefixes = frozenset(except_prefixes)
+        self.sync_profiles = frozenset(sync_profiles)
+        exc = _alternation(self.except_prefixes)
+        sync = _alternation(self.sync_profiles)
+        self.token_re = re.compile(
+            r"(?:"
+            rf"(?P<exc>{exc})(?P<exc_len>\d+)"
+            # Начинается с цифр, профиль — известный суффикс (самый длинный из подходящих)
+            rf"|(?=\d)(?P<s_pre>[^=]*?)(?P<s_prof>{sync})"
+            r"|(?P<g_len>\d+)(?P<g_prof>[A-Z0-9]+)"
+            r"|(?=\d)(?P<s_any>[^=]*)"
+            r"|(?P<vb_prof>[A-Z]+)(?P<vb_len>\d+)"
+            r")(?:=(?P<width>\d+))?"
+        )
+        self.except_re = re.compile(rf"(?:{exc})")
+        # Поиск кода в свободном тексте (без пробелов): 8008M, SPA2000, 177814M=55
+        self.search_re = re.compile(r"(\d+[A-Z0-9]+(?:=\d+)?|[A-Z]+\d+(?:=\d+)?)")
+
+    def warehouse(self, text: str) -> str:
+        # Сначала проверяем исключения
+        if self.except_re.match(text):
+            return WAREHOUSE_STRUNINO
+        # Начинается с цифр → Москва, с букв → Струнино
+        if text[:1].isdigit():
+            return WAREHOUSE_MOSCOW
+        return WAREHOUSE_STRUNINO
+
+    def parse(self, text: str) -> ParsedQuery:
+        """``text`` — запрос в верхнем регистре без пробелов по краям."""
+        warehouse = self.warehouse(text.replace(" ", ""))
+        if any(ch.isspace() for ch in text):
+            return _unknown(warehouse)
+        m = self.token_re.fullmatch(text)
+        if m is None:
+            return _unknown(warehouse)
+
+        width_part = m.group("width")
+        width = float(width_part) if width_part is not None else None
+        if m.group("exc") is not None:
+            kind, profile, length = "vbelt", m.group("exc"), float(m.group("exc_len"))
+        elif m.group("s_prof") is not None:
+            kind, profile, length = "synchronous", m.group("s_prof"), _to_float(m.group("s_pre"))
+        elif m.group("g_prof") is not None:
+            kind, profile, length = "synchronous", m.group("g_prof"), float(m.group("g_len"))
+        elif m.group("s_any") is not None:
+            kind, profile, length = "synchronous", None, None
+        else:
+            kind, profile, length = "vbelt", m.group("vb_prof"), float(m.group("vb_len"))
+        return ParsedQuery(
+            kind=kind,
+            length_mm=length,
+            profile=profile,
+            width_mm=width,
+            warehouse=warehouse,
+            eff_length=effective_length(kind, profile, length),
+        )
+
+
+def _to_float(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _unknown(warehouse: str) -> ParsedQuery:
+    return ParsedQuery(kind="unknown", length_mm=None, profile=None, width_mm=None, warehouse=warehouse)
+
+
+_grammar = _Grammar(EXCEPT_PREFIXES_STRUNINO, KNOWN_SYNC_PROFILES)
+_grammar_lock = threading.Lock()
+
+
+@lru_cache(maxsize=4096)
+def _parse_normalized(text: str) -> ParsedQuery:
+    return _grammar.parse(text)
+
+
+def parse_query(q: str) -> ParsedQuery:
+    return _parse_normalized(q.strip().upper())
+
+
+def route_warehouse(original_text: str) -> str:
+    return _grammar.warehouse(original_text.strip().upper().replace(" ", ""))
+
+
+def is_strunino_exception(profile: Optional[str]) -> bool:
+    return bool(profile) and profile.upper() in _grammar.except_prefixes
+
+
+# Количество в запросе: «2 шт», «5шт.», «10 штук», «x2», «х 3», «2x», «10 pcs»
+_QUANTITY = re.compile(
+    r"(?<!\S)(?:[xх×*]\s?\d+|\d+\s?(?:шт\.?|штук[аи]?|pcs|[xх×]))(?=[\s.,;:!?)]|$)",
+    re.IGNORECASE,
+)
+
+
+def strip_quantities(text: str) -> str:
+    """Убирает из запроса количества, чтобы они не приклеились к коду («B 85 2 шт» → «B 85»)."""
+    return _QUANTITY.sub(" ", text)
+
+
+def extract_token(text: str) -> Optional[str]:
+    """Ищет в свободном тексте код артикула с профилем (или шириной) — «нужен ремень SPA 2000» → SPA2000."""
+    m = _grammar.search_re.search(strip_quantities(text).upper().replace(" ", ""))
+    if not m:
+        return None
+    token = m.group(1)
+    parsed = parse_query(token)
+    # Профиль должен быть буквами (8M, 14M, SPA, B и т.д.), а не цифрой
+    has_valid_profile = bool(parsed.profile) and not parsed.profile.isdigit()
+    if parsed.kind != "unknown" and (has_valid_profile or "=" in token):
+        return token
+    return None
+
+
+def set_profile_vocabulary(except_prefixes: Iterable[str], sync_profiles: Iterable[str]) -> None:
+    """Пересобирает грамматику; встроенные профили всегда остаются в словаре."""
+    global _grammar
+    grammar = _Grammar(
+        set(EXCEPT_PREFIXES_STRUNINO) | set(except_prefixes),
+        set(KNOWN_SYNC_PROFILES) | set(sync_profiles),
+    )
+    with _grammar_lock:
+        _grammar = grammar
+        _parse_normalized.cache_clear()
+
+
+def profile_vocabulary() -> Tuple[frozenset, frozenset]:
+    return _grammar.except_prefixes, _grammar.sync_profiles
+
+
+_PROFILE_WORD = re.compile(r"[A-Z0-9]+")
+
+
+def load_profile_vocabulary() -> None:
+    """Загружает профили из БД: синхронные — как известные суффиксы,
+    клиновые, начинающиеся с цифры (3V, 5VX, ...), — как исключения склада Струнино."""
+    from db_connection import get_connection
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT DISTINCT profile_norm, category FROM products "
+                "WHERE profile_norm IS NOT NULL AND profile_norm <> ''"
+            )
+            rows = cur.fetchall()
+    sync_profiles = set()
+    except_prefixes = set()
+    for row in rows:
+        profile = row["profile_norm"]
+        if not _PROFILE_WORD.fullmatch(profile) or profile.isdigit():
+            continue
+        if row["category"] == "synchronous":
+            sync_profiles.add(profile)
+        elif row["category"] == "vbelt" and profile[0].isdigit():
+            except_prefixes.add(profile)
+    set_profile_vocabulary(except_prefixes, sync_profiles)
@@ -0,0 +1,114 @@
+import os
+import time
+from typing import Dict, Hashable, Any, Optional
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT", "1") not in ("0", "false", "no")
+# Токенов в секунду на чат и максимальный запас (всплеск подряд)
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "1"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "5"))
+# Повтор уже обработанного текста в течение окна считается переотправкой и не ищется заново
+RESUBMIT_WINDOW = float(os.getenv("RESUBMIT_WINDOW", "10"))
+
+# Итог admit()
+ADMIT = "admit"
+DUPLICATE = "duplicate"
+LIMITED = "limited"
+# Лимит исчерпан, клиента уже предупредили — молча пропускаем
+LIMITED_SILENT = "limited_silent"
+
+# Чаты без активности дольше этого времени удаляются из памяти, сек
+_IDLE_TTL = 600.0
+_SWEEP_EVERY = 10000
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class _ChatState:
+    __slots__ = ("tokens", "updated", "last_text", "last_at", "warned")
+
+    def __init__(self, burst: float, now: float) -> None:
+        self.tokens = burst
+        self.updated = now
+        self.last_text: Optional[str] = None
+        self.last_at = 0.0
+        self.warned = False
+
+
+class ChatRateLimiter:
+    """Token bucket на чат и отсев переотправок одного и того же текста.
+
+    Каждый запрос тратит токен; токены восполняются со скоростью ``rate`` в
+    секунду до ``burst``. Вызывается только из цикла событий и не ждёт
+    внутри, поэтому без блокировок.
+    """
+
+    def __init__(self, rate: float, burst: float, resubmit_window: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.resubmit_window = resubmit_window
+        self._chats: Dict[Hashable, _ChatState] = {}
+        self._calls = 0
+        self.admitted = 0
+        self.duplicates = 0
+        self.limited = 0
+
+    def admit(self, chat_id: Hashable, text: str) -> str:
+        """ADMIT — обрабатывать; DUPLICATE — переотправка, ответ уже дан;
+        LIMITED — лимит исчерпан, стоит предупредить; LIMITED_SILENT — уже предупреждали.
+
+        Переотправки тоже тратят токен: уведомления о них не чаще лимита.
+        """
+        now = time.monotonic()
+        self._calls += 1
+        if self._calls % _SWEEP_EVERY == 0:
+            self._sweep(now)
+
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatState(self.burst, now)
+        state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+        state.updated = now
+
+        if state.tokens < 1:
+            self.limited += 1
+            if state.warned:
+                return LIMITED_SILENT
+            state.warned = True
+            return LIMITED
+        state.tokens -= 1
+        state.warned = False
+        if _normalize(text) == state.last_text and now - state.last_at < self.resubmit_window:
+            self.duplicates += 1
+            return DUPLICATE
+        self.admitted += 1
+        return ADMIT
+
+    def replied(self, chat_id: Hashable, text: str) -> None:
+        """Запрос обработан и ответ отправлен: его повтор в течение окна — переотправка.
+
+        Пока ответа нет (запрос упал или ещё выполняется), повтор обрабатывается заново.
+        """
+        state = self._chats.get(chat_id)
+        if state is not None:
+            state.last_text = _normalize(text)
+            state.last_at = time.monotonic()
+
+    def _sweep(self, now: float) -> None:
+        idle = [k for k, s in self._chats.items() if now - s.updated > _IDLE_TTL]
+        for k in idle:
+            del self._chats[k]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": RATE_LIMIT_ENABLED,
+            "chats": len(self._chats),
+            "admitted": self.admitted,
+            "duplicates": self.duplicates,
+            "limited": self.limited,
+        }
+
+
+chat_limiter = ChatRateLimiter(RATE_LIMIT_RATE, RATE_LIMIT_BURST, RESUBMIT_WINDOW)
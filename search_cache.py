@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import select
+import threading
+from typing import Optional, Any, Dict, Hashable, Iterable, Tuple
+import psycopg2
+from db_connection import get_dsn
+from ttl_cache import TTLCache
+
+
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE", "1") not in ("0", "false", "no")
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "4096"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_LISTEN = os.getenv("SEARCH_CACHE_LISTEN", "1") not in ("0", "false", "no")
+
+# Канал уведомлений триггера products (db/migrations/004_products_notify.sql)
+NOTIFY_CHANNEL = "products_changed"
+
+Scope = Tuple[str, Optional[str]]
+
+
+def _approx_size(value: Any) -> int:
+    """Грубая оценка памяти: контейнеры, строки и числа без общих объектов."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_approx_size(k) + _approx_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(_approx_size(v) for v in value)
+    elif hasattr(value, "__slots__"):
+        size += sum(_approx_size(getattr(value, name, None)) for name in value.__slots__)
+    return size
+
+
+class SearchCache:
+    """Кэш страниц поиска с точной инвалидацией по (склад, профиль).
+
+    Ключ записи — нормализованные параметры поиска и страница, первые два
+    элемента ключа — (склад, профиль). Изменение товаров склада/профиля удаляет
+    записи этого профиля и записи поиска без профиля на том же складе.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        # Меняется при каждой инвалидации: результат, посчитанный до неё, не сохраняем
+        self._epoch = 0
+        self.invalidations = 0
+        self.invalidated_entries = 0
+
+    def get(self, key: Hashable) -> Any:
+        return self._cache.get(key)
+
+    def epoch(self) -> int:
+        return self._epoch
+
+    def set(self, key: Hashable, value: Any, epoch: int) -> None:
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._cache.set(key, value)
+
+    def invalidate(self, scopes: Optional[Iterable[Scope]] = None) -> int:
+        """Удаляет записи затронутых (склад, профиль); ``None`` — весь кэш."""
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            if scopes is None:
+                removed = len(self._cache)
+                self._cache.clear()
+            else:
+                scopes = set(scopes)
+                warehouses = {wh for wh, _ in scopes}
+                removed = self._cache.discard_where(
+                    lambda k: k[:2] in scopes or (k[1] is None and k[0] in warehouses)
+                )
+            self.invalidated_entries += removed
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._cache.stats()
+        stats.update({
+            "memory_bytes": sum(_approx_size(k) + _approx_size(v) for k, v in self._cache.items()),
+            "invalidations": self.invalidations,
+            "invalidated_entries": self.invalidated_entries,
+            "listening": _listener.connected if _listener is not None else False,
+        })
+        return stats
+
+
+search_cache = SearchCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+
+def _parse_payload(payload: str) -> Optional[Scope]:
+    try:
+        data = json.loads(payload)
+        return (data.get("warehouse") or "", data.get("profile") or "")
+    except (ValueError, AttributeError):
+        return None
+
+
+class _Listener(threading.Thread):
+    """Отдельное соединение с LISTEN products_changed: инвалидирует кэш по уведомлениям."""
+
+    def __init__(self) -> None:
+        super().__init__(name="search-cache-listen", daemon=True)
+        self.connected = False
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(get_dsn())
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Уведомления, пропущенные без соединения, не восстановить — сбрасываем всё
+                search_cache.invalidate()
+                self.connected = True
+                while not self._stopped.is_set():
+                    if not select.select([conn], [], [], 5.0)[0]:
+                        continue
+                    conn.poll()
+                    scopes = set()
+                    while conn.notifies:
+                        scope = _parse_payload(conn.notifies.pop(0).payload)
+                        if scope is None:
+                            scopes = None
+                        elif scopes is not None:
+                            scopes.add(scope)
+                    if scopes is None or scopes:
+                        search_cache.invalidate(scopes)
+            except Exception:
+                # БД недоступна — до переподключения записи живут не дольше TTL
+                pass
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stopped.wait(5.0)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+_listener: Optional[_Listener] = None
+
+
+def start_listener() -> None:
+    global _listener
+    if SEARCH_CACHE_ENABLED and SEARCH_CACHE_LISTEN and _listener is None:
+        _listener = _Listener()
+        _listener.start()
+
+
+def stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def cache_stats() -> Dict[str, Any]:
+    return search_cache.stats()
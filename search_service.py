@@ -1,226 +1,598 @@
+import os
 import re
-from typing import Optional, List, Dict
-from db_connection import get_connection
-
-
-class ParsedQuery:
-    def __init__(self, *, kind: str, length_mm: Optional[float], profile: Optional[str], width_mm: Optional[float]):
-        self.kind = kind 
-        self.length_mm = length_mm
-        self.profile = profile
+from typing import Optional, List, Dict, Tuple
+from db_connection import get_connection, run_db
+from catalog_index import catalog, normalize_code
+from search_cache import search_cache, SEARCH_CACHE_ENABLED
+from ttl_cache import MISSING
+from metrics import span
+from single_flight import SingleFlight
+import prepared_statements
+from query_parser import (  # noqa: F401 — реэкспорт для существующих импортов
+    ParsedQuery,
+    parse_query,
+    route_warehouse,
+    effective_length,
+    extract_token,
+    strip_quantities,
+    is_strunino_exception,
+    EXCEPT_PREFIXES_STRUNINO,
+    KNOWN_SYNC_PROFILES,
+    INCH_PROFILES,
+    WAREHOUSE_MOSCOW,
+    WAREHOUSE_STRUNINO,
+)
+
+
+PAGE_SIZE = 20
+# Сколько ближайших по длине товаров предлагать, если точный поиск пуст (0 — не предлагать)
+NEAREST_LIMIT = int(os.getenv("SEARCH_NEAREST_LIMIT", "5"))
+
+# Нечёткий поиск по триграммам перед обращением к ИИ
+FUZZY_SEARCH_ENABLED = os.getenv("FUZZY_SEARCH", "1") not in ("0", "false", "no")
+FUZZY_ARTICLE_THRESHOLD = float(os.getenv("FUZZY_ARTICLE_THRESHOLD", "0.3"))
+FUZZY_NAME_THRESHOLD = float(os.getenv("FUZZY_NAME_THRESHOLD", "0.6"))
+FUZZY_LIMIT = int(os.getenv("FUZZY_LIMIT", "10"))
+FUZZY_MIN_LENGTH = 4
+
+# Сколько кодов из одного запроса проверять по артикулам и аналогам
+ANALOGUE_MAX_CODES = 8
+
+# Одинаковые поиски, выполняющиеся одновременно, делят один запрос
+_flight = SingleFlight("search")
+
+# Только колонки, которые нужны для вывода результатов
+RESULT_COLUMNS = "id, name, profile, length, width, quantity_free, price_per_unit, price_per_mm, warehouse"
+
+
+class SearchRequest:
+    """Нормализованные параметры поиска: склад и длина уже в мм."""
+
+    __slots__ = ("kind", "profile", "eff_length", "width_mm", "warehouse")
+
+    def __init__(self, *, kind: str, profile: Optional[str], eff_length: Optional[float], width_mm: Optional[float], warehouse: str):
+        self.kind = kind
+        self.profile = profile.strip().upper() if profile else None
+        self.eff_length = eff_length
         self.width_mm = width_mm
+        self.warehouse = warehouse.strip()
 
+    def as_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
 
-EXCEPT_PREFIXES_STRUNINO = ("3V", "5V", "8V", "3VX", "5VX")
-KNOWN_SYNC_PROFILES = [
-    "14M", "T10", "T5", "8M", "L", "H"
-]
-
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SearchRequest":
+        return cls(**{name: data.get(name) for name in cls.__slots__})
 
-def parse_query(q: str) -> ParsedQuery:
-    text_raw = q.strip().upper()
-    if any(ch.isspace() for ch in text_raw):
-        return ParsedQuery(kind="unknown", length_mm=None, profile=None, width_mm=None)
 
-    text = text_raw
+class SearchPage:
+    __slots__ = ("rows", "offset", "limit", "total", "has_more")
 
-    width = None
-    if "=" in text:
-        base, width_part = text.split("=", 1)
-        if not width_part.isdigit():
-            return ParsedQuery(kind="unknown", length_mm=None, profile=None, width_mm=None)
-        try:
-            width = float(width_part)
-        except ValueError:
-            return ParsedQuery(kind="unknown", length_mm=None, profile=None, width_mm=None)
-        text = base
-
-    # Специальные исключения: 3V/5V/8V/3VX/5VX → клиновые, профиль в префиксе
-    m_exc = re.match(r"^(3VX|5VX|3V|5V|8V)(\d+)$", text)
-    if m_exc:
-        profile = m_exc.group(1)
-        length = float(m_exc.group(2))
-        return ParsedQuery(kind="vbelt", length_mm=length, profile=profile, width_mm=width)
-
-    # Если начинается с цифр → синхронные (length+profile), профиль берём из известного суффикса
-    if re.match(r"^\d", text):
-        profile = None
-        for p in KNOWN_SYNC_PROFILES:
-            if text.endswith(p):
-                profile = p
-                prefix = text[:-len(p)]
-                try:
-                    length = float(prefix)
-                except ValueError:
-                    length = None
-                return ParsedQuery(kind="synchronous", length_mm=length, profile=profile, width_mm=width)
-        # если профиль не распознан, используем общее разбиение как раньше
-        m = re.match(r"^(\d+)([A-Z0-9]+)$", text)
-        length = float(m.group(1)) if m else None
-        profile = m.group(2) if m else None
-        return ParsedQuery(kind="synchronous", length_mm=length, profile=profile, width_mm=width)
-
-    # Если начинается с букв → клиновые (profile+length)
-    m = re.match(r"^([A-Z]+)(\d+)$", text)
-    if m:
-        profile = m.group(1)
-        length = float(m.group(2))
-        return ParsedQuery(kind="vbelt", length_mm=length, profile=profile, width_mm=width)
-
-    return ParsedQuery(kind="unknown", length_mm=None, profile=None, width_mm=None)
-
-
-def route_warehouse(original_text: str) -> str:
-    t = original_text.strip().upper().replace(" ", "")
-    # Сначала проверяем исключения
-    for pref in EXCEPT_PREFIXES_STRUNINO:
-        if t.startswith(pref):
-            return "Струнино"
-    # Начинается с цифр → Москва
-    if re.match(r"^\d", t):
-        return "Москва"
-    # Начинается с букв → Струнино
-    return "Струнино"
+    def __init__(self, *, rows: List[Dict], offset: int, limit: int, total: Optional[int], has_more: bool):
+        self.rows = rows
+        self.offset = offset
+        self.limit = limit
+        self.total = total
+        self.has_more = has_more
 
 
-def search_products(query: str) -> List[Dict]:
+def build_request(query: str) -> SearchRequest:
     parsed = parse_query(query)
-    warehouse = route_warehouse(query)
-
-    # Конвертация для клиновых ремней, где длина задаётся в дюймах (классические профили)
-    # Конвертируем дюймы только для классических профилей A/B/C/D/E.
-    # Для 3V/5V/8V/3VX/5VX длина в БД и запросах используем в мм без конвертации.
-    INCH_PROFILES = {"A", "B", "C", "D", "E"}
-    eff_length = parsed.length_mm
-    if parsed.kind == "vbelt" and parsed.profile in INCH_PROFILES and eff_length is not None:
-        eff_length = eff_length * 25.4 
-
-    sql = "SELECT * FROM products WHERE TRIM(warehouse) = %s AND quantity_free > 0"
-    params: List = [warehouse]
+    return SearchRequest(
+        kind=parsed.kind,
+        profile=parsed.profile,
+        eff_length=parsed.eff_length,
+        width_mm=parsed.width_mm,
+        warehouse=parsed.warehouse,
+    )
+
+
+def build_structured_request(*, kind: str, length_mm: Optional[float], profile: Optional[str], width_mm: Optional[float], original_text: str) -> SearchRequest:
+    if is_strunino_exception(profile):
+        warehouse = WAREHOUSE_STRUNINO
+    elif kind == "synchronous":
+        warehouse = WAREHOUSE_MOSCOW
+    elif kind == "vbelt":
+        warehouse = WAREHOUSE_STRUNINO
+    else:
+        warehouse = route_warehouse(original_text)
+    # print(f"[SEARCH] Параметры поиска: kind={kind}, length={length_mm}, profile={profile}, width={width_mm}, warehouse={warehouse}")
+    return SearchRequest(
+        kind=kind,
+        profile=profile,
+        eff_length=effective_length(kind, profile, length_mm),
+        width_mm=width_mm,
+        warehouse=warehouse,
+    )
+
+
+def _where_clause(req: SearchRequest) -> Tuple[str, List]:
+    """Условия записаны по нормализованным колонкам и диапазонами по длине,
+    чтобы использовать частичный индекс idx_products_search
+    (db/migrations/001_search_indexes.sql).
+    """
+    sql = " WHERE warehouse_norm = %s AND quantity_free > 0"
+    params: List = [req.warehouse]
 
     # Фильтры по профилю
-    if parsed.profile:
-        sql += " AND UPPER(TRIM(profile)) = %s"
-        params.append(parsed.profile.upper())
+    if req.profile:
+        sql += " AND profile_norm = %s"
+        params.append(req.profile)
 
     # Фильтры по длине
-    if eff_length is not None:
-        if parsed.kind == "vbelt":
-            delta = eff_length * 0.015
+    if req.eff_length is not None:
+        if req.kind == "vbelt":
+            delta = req.eff_length * 0.015
             sql += " AND length BETWEEN %s AND %s"
-            params.extend([eff_length - delta, eff_length + delta])
+            params.extend([req.eff_length - delta, req.eff_length + delta])
         else:
-            sql += " AND ABS(length - %s) < 0.5"
-            params.append(eff_length)
+            # ABS(length - x) < 0.5 в виде диапазона
+            sql += " AND length > %s AND length < %s"
+            params.extend([req.eff_length - 0.5, req.eff_length + 0.5])
 
     # Фильтр по ширине (если задана)
-    if parsed.width_mm is not None:
+    if req.width_mm is not None:
         sql += " AND width = %s"
-        params.append(parsed.width_mm)
-
-    if parsed.kind == "vbelt" and eff_length is not None:
-        sql += (
-            " ORDER BY ABS(length - %s) NULLS LAST, "
-            " CASE "
-            "  WHEN UPPER(name) LIKE '%% FNR%%' THEN 1 "
-            "  WHEN UPPER(name) LIKE '%% PIX MUSCLE XS3%%' THEN 2 "
-            "  WHEN UPPER(name) LIKE '%% PIX XSET%%' THEN 3 "
-            "  WHEN UPPER(name) LIKE '%% MEGADYNE EXTRA%%' THEN 4 "
-            "  ELSE 5 END, "
-            " price_per_unit NULLS LAST, name"
-        )
-        params.append(eff_length)
-    else:
-        sql += (
-            " ORDER BY "
-            " CASE "
-            "  WHEN UPPER(name) LIKE '%% CFNR%%' THEN 1 "
-            "  WHEN UPPER(name) LIKE '%% CONTITECH%%' AND UPPER(name) NOT LIKE '%%CXP%%' THEN 2 "
-            "  WHEN UPPER(name) LIKE '%%CXP CONTITECH%%' THEN 3 "
-            "  WHEN UPPER(name) LIKE '%% MEGADYNE%%' THEN 4 "
-            "  ELSE 5 END, "
-            " price_per_unit NULLS LAST, name"
-        )
+        params.append(req.width_mm)
+    return sql, params
+
+
+def _order_clause(req: SearchRequest) -> Tuple[str, List]:
+    """Порядок выдачи (без ``ORDER BY``); последний ключ — id, порядок полный."""
+    # Приоритет брендов хранится в products.brand_rank (db/migrations/002_brand_ranks.sql)
+    if req.kind == "vbelt" and req.eff_length is not None:
+        return "ABS(length - %s) NULLS LAST, brand_rank, price_per_unit NULLS LAST, name, id", [req.eff_length]
+    return "brand_rank, price_per_unit NULLS LAST, name, id", []
+
+
+def build_search_sql(req: SearchRequest, *, limit: Optional[int] = None, offset: int = 0) -> Tuple[str, List]:
+    """SQL и параметры поиска."""
+    where, params = _where_clause(req)
+    order, order_params = _order_clause(req)
+    sql = f"SELECT {RESULT_COLUMNS} FROM products" + where + " ORDER BY " + order
+    params.extend(order_params)
+
+    if limit is not None:
+        sql += " LIMIT %s OFFSET %s"
+        params.extend([limit, offset])
+    return sql, params
+
+
+def _shape_name(req: SearchRequest) -> str:
+    """Имя формы запроса: есть ли профиль, какое окно по длине, есть ли ширина."""
+    length = "nolen" if req.eff_length is None else ("vbelt" if req.kind == "vbelt" else "sync")
+    return f"{'prof' if req.profile else 'any'}_{length}_{'width' if req.width_mm is not None else 'nowidth'}"
 
+
+def _register_statements() -> None:
+    """Поиск строит SQL склейкой условий, но форм всего несколько: профиль есть/нет,
+    окно по длине (нет / клиновой / синхронный), ширина есть/нет. Все они заранее
+    регистрируются как подготовленные запросы (prepared_statements.py)."""
+    for profile in (None, "P"):
+        for kind, eff_length in (("unknown", None), ("vbelt", 1.0), ("synchronous", 1.0)):
+            for width in (None, 1.0):
+                req = SearchRequest(kind=kind, profile=profile, eff_length=eff_length, width_mm=width, warehouse="W")
+                name = _shape_name(req)
+                prepared_statements.register(f"search_{name}", build_search_sql(req, limit=1)[0])
+                prepared_statements.register(f"count_{name}", "SELECT count(*) AS n FROM products" + _where_clause(req)[0])
+
+
+def _search_db(req: SearchRequest, offset: int, limit: int) -> SearchPage:
+    # Берём на одну строку больше, чтобы понять, есть ли следующая страница
+    sql, params = build_search_sql(req, limit=limit + 1, offset=offset)
+    # print(f"[SEARCH] SQL запрос: {sql}")
+    # print(f"[SEARCH] Параметры: {params}")
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            return rows
+            with span("sql_execute"):
+                prepared_statements.execute(cur, sql, params)
+            with span("sql_fetch"):
+                rows = cur.fetchall()
+            # print(f"[SEARCH] Найдено строк в БД: {len(rows)}")
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if has_more:
+                # Общее число считаем отдельным запросом только когда результат не влез в страницу
+                where, count_params = _where_clause(req)
+                with span("sql_count"):
+                    prepared_statements.execute(cur, "SELECT count(*) AS n FROM products" + where, count_params)
+                    total = cur.fetchone()["n"]
+            else:
+                total = offset + len(rows)
+    return SearchPage(rows=rows, offset=offset, limit=limit, total=total, has_more=has_more)
+
+
+def _search_uncached(req: SearchRequest, offset: int, limit: int) -> SearchPage:
+    if catalog.ready:
+        try:
+            with span("index_lookup"):
+                rows = catalog.lookup(kind=req.kind, profile=req.profile, eff_length=req.eff_length, width_mm=req.width_mm, warehouse=req.warehouse)
+            return SearchPage(rows=rows[offset:offset + limit], offset=offset, limit=limit, total=len(rows), has_more=len(rows) > offset + limit)
+        except Exception:
+            pass
+    return _search_db(req, offset, limit)
+
+
+def _cache_key(req: SearchRequest, offset: int, limit: int) -> Tuple:
+    # (склад, профиль) первыми — по ним search_cache инвалидирует записи
+    eff_length = round(req.eff_length, 3) if req.eff_length is not None else None
+    return (req.warehouse, req.profile, req.kind, eff_length, req.width_mm, offset, limit)
+
+
+def search(req: SearchRequest, *, offset: int = 0, limit: int = PAGE_SIZE) -> SearchPage:
+    """Ищет по in-memory индексу каталога, а если он не загружен — в БД.
+
+    Страницы результатов кэшируются до изменения товаров того же
+    склада и профиля (см. search_cache.py).
+    """
+    if not SEARCH_CACHE_ENABLED:
+        return _search_uncached(req, offset, limit)
+    key = _cache_key(req, offset, limit)
+    page = search_cache.get(key)
+    if page is not MISSING:
+        return page
+    epoch = search_cache.epoch()
+    page = _search_uncached(req, offset, limit)
+    search_cache.set(key, page, epoch)
+    return page
+
+
+# Обновление индекса каталога — те же (склад, профиль), что в ключах кэша
+catalog.subscribe(search_cache.invalidate)
+
+
+def search_products(query: str) -> List[Dict]:
+    return search(build_request(query)).rows
 
 
 def search_products_structured(*, kind: str, length_mm: Optional[float], profile: Optional[str], width_mm: Optional[float], original_text: str) -> List[Dict]:
     """Search using structured parameters (from AI).
     """
-    if profile and profile.upper() in EXCEPT_PREFIXES_STRUNINO:
-        warehouse = "Струнино"
-    elif kind == "synchronous":
-        warehouse = "Москва"
-    elif kind == "vbelt":
-        warehouse = "Струнино"
-    else:
-        warehouse = route_warehouse(original_text)
-    # print(f"[SEARCH] Параметры поиска: kind={kind}, length={length_mm}, profile={profile}, width={width_mm}, warehouse={warehouse}")
+    req = build_structured_request(kind=kind, length_mm=length_mm, profile=profile, width_mm=width_mm, original_text=original_text)
+    return search(req).rows
+
+
+_CODE_WORD = re.compile(r"\S+")
+
+
+def analogue_codes(text: str) -> List[str]:
+    """Коды для поиска по артикулу/аналогам: запрос целиком («B 85», «SPA-2000»)
+    и отдельные слова с буквами и цифрами («нужен XPA2000 2 шт»).
+    Список через запятую — это пакетный поиск (split_batch), здесь не разбирается."""
+    if _BATCH_SEPARATORS.search(text):
+        return []
+    codes: List[str] = []
+    whole = normalize_code(text)
+    if any(ch.isdigit() for ch in whole):
+        codes.append(whole)
+    words = _CODE_WORD.findall(text)
+    if len(words) > 1:
+        for word in words:
+            code = normalize_code(word.strip(".,;:!?()"))
+            if any(ch.isdigit() for ch in code) and any(ch.isalpha() for ch in code) and code not in codes:
+                codes.append(code)
+    return codes[:ANALOGUE_MAX_CODES]
+
+
+_CODES_WHERE = " WHERE codes_norm && %s::text[] AND quantity_free > 0"
+CODES_SQL = (
+    f"SELECT {RESULT_COLUMNS} FROM products" + _CODES_WHERE +
+    # Совпадение по собственному артикулу — выше совпадения по аналогу
+    " ORDER BY normalize_code(article) = ANY(%s::text[]) DESC, brand_rank, price_per_unit NULLS LAST, name, id"
+    " LIMIT %s OFFSET %s"
+)
+CODES_COUNT_SQL = "SELECT count(*) AS n FROM products" + _CODES_WHERE
+
+
+def build_codes_sql(codes: List[str], *, limit: int, offset: int = 0) -> Tuple[str, List]:
+    """SQL поиска по артикулу и аналогам: GIN-индекс idx_products_codes
+    (db/migrations/006_product_codes.sql)."""
+    return CODES_SQL, [codes, codes, limit, offset]
+
+
+def _codes_db(codes: List[str], offset: int, limit: int) -> SearchPage:
+    sql, params = build_codes_sql(codes, limit=limit + 1, offset=offset)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with span("sql_execute"):
+                prepared_statements.execute(cur, sql, params)
+            with span("sql_fetch"):
+                rows = cur.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if has_more:
+                with span("sql_count"):
+                    prepared_statements.execute(cur, CODES_COUNT_SQL, [codes])
+                    total = cur.fetchone()["n"]
+            else:
+                total = offset + len(rows)
+    return SearchPage(rows=rows, offset=offset, limit=limit, total=total, has_more=has_more)
+
+
+def search_analogues(codes: List[str], *, offset: int = 0, limit: int = PAGE_SIZE) -> SearchPage:
+    """Товары в наличии, у которых артикул или аналог совпадает с одним из кодов
+    (``analogue_codes``), страницами по ``limit``.
+
+    Покрывает коды других производителей, которые не разбираются на профиль
+    и длину. Пустая страница — известного кода в запросе нет.
+    """
+    if not codes:
+        return SearchPage(rows=[], offset=offset, limit=limit, total=0, has_more=False)
+    if catalog.ready:
+        try:
+            rows = catalog.lookup_codes(codes)
+            return SearchPage(rows=rows[offset:offset + limit], offset=offset, limit=limit, total=len(rows), has_more=len(rows) > offset + limit)
+        except Exception:
+            pass
+    return _codes_db(codes, offset, limit)
 
-    INCH_PROFILES = {"A", "B", "C", "D", "E"}
-    eff_length = length_mm
-    if kind == "vbelt" and (profile or "").upper() in INCH_PROFILES and eff_length is not None:
-        eff_length = eff_length * 25.4
-        # print(f"[SEARCH] Конвертация дюймов в мм: {length_mm} -> {eff_length}")
 
-    sql = "SELECT * FROM products WHERE TRIM(warehouse) = %s AND quantity_free > 0"
-    params: List = [warehouse]
+async def search_analogues_async(codes: List[str], *, offset: int = 0, limit: int = PAGE_SIZE) -> SearchPage:
+    key = ("analogue", tuple(codes), offset, limit)
+    return await _flight.run(key, lambda: run_db(search_analogues, codes, offset=offset, limit=limit))
 
-    if profile:
-        sql += " AND UPPER(TRIM(profile)) = %s"
-        params.append(profile.upper())
 
-    if eff_length is not None:
-        if kind == "vbelt":
-            delta = eff_length * 0.015
-            sql += " AND length BETWEEN %s AND %s"
-            params.extend([eff_length - delta, eff_length + delta])
-        else:
-            sql += " AND ABS(length - %s) < 0.5"
-            params.append(eff_length)
+FUZZY_SQL = (
+    f"SELECT {RESULT_COLUMNS}, GREATEST(similarity(article, %s), word_similarity(%s, name)) AS score"
+    " FROM products"
+    " WHERE quantity_free > 0 AND (article %% %s OR %s <%% name)"
+    " ORDER BY score DESC, brand_rank, price_per_unit NULLS LAST, name, id"
+    " LIMIT %s"
+)
 
-    if width_mm is not None:
-        sql += " AND width = %s"
-        params.append(width_mm)
-
-    # Reuse same ordering rules as above
-    if kind == "vbelt" and eff_length is not None:
-        sql += (
-            " ORDER BY ABS(length - %s) NULLS LAST, "
-            " CASE "
-            "  WHEN UPPER(name) LIKE '%% FNR%%' THEN 1 "
-            "  WHEN UPPER(name) LIKE '%% PIX MUSCLE XS3%%' THEN 2 "
-            "  WHEN UPPER(name) LIKE '%% PIX XSET%%' THEN 3 "
-            "  WHEN UPPER(name) LIKE '%% MEGADYNE EXTRA%%' THEN 4 "
-            "  ELSE 5 END, "
-            " price_per_unit NULLS LAST, name"
-        )
-        params.append(eff_length)
-    else:
-        sql += (
-            " ORDER BY "
-            " CASE "
-            "  WHEN UPPER(name) LIKE '%% CFNR%%' THEN 1 "
-            "  WHEN UPPER(name) LIKE '%% CONTITECH%%' AND UPPER(name) NOT LIKE '%%CXP%%' THEN 2 "
-            "  WHEN UPPER(name) LIKE '%%CXP CONTITECH%%' THEN 3 "
-            "  WHEN UPPER(name) LIKE '%% MEGADYNE%%' THEN 4 "
-            "  ELSE 5 END, "
-            " price_per_unit NULLS LAST, name"
-        )
 
-    # print(f"[SEARCH] SQL запрос: {sql}")
-    # print(f"[SEARCH] Параметры: {params}")
+def build_fuzzy_sql(text: str, *, limit: int) -> Optional[Tuple[str, List]]:
+    """SQL нечёткого поиска по артикулу (similarity) и названию (word_similarity)
+    через триграммные индексы (db/migrations/007_trigram_search.sql).
+
+    Пороги задаются отдельно: ``FUZZY_SETTINGS_SQL`` в той же транзакции.
+    ``None`` — запрос слишком короткий для поиска по триграммам.
+    """
+    code = normalize_code(text)
+    if len(code) < FUZZY_MIN_LENGTH:
+        return None
+    return FUZZY_SQL, [code, text, code, text, limit]
+
+
+# Пороги pg_trgm только для текущей транзакции
+FUZZY_SETTINGS_SQL = (
+    "SELECT set_config('pg_trgm.similarity_threshold', %s, true),"
+    " set_config('pg_trgm.word_similarity_threshold', %s, true)"
+)
+
+
+def search_fuzzy(text: str, *, limit: int = FUZZY_LIMIT) -> List[Dict]:
+    """Товары в наличии с артикулом или названием, похожим на запрос
+    (опечатки: «SPA20000», «800M8», «CONTITEH»). Лучшие совпадения первыми."""
+    if not FUZZY_SEARCH_ENABLED or limit <= 0:
+        return []
+    built = build_fuzzy_sql(text, limit=limit)
+    if built is None:
+        return []
+    sql, params = built
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(FUZZY_SETTINGS_SQL, (str(FUZZY_ARTICLE_THRESHOLD), str(FUZZY_NAME_THRESHOLD)))
+                with span("sql_execute"):
+                    prepared_statements.execute(cur, sql, params)
+                with span("sql_fetch"):
+                    return cur.fetchall()
+    except Exception:
+        # Нет pg_trgm (миграция 007 не применена) или БД недоступна — запрос уйдёт к ИИ
+        return []
+
+
+async def search_fuzzy_async(text: str, *, limit: int = FUZZY_LIMIT) -> List[Dict]:
+    key = ("fuzzy", " ".join(text.lower().split()), limit)
+    return await _flight.run(key, lambda: run_db(search_fuzzy, text, limit=limit))
+
+
+# Один запрос: по limit ближайших строк не короче и короче заданной длины.
+# Каждая ветка — упорядоченный проход по idx_products_search с LIMIT
+_NEAREST_BASE = (
+    f"SELECT {RESULT_COLUMNS}, brand_rank FROM products"
+    " WHERE warehouse_norm = %s AND quantity_free > 0 AND profile_norm = %s"
+)
+NEAREST_SQL = (
+    f"SELECT {RESULT_COLUMNS} FROM ("
+    f"({_NEAREST_BASE} AND length >= %s ORDER BY length LIMIT %s)"
+    " UNION ALL "
+    f"({_NEAREST_BASE} AND length < %s ORDER BY length DESC LIMIT %s)"
+    ") s ORDER BY ABS(length - %s), ABS(width - %s) NULLS LAST, brand_rank, price_per_unit NULLS LAST, name, id"
+    " LIMIT %s"
+)
+
+
+def _nearest_db(req: SearchRequest, limit: int) -> List[Dict]:
+    params = [
+        req.warehouse, req.profile, req.eff_length, limit,
+        req.warehouse, req.profile, req.eff_length, limit,
+        req.eff_length, req.width_mm, limit,
+    ]
     with get_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute(sql, params)
-            rows = cur.fetchall()
-            # print(f"[SEARCH] Найдено строк в БД: {len(rows)}")
+            with span("sql_execute"):
+                prepared_statements.execute(cur, NEAREST_SQL, params)
+            with span("sql_fetch"):
+                return cur.fetchall()
+
+
+def search_nearest(req: SearchRequest, *, limit: int = NEAREST_LIMIT) -> List[Dict]:
+    """Ближайшие по длине товары того же склада и профиля — когда точный поиск
+    ничего не нашёл. Без профиля или длины возвращает пустой список."""
+    if not req.profile or req.eff_length is None or limit <= 0:
+        return []
+    key = (req.warehouse, req.profile, "nearest", round(req.eff_length, 3), req.width_mm, limit)
+    if SEARCH_CACHE_ENABLED:
+        rows = search_cache.get(key)
+        if rows is not MISSING:
             return rows
+    epoch = search_cache.epoch()
+    rows = None
+    if catalog.ready:
+        try:
+            rows = catalog.nearest(profile=req.profile, eff_length=req.eff_length, width_mm=req.width_mm, warehouse=req.warehouse, limit=limit)
+        except Exception:
+            rows = None
+    if rows is None:
+        rows = _nearest_db(req, limit)
+    if SEARCH_CACHE_ENABLED:
+        search_cache.set(key, rows, epoch)
+    return rows
+
+
+async def search_nearest_async(req: SearchRequest, *, limit: int = NEAREST_LIMIT) -> List[Dict]:
+    key = ("nearest",) + _cache_key(req, 0, limit)
+    return await _flight.run(key, lambda: run_db(search_nearest, req, limit=limit))
+
+
+async def search_async(req: SearchRequest, *, offset: int = 0, limit: int = PAGE_SIZE) -> SearchPage:
+    """Неблокирующий вариант ``search`` для async-обработчиков.
+
+    Одинаковые одновременные запросы (один артикул от многих клиентов)
+    выполняются один раз.
+    """
+    key = ("search",) + _cache_key(req, offset, limit)
+    return await _flight.run(key, lambda: run_db(search, req, offset=offset, limit=limit))
+
+
+async def search_products_async(query: str) -> List[Dict]:
+    """Неблокирующий вариант ``search_products`` для async-обработчиков."""
+    return await run_db(search_products, query)
+
+
+async def search_products_structured_async(**kwargs) -> List[Dict]:
+    """Неблокирующий вариант ``search_products_structured`` для async-обработчиков."""
+    return await run_db(search_products_structured, **kwargs)
+
+
+BATCH_MAX_ITEMS = 30
+BATCH_ITEM_LIMIT = 5
+
+_BATCH_SEPARATORS = re.compile(r"[,;\n]+")
+_WIDTH_SPACES = re.compile(r"\s*=\s*")
+
+
+def _is_batch_token(token: str) -> bool:
+    parsed = parse_query(token)
+    return (
+        parsed.kind != "unknown"
+        and bool(parsed.profile) and not parsed.profile.isdigit()
+        and parsed.length_mm is not None
+    )
+
+
+def split_batch(text: str) -> Tuple[List[str], List[str]]:
+    """Разбивает список артикулов («8008M, SPA2000, B 85, 177814M=55 ...») на части.
+
+    Возвращает (артикулы, распознанные локально; фрагменты с кодами из букв и
+    цифр, которые разобрать не удалось). Количества («2 шт», «x3») убираются до
+    разбора и к кодам не приклеиваются; фрагменты без таких кодов («ремень»,
+    «нужно 2») отбрасываются.
+    """
+    tokens: List[str] = []
+    leftovers: List[str] = []
+    for chunk in _BATCH_SEPARATORS.split(text):
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        chunk = _WIDTH_SPACES.sub("=", strip_quantities(chunk))
+        words = chunk.split()
+        if not words:
+            continue
+        found: List[str] = []
+        rest: List[str] = []
+        i = 0
+        while i < len(words):
+            word = words[i].upper()
+            if _is_batch_token(word):
+                found.append(word)
+                i += 1
+                continue
+            # «SPA 2000», «B 85»: профиль буквами и длина числом через пробел.
+            # «8M 800» не склеивается — это профиль и длина, а не код 8M800
+            if i + 1 < len(words) and word.isalpha() and words[i + 1].isdigit() and _is_batch_token(word + words[i + 1]):
+                found.append(word + words[i + 1])
+                i += 2
+                continue
+            rest.append(words[i])
+            i += 1
+        if not found and (words[0].isalpha() or words[-1].isalpha()):
+            # Пробелы внутри кода: «177814 M», «SPA 20 00»
+            compact = "".join(words).upper()
+            if _is_batch_token(compact):
+                tokens.append(compact)
+                continue
+        tokens.extend(found)
+        # Остаток без кода из букв и цифр («нужно 2», «- 5») — не артикул
+        if any(_is_code_like(w) for w in rest):
+            leftovers.append(" ".join(rest))
+    return tokens, leftovers
+
+
+def _is_code_like(word: str) -> bool:
+    return any(ch.isdigit() for ch in word) and any(ch.isalpha() for ch in word)
+
+
+def is_batch(text: str, tokens: List[str], leftovers: List[str]) -> bool:
+    """Список артикулов: два и больше распознанных кода или явный разделитель
+    («,», «;», перевод строки) между двумя и больше фрагментами."""
+    if len(tokens) >= 2:
+        return True
+    return bool(_BATCH_SEPARATORS.search(text)) and len(tokens) + len(leftovers) >= 2
+
+
+def _search_batch_db(reqs: List[SearchRequest], limit: int) -> List[List[Dict]]:
+    # Один запрос: подзапросы по каждому артикулу через UNION ALL.
+    # У каждого свой sargable-набор условий, поэтому все используют индекс поиска.
+    parts = []
+    params: List = []
+    for i, req in enumerate(reqs):
+        # Номер строки — по тем же ключам, что ORDER BY: порядок подзапроса во
+        # внешнем запросе PostgreSQL не гарантирует
+        where, where_params = _where_clause(req)
+        order, order_params = _order_clause(req)
+        parts.append(
+            f"(SELECT %s AS batch_item, row_number() OVER (ORDER BY {order}) AS batch_pos, {RESULT_COLUMNS}"
+            f" FROM products{where} ORDER BY {order} LIMIT %s)"
+        )
+        params.append(i)
+        params.extend(order_params)
+        params.extend(where_params)
+        params.extend(order_params)
+        params.append(limit)
+    results: List[List[Dict]] = [[] for _ in reqs]
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            with span("sql_execute"):
+                cur.execute(" UNION ALL ".join(parts) + " ORDER BY batch_item, batch_pos", params)
+            with span("sql_fetch"):
+                fetched = cur.fetchall()
+            for row in fetched:
+                row = dict(row)
+                row.pop("batch_pos")
+                results[row.pop("batch_item")].append(row)
+    return results
+
+
+def search_batch(reqs: List[SearchRequest], *, limit: int = BATCH_ITEM_LIMIT) -> List[List[Dict]]:
+    """Ищет несколько артикулов за один проход: по индексу каталога или одним SQL."""
+    if not reqs:
+        return []
+    if catalog.ready:
+        try:
+            return [
+                catalog.lookup(kind=r.kind, profile=r.profile, eff_length=r.eff_length, width_mm=r.width_mm, warehouse=r.warehouse)[:limit]
+                for r in reqs
+            ]
+        except Exception:
+            pass
+    return _search_batch_db(reqs, limit)
+
+
+async def search_batch_async(reqs: List[SearchRequest], *, limit: int = BATCH_ITEM_LIMIT) -> List[List[Dict]]:
+    return await run_db(search_batch, reqs, limit=limit)
 
 
 def format_search_results(rows: List[Dict]) -> str:
@@ -228,7 +600,7 @@ def format_search_results(rows: List[Dict]) -> str:
         return "Ничего не найдено по заданным критериям."
 
     lines = []
-    for r in rows[:20]: 
+    for r in rows[:PAGE_SIZE]:
         name = r.get("name")
         length = r.get("length")
         profile = r.get("profile")
@@ -246,3 +618,33 @@ def format_search_results(rows: List[Dict]) -> str:
     return "\n".join(lines)
 
 
+def format_search_page(page: SearchPage) -> str:
+    text = format_search_results(page.rows)
+    if page.rows and (page.has_more or page.offset):
+        text += f"\n\nПоказаны {page.offset + 1}–{page.offset + len(page.rows)} из {page.total}"
+    return text
+
+
+def format_batch_results(labels: List[str], results: List[Optional[List[Dict]]]) -> str:
+    """Сгруппированный ответ на список артикулов; ``None`` — артикул не распознан."""
+    blocks = []
+    for label, rows in zip(labels, results):
+        if rows is None:
+            blocks.append(f"🔹 {label} — не удалось распознать")
+        elif not rows:
+            blocks.append(f"🔹 {label} — ничего не найдено")
+        else:
+            blocks.append(f"🔹 {label}\n" + format_search_results(rows))
+    text = "\n\n".join(blocks)
+    # Ограничение Telegram на длину сообщения — 4096 символов
+    if len(text) > 4000:
+        text = text[:4000].rsplit("\n", 1)[0] + "\n…"
+    return text
+
+
+# Все формы поисковых запросов — в реестр подготовленных запросов
+_register_statements()
+prepared_statements.register("search_nearest", NEAREST_SQL)
+prepared_statements.register("search_codes", CODES_SQL)
+prepared_statements.register("count_codes", CODES_COUNT_SQL)
+prepared_statements.register("search_fuzzy", FUZZY_SQL)
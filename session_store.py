@@ -0,0 +1,206 @@
+import os
+import asyncio
+import threading
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Set
+from db_connection import get_connection, run_db
+
+
+FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "2"))
+FLUSH_BATCH = int(os.getenv("SESSION_FLUSH_BATCH", "1000"))
+
+
+class Session:
+    """Состояние клиента: верификация, шаг диалога и номер телефона."""
+
+    __slots__ = ("telegram_id", "phone", "verified", "state", "verification_date")
+
+    def __init__(
+        self,
+        telegram_id: int,
+        *,
+        phone: Optional[str] = None,
+        verified: bool = False,
+        state: Optional[int] = None,
+        verification_date: Optional[datetime] = None,
+    ) -> None:
+        self.telegram_id = telegram_id
+        self.phone = phone
+        self.verified = verified
+        self.state = state
+        self.verification_date = verification_date
+
+    def copy(self) -> "Session":
+        return Session(
+            self.telegram_id,
+            phone=self.phone,
+            verified=self.verified,
+            state=self.state,
+            verification_date=self.verification_date,
+        )
+
+
+class SessionStore:
+    """Сессии клиентов в памяти с отложенной записью в БД (write-behind).
+
+    Чтение — поиск в словаре по ``telegram_id``, без обращения к БД.
+    Изменения помечают сессию «грязной»; ``flush()`` пишет все накопленные
+    изменения пачкой, несколько изменений одной сессии сливаются в одну запись.
+    """
+
+    def __init__(self) -> None:
+        self._sessions: Dict[int, Session] = {}
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()
+        self.loaded = False
+        self._flushes = 0
+        self._rows_written = 0
+        self._failures = 0
+
+    def load(self) -> None:
+        """Загружает все сессии и верифицированных пользователей при старте."""
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT COALESCE(s.telegram_id, u.telegram_id) AS telegram_id, s.state, "
+                    "COALESCE(u.phone_number, s.phone_number) AS phone, "
+                    "COALESCE(u.is_verified, FALSE) AS verified, u.verification_date "
+                    "FROM user_sessions s FULL JOIN users u ON u.telegram_id = s.telegram_id"
+                )
+                rows = cur.fetchall()
+        with self._lock:
+            for row in rows:
+                telegram_id = row["telegram_id"]
+                # Сессии, изменённые до загрузки (БД была недоступна при старте), новее
+                if telegram_id in self._dirty:
+                    continue
+                self._sessions[telegram_id] = Session(
+                    telegram_id,
+                    phone=row["phone"],
+                    verified=bool(row["verified"]),
+                    state=row["state"],
+                    verification_date=row["verification_date"],
+                )
+            self.loaded = True
+
+    def get(self, telegram_id: int) -> Optional[Session]:
+        return self._sessions.get(telegram_id)
+
+    def update(self, telegram_id: int, *, phone: Optional[str], verified: bool, state: Optional[int]) -> None:
+        """Записывает состояние клиента; неизменившиеся сессии не попадают в БД."""
+        with self._lock:
+            session = self._sessions.get(telegram_id)
+            if session is None:
+                if not (phone or verified or state is not None):
+                    return
+                session = self._sessions[telegram_id] = Session(telegram_id)
+            elif session.phone == phone and session.verified == verified and session.state == state:
+                return
+            if verified and not session.verified:
+                session.verification_date = datetime.now()
+            session.phone = phone
+            session.verified = verified
+            session.state = state
+            self._dirty.add(telegram_id)
+
+    def flush(self) -> int:
+        """Пишет накопленные изменения в БД, возвращает число записанных сессий."""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            pending = [self._sessions[t].copy() for t in self._dirty]
+            self._dirty.clear()
+        try:
+            for start in range(0, len(pending), FLUSH_BATCH):
+                _write(pending[start:start + FLUSH_BATCH])
+        except Exception:
+            with self._lock:
+                self._failures += 1
+                # Повторим при следующем сбросе
+                self._dirty.update(s.telegram_id for s in pending)
+            raise
+        with self._lock:
+            self._flushes += 1
+            self._rows_written += len(pending)
+        return len(pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "dirty": len(self._dirty),
+                "flushes": self._flushes,
+                "rows_written": self._rows_written,
+                "flush_failures": self._failures,
+            }
+
+
+def _write(batch: List[Session]) -> None:
+    verified: Dict[str, Session] = {}
+    for s in batch:
+        if s.verified and s.phone:
+            # Номер уникален в users: при повторе в пачке побеждает последняя верификация
+            current = verified.get(s.phone)
+            if current is None or (s.verification_date or datetime.min) >= (current.verification_date or datetime.min):
+                verified[s.phone] = s
+    revoked = [s.telegram_id for s in batch if not s.verified]
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO user_sessions (telegram_id, state, phone_number) "
+                "SELECT * FROM unnest(%s::bigint[], %s::smallint[], %s::varchar[]) "
+                "ON CONFLICT (telegram_id) DO UPDATE SET state = EXCLUDED.state, "
+                "phone_number = EXCLUDED.phone_number, updated_at = CURRENT_TIMESTAMP",
+                (
+                    [s.telegram_id for s in batch],
+                    [s.state for s in batch],
+                    [s.phone for s in batch],
+                ),
+            )
+            if verified:
+                rows = list(verified.values())
+                params = (
+                    [s.telegram_id for s in rows],
+                    [s.phone for s in rows],
+                    [s.verification_date for s in rows],
+                )
+                # Номер, подтверждённый новым аккаунтом Telegram, переходит к нему
+                cur.execute(
+                    "DELETE FROM users u USING unnest(%s::bigint[], %s::varchar[]) AS i(telegram_id, phone_number) "
+                    "WHERE u.phone_number = i.phone_number AND u.telegram_id <> i.telegram_id",
+                    params[:2],
+                )
+                cur.execute(
+                    "INSERT INTO users (telegram_id, phone_number, is_verified, verification_date) "
+                    "SELECT t, p, TRUE, d FROM unnest(%s::bigint[], %s::varchar[], %s::timestamp[]) AS i(t, p, d) "
+                    "ON CONFLICT (telegram_id) DO UPDATE SET phone_number = EXCLUDED.phone_number, "
+                    "is_verified = TRUE, verification_date = EXCLUDED.verification_date",
+                    params,
+                )
+            if revoked:
+                cur.execute(
+                    "UPDATE users SET is_verified = FALSE WHERE telegram_id = ANY(%s) AND is_verified",
+                    (revoked,),
+                )
+
+
+sessions = SessionStore()
+
+
+def warm_up() -> None:
+    """Загружает сессии при старте бота."""
+    sessions.load()
+
+
+async def flush_loop() -> None:
+    """Фоновая запись изменённых сессий; до успешной загрузки пробует загрузить их снова."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            if not sessions.loaded:
+                await run_db(sessions.load)
+            await run_db(sessions.flush)
+        except Exception:
+            # БД временно недоступна — изменения останутся в памяти до следующей попытки
+            pass
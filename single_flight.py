@@ -0,0 +1,51 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+
+class SingleFlight:
+    """Объединяет одинаковые одновременные вызовы: пока запрос с ключом ``key``
+    выполняется, остальные вызовы с тем же ключом ждут его результат.
+
+    Отмена одного из ожидающих не отменяет общий запрос.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._inflight: Dict[Hashable, "asyncio.Future"] = {}
+        self.calls = 0
+        self.shared = 0
+        _flights.append(self)
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: "asyncio.Future") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Исключение получат ожидающие; если их не осталось — не шумим в лог
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "inflight": len(self._inflight),
+            "shared_rate": round(self.shared / self.calls, 4) if self.calls else 0.0,
+        }
+
+
+_flights: List[SingleFlight] = []
+
+
+def flight_stats() -> Dict[str, Any]:
+    """Счётчики всех SingleFlight по имени: вызовы, объединённые вызовы, в полёте."""
+    return {flight.name: flight.stats() for flight in _flights}
@@ -0,0 +1,103 @@
+"""Замер времени запуска бота: фазы до приёма апдейтов, фоновый прогрев и первый ответ.
+
+Отсчёт идёт от импорта этого модуля — bot.py импортирует его первым, так что
+сюда не попадает только запуск самого интерпретатора.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+STARTED = time.perf_counter()
+
+# Целевое время от запуска до готовности принимать апдейты и до первого ответа, сек
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", "3"))
+
+_lock = threading.Lock()
+_last = STARTED
+# Последовательные фазы запуска: фаза -> длительность, сек (в порядке отметок)
+_phases: Dict[str, float] = {}
+# Шаги прогрева (в фоне или до приёма апдейтов): шаг -> длительность, сек
+_warm: Dict[str, float] = {}
+# Шаги прогрева, завершившиеся ошибкой: шаг -> "Тип: сообщение"
+_errors: Dict[str, str] = {}
+_ready: Optional[float] = None
+_first_reply: Optional[float] = None
+
+
+def mark(phase: str) -> None:
+    """Фаза закончилась; её длительность — от предыдущей отметки."""
+    global _last
+    now = time.perf_counter()
+    with _lock:
+        _phases[phase] = now - _last
+        _last = now
+
+
+def ready() -> None:
+    """Бот начинает принимать апдейты."""
+    global _ready
+    mark("post_init")
+    _ready = _last - STARTED
+    print(report())
+
+
+@contextmanager
+def timed(step: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _warm[step] = time.perf_counter() - started
+
+
+def failed(step: str, error: BaseException) -> None:
+    """Шаг прогрева не удался — ошибка попадает в отчёт и startup_stats."""
+    with _lock:
+        _errors[step] = f"{type(error).__name__}: {error}"
+
+
+def first_reply() -> None:
+    """Обработан первый апдейт. Дальше — одно сравнение на апдейт."""
+    global _first_reply
+    if _first_reply is not None:
+        return
+    _first_reply = time.perf_counter() - STARTED
+    print(report())
+
+
+def _fmt(values: Dict[str, float]) -> str:
+    return ", ".join(f"{name} {seconds:.3f} с" for name, seconds in values.items())
+
+
+def report() -> str:
+    """Строка для лога: фазы запуска, прогрев, время до готовности и первого ответа."""
+    with _lock:
+        phases = dict(_phases)
+        warm = dict(_warm)
+        errors = dict(_errors)
+    parts = [f"Запуск: {_fmt(phases)}"]
+    if warm:
+        parts.append(f"прогрев: {_fmt(warm)}")
+    if errors:
+        parts.append("ошибки прогрева: " + ", ".join(f"{step} — {error}" for step, error in errors.items()))
+    if _ready is not None:
+        parts.append(f"готов через {_ready:.3f} с")
+    if _first_reply is not None:
+        verdict = "в пределах" if _first_reply <= STARTUP_BUDGET else "ПРЕВЫШЕН"
+        parts.append(f"первый ответ через {_first_reply:.3f} с (бюджет {STARTUP_BUDGET:g} с — {verdict})")
+    elif _ready is not None and _ready > STARTUP_BUDGET:
+        parts.append(f"бюджет {STARTUP_BUDGET:g} с ПРЕВЫШЕН")
+    return "; ".join(parts)
+
+
+def startup_stats() -> Dict[str, Any]:
+    with _lock:
+        stats: Dict[str, Any] = {"phases": dict(_phases), "warm": dict(_warm), "warm_failed": {step: 1 for step in _errors}}
+    stats["ready_seconds"] = _ready if _ready is not None else 0.0
+    stats["first_reply_seconds"] = _first_reply if _first_reply is not None else 0.0
+    stats["budget_seconds"] = STARTUP_BUDGET
+    stats["within_budget"] = _first_reply is not None and _first_reply <= STARTUP_BUDGET
+    return stats
@@ -0,0 +1,72 @@
+import sys
+import asyncio
+from typing import Awaitable, Dict, Hashable, Optional
+from telegram.ext import BaseUpdateProcessor  # pyright: ignore[reportMissingImports]
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает апдейты разных чатов параллельно, а одного чата — по очереди.
+
+    Так медленный поиск одного клиента не задерживает остальных, а сообщения
+    одного клиента не обгоняют друг друга и не гоняются за ``user_data``.
+
+    Слот из ``max_concurrent_updates`` берётся уже после блокировки чата: апдейты,
+    которые ждут своей очереди в чате, слотов не занимают, и чат, присылающий
+    сообщения пачкой, не может занять их все.
+    """
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates должно быть положительным")
+        # Базовый класс создаёт семафор на max_concurrent_updates и берёт его в
+        # process_update ещё до блокировки чата — пусть он не ограничивает; лимит — self._slots
+        self._limit = sys.maxsize
+        super().__init__(max_concurrent_updates)
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._running = 0
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._users: Dict[Hashable, int] = {}
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._limit
+
+    @property
+    def current_concurrent_updates(self) -> int:
+        return self._running
+
+    async def _run(self, coroutine: Awaitable) -> None:
+        async with self._slots:
+            self._running += 1
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[Hashable]:
+        chat = getattr(update, "effective_chat", None)
+        return chat.id if chat is not None else None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                await self._run(coroutine)
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,101 @@
+import json
+import hmac
+from typing import Optional, List
+from telegram import Update  # pyright: ignore[reportMissingImports]
+from telegram.ext import Application  # pyright: ignore[reportMissingImports]
+
+
+class WebhookApp:
+    """Минимальное ASGI-приложение, принимающее апдейты Telegram.
+
+    POST ``path`` — апдейт в очередь ``application.update_queue``;
+    GET ``/healthz`` — проверка живости для балансировщика.
+    """
+
+    def __init__(self, application: Application, *, path: str, secret_token: Optional[str]) -> None:
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return
+        if scope["path"] == "/healthz":
+            await self._respond(send, 200, b"ok")
+            return
+        if scope["path"] != self.path:
+            await self._respond(send, 404, b"not found")
+            return
+        if scope["method"] != "POST":
+            await self._respond(send, 405, b"method not allowed")
+            return
+        if self.secret_token:
+            headers = dict(scope.get("headers") or [])
+            received = headers.get(b"x-telegram-bot-api-secret-token", b"")
+            if not hmac.compare_digest(received, self.secret_token.encode()):
+                await self._respond(send, 403, b"forbidden")
+                return
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except Exception:
+            await self._respond(send, 400, b"bad request")
+            return
+        await self.application.update_queue.put(update)
+        await self._respond(send, 200, b"ok")
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+async def run_webhook(
+    application: Application,
+    *,
+    url: str,
+    listen: str,
+    port: int,
+    path: str,
+    secret_token: Optional[str],
+    allowed_updates: List[str],
+) -> None:
+    """Запускает бота в режиме webhook за ASGI-сервером uvicorn.
+
+    ``post_init``/``post_shutdown`` приложения вызываются здесь, так как
+    ``run_polling``/``run_webhook`` библиотеки не используются.
+    """
+    import uvicorn  # pyright: ignore[reportMissingImports]
+
+    server = uvicorn.Server(uvicorn.Config(
+        WebhookApp(application, path=path, secret_token=secret_token),
+        host=listen,
+        port=port,
+        lifespan="off",
+        log_level="warning",
+    ))
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.bot.set_webhook(
+            url=url.rstrip("/") + path,
+            allowed_updates=allowed_updates,
+            secret_token=secret_token,
+        )
+        await application.start()
+        try:
+            await server.serve()
+        finally:
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)